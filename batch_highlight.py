@@ -0,0 +1,132 @@
+"""
+Highlight whole PDFs from the command line, without a display.
+
+Every line of every page is highlighted and the result is written next to
+the input's path relative to the common input folder, as
+<output>/<relative folder>/<name>_highlighted.pdf. Files are processed in
+parallel, one document per worker process.
+
+    python batch_highlight.py course_pack/ "readings/*.pdf" -o highlighted -j 4
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pdf_reader import PDFReader
+from sentence_index import LINE
+
+OUTPUT_SUFFIX = "_highlighted.pdf"
+
+
+def find_pdfs(inputs):
+    """
+    Expand files, directories and glob patterns into PDF paths
+
+    :param inputs: Paths or glob patterns from the command line
+    :return: Sorted list of unique PDF paths
+    """
+    found = set()
+    for pattern in inputs:
+        for path in glob.glob(pattern, recursive=True) or [pattern]:
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    found.update(os.path.join(dirpath, name) for name in filenames
+                                 if name.lower().endswith(".pdf"))
+            elif os.path.isfile(path) and path.lower().endswith(".pdf"):
+                found.add(path)
+    return sorted(os.path.abspath(path) for path in found)
+
+
+def output_paths(pdf_paths, output_dir):
+    """
+    Map each input to its output path, mirroring the folders below the
+    inputs' common folder
+
+    :param pdf_paths: Absolute input paths
+    :param output_dir: Folder to write the highlighted PDFs to
+    :return: Dict of input path -> output path
+    """
+    root = os.path.commonpath([os.path.dirname(path) for path in pdf_paths])
+    outputs = {}
+    for path in pdf_paths:
+        relative = os.path.relpath(path, root)
+        outputs[path] = os.path.join(output_dir, os.path.splitext(relative)[0] + OUTPUT_SUFFIX)
+    return outputs
+
+
+def highlight_file(pdf_path, output_path):
+    """
+    Highlight every line of a PDF and save it (runs in a worker process)
+
+    :param pdf_path: PDF to highlight
+    :param output_path: Where to save the highlighted PDF
+    :return: Tuple of (pages, lines highlighted, seconds taken)
+    """
+    start = time.perf_counter()
+    reader = PDFReader(pdf_path, unit=LINE)  # Every line, whatever READER_UNIT says
+    try:
+        while reader.next_sentences(100):
+            pass
+        lines = len(reader.pending_annotations)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        reader.save_pdf(output_path)
+        return len(reader.doc), lines, time.perf_counter() - start
+    finally:
+        reader.close()
+
+
+def positive_int(value):
+    """
+    Parse a command line count of at least 1
+
+    :param value: Argument text
+    :return: The count
+    :raises argparse.ArgumentTypeError: If it is not a positive integer
+    """
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {count}")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Highlight every line of PDFs without a display.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="Folder for the highlighted PDFs")
+    parser.add_argument("-j", "--jobs", type=positive_int, default=os.cpu_count(),
+                        help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    pdf_paths = find_pdfs(args.inputs)
+    if not pdf_paths:
+        print("No PDF files found.")
+        return 1
+    outputs = output_paths(pdf_paths, args.output)
+
+    failures = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(highlight_file, path, outputs[path]): path for path in pdf_paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                pages, lines, seconds = future.result()
+                print(f"[{done}/{len(pdf_paths)}] {path} -> {outputs[path]} "
+                      f"({pages} pages, {lines} lines, {seconds:.2f}s)")
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(pdf_paths)}] {path} failed: {str(e)}")
+
+    print(f"Highlighted {len(pdf_paths) - failures} of {len(pdf_paths)} files "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Compare the bytes copied per frame between the old pixmap-to-display paths
+and the render_adapter ones.
+
+Run from the repository root:
+
+    python -m benchmarks.render_copies [pdf ...]
+
+The Qt columns are skipped when PyQt5 is not installed. Converting to a Tk
+PhotoImage (or uploading a QPixmap) costs one more copy in both paths, so it
+is left out of the counts.
+"""
+import glob
+import io
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from render_adapter import pixmap_to_image, pixmap_to_qimage
+
+REPEATS = 20
+
+
+def pil_storage_bytes(img):
+    """
+    Size of a PIL image's pixel storage, which is what decoding or
+    unpacking into it writes
+
+    :return: Bytes; PIL keeps each pixel of a multiband image in 4 bytes,
+             so an RGB image is not width * height * 3
+    """
+    return img.width * img.height * (4 if len(img.getbands()) > 1 else 1)
+
+
+def legacy_pil(pix):
+    """
+    Old highlight_final path: encode to PPM, wrap in BytesIO, decode with PIL
+
+    :return: Tuple of (PIL Image, bytes copied)
+    """
+    img_data = pix.tobytes("ppm")
+    img = Image.open(io.BytesIO(img_data))
+    img.load()
+    # The PPM encode and the PIL decode each copy the frame
+    return img, len(img_data) + pil_storage_bytes(img)
+
+
+def adapter_pil(pix):
+    """
+    New path: PIL reads the pixmap buffer directly
+
+    :return: Tuple of (PIL Image, bytes copied)
+    """
+    img = pixmap_to_image(pix)
+    # Mapped modes share the pixmap memory; RGB is unpacked once by PIL
+    copied = 0 if img.readonly else pil_storage_bytes(img)
+    return img, copied
+
+
+def legacy_qt(pix):
+    """
+    Old block_text_final path: QImage over pix.samples, which is a bytes copy
+
+    :return: Tuple of (QImage, bytes copied)
+    """
+    from PyQt5.QtGui import QImage
+
+    samples = pix.samples
+    img = QImage(samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
+    return img, len(samples)
+
+
+def adapter_qt(pix):
+    """
+    New path: QImage over the pixmap memory
+
+    :return: Tuple of (QImage, bytes copied)
+    """
+    img = pixmap_to_qimage(pix)
+    shared = int(img.constBits()) == pix.samples_ptr
+    return img, 0 if shared else img.sizeInBytes()
+
+
+def time_path(convert, pix):
+    """
+    Time a conversion path
+
+    :return: Tuple of (mean milliseconds per frame, bytes copied per frame)
+    """
+    copied = 0
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        _, copied = convert(pix)
+    return (time.perf_counter() - start) * 1000 / REPEATS, copied
+
+
+def main(paths):
+    try:
+        from PyQt5.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication(["render_copies"])
+        paths_to_run = [("PIL", legacy_pil, adapter_pil), ("Qt", legacy_qt, adapter_qt)]
+    except ImportError:
+        paths_to_run = [("PIL", legacy_pil, adapter_pil)]
+
+    print(f"{'file':40} {'path':4} {'frame KB':>9} "
+          f"{'old KB copied':>14} {'new KB copied':>14} {'old ms':>7} {'new ms':>7}")
+    for path in paths:
+        pix = fitz.open(path)[0].get_pixmap()
+        frame_kb = pix.stride * pix.height / 1024
+        for name, legacy, adapter in paths_to_run:
+            old_ms, old_copied = time_path(legacy, pix)
+            new_ms, new_copied = time_path(adapter, pix)
+            print(f"{os.path.basename(path)[:40]:40} {name:4} {frame_kb:9.0f} "
+                  f"{old_copied / 1024:14.0f} {new_copied / 1024:14.0f} "
+                  f"{old_ms:7.2f} {new_ms:7.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob(os.path.join("pdf_files", "*.pdf"))))
@@ -0,0 +1,323 @@
+"""
+Benchmark the reader hot paths and store the results as JSON.
+
+Each document is timed through the stages the readers go through: open,
+line extraction (fresh and from the extraction cache), sentence splitting,
+gaze hit testing of a 1,000-sample batch, I-VT and I-DT fixation detection
+over a minute of simulated 1 kHz gaze, page render for the Tk reader,
+per-tick highlighting, the Qt display path (a cold PageRenderer request
+through to the QPixmap), writing the highlight annotations and saving. The
+PDFs in pdf_files/ are used together with synthetic documents of 1, 100 and
+1,000 pages generated with PyMuPDF. Every stage reports latency percentiles.
+The readers' extraction cache is pointed at a temporary file for the run,
+so the user's cache is neither used nor filled.
+
+Run from the repository root:
+
+    python -m benchmarks.suite -o results.json
+    python -m benchmarks.suite -o new.json --compare results.json
+
+With --compare, stages whose median got slower than the threshold are listed
+and the exit status is 1. The Qt display stage is skipped when PyQt5 is not
+installed.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+import numpy as np
+
+SYNTHETIC_PAGES = (1, 100, 1000)
+GAZE_BATCH = 1000  # Samples hit-tested per gaze_hit_test run
+FIXATION_SECONDS = 60  # Simulated gaze per fixation detection run, at 1 kHz
+DISPLAY_SIZE = (800, 1000)  # Qt page display area in device pixels
+LOREM = ("Reading comprehension improves when attention is guided through dense text, "
+         "one line at a time, while the rest of the page stays out of the way. ")
+
+
+def percentiles(samples):
+    """
+    Summarize latencies
+
+    :param samples: Durations in seconds
+    :return: Dict of count, mean, p50, p90, p99 and max in milliseconds
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) * 1000 / len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1] * 1000,
+    }
+
+
+def timed(samples, func, *args):
+    """
+    Call a function and append its duration to samples
+
+    :return: The function's result
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def synthetic_pdf(path, pages):
+    """
+    Write a text-only PDF with the given number of pages, if not already there
+
+    :param path: Output path
+    :param pages: Number of pages
+    """
+    if os.path.exists(path):
+        return
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        text = f"Page {page_number + 1}\n\n" + LOREM * 20
+        page.insert_textbox(fitz.Rect(72, 72, page.rect.width - 72, page.rect.height - 72),
+                            text, fontsize=11)
+    doc.save(path, garbage=3, deflate=True)
+
+
+def sample_pages(page_count, max_pages):
+    """
+    Pick up to max_pages page numbers spread evenly over the document
+    """
+    if page_count <= max_pages:
+        return list(range(page_count))
+    step = page_count / max_pages
+    return [int(i * step) for i in range(max_pages)]
+
+
+def display_page(renderer, page):
+    """
+    Show a page the way the Qt reader does: request it from the PageRenderer,
+    wait for page_ready if it is not rendered yet and convert it to a QPixmap
+
+    :param renderer: qt_page_renderer.PageRenderer
+    :param page: fitz.Page from the GUI thread's document
+    :return: QPixmap
+    """
+    from PyQt5.QtCore import QEventLoop
+    from PyQt5.QtGui import QPixmap
+
+    image = renderer.request(page, DISPLAY_SIZE)
+    if image is None:
+        loop = QEventLoop()
+        outcome = []
+
+        def ready(page_number, result):
+            if page_number == page.number:
+                outcome.append(result)
+                loop.quit()
+
+        renderer.page_ready.connect(ready)
+        renderer.render_failed.connect(ready)
+        try:
+            loop.exec_()
+        finally:
+            renderer.page_ready.disconnect(ready)
+            renderer.render_failed.disconnect(ready)
+        image = outcome[0]
+        if isinstance(image, str):
+            raise RuntimeError(f"Page {page.number + 1} failed to render: {image}")
+    return QPixmap.fromImage(image)
+
+
+def bench_document(path, ticks, max_pages, saves, qt_available):
+    """
+    Time every stage for one document
+
+    :param path: PDF to benchmark
+    :param ticks: Number of highlight ticks to time
+    :param max_pages: Pages sampled for the per-page stages
+    :param saves: Number of times the highlighted document is saved
+    :param qt_available: Whether to time the Qt display path
+    :return: Dict of stage name -> percentiles
+    """
+    from extraction_cache import ExtractionCache
+    from fixation_detector import IDTDetector, IVTDetector
+    from gaze_simulator import GazeSimulator
+    from line_index import PageLineIndex
+    from pdf_reader import PDFReader
+    from render_cache import shared_cache
+    from sentence_index import PageSentenceIndex
+    from spatial_index import PageSpatialIndex
+
+    stages = {name: [] for name in ("open", "extract_lines", "extract_cached", "sentence_index",
+                                    "gaze_hit_test", "fixations_ivt", "fixations_idt",
+                                    "get_page_with_highlights", "highlight_sentence",
+                                    "display_page", "add_annotations", "save_pdf")}
+
+    for _ in range(5):
+        timed(stages["open"], fitz.open, path).close()
+
+    doc = fitz.open(path)
+    pages = sample_pages(len(doc), max_pages)
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ExtractionCache(os.path.join(cache_dir, "bench.sqlite3"))
+        digest = cache.document_key(path)
+        for page_number in pages:
+            page_lines = timed(stages["extract_lines"], PageLineIndex.extract, doc[page_number])
+            cache.store(digest, page_lines)
+            timed(stages["sentence_index"], PageSentenceIndex, page_lines)
+
+            # Gaze positions spread over the page, in the unrotated page space of the layout
+            area = doc[page_number].rect * doc[page_number].derotation_matrix
+            x = rng.uniform(area.x0, area.x1, GAZE_BATCH)
+            y = rng.uniform(area.y0, area.y1, GAZE_BATCH)
+            timed(stages["gaze_hit_test"], PageSpatialIndex(page_lines).lookup, x, y)
+
+            samples, _ = GazeSimulator(page_lines, 1000, rng=rng).next_batch(FIXATION_SECONDS)
+            if len(samples):
+                timed(stages["fixations_ivt"], IVTDetector(rate=1000).process, samples)
+                timed(stages["fixations_idt"], IDTDetector(rate=1000).process, samples)
+        for page_number in pages:
+            timed(stages["extract_cached"], cache.load, digest, page_number)
+
+    doc.close()
+
+    if qt_available:
+        from PyQt5.QtWidgets import QApplication
+        from document_source import open_document
+        from qt_page_renderer import PageRenderer
+
+        doc = open_document(path)
+        renderer = PageRenderer(doc)
+        try:
+            for page_number in pages:
+                # Time a cold render: no prefetched page, nothing in the cache
+                renderer.pool.waitForDone()
+                QApplication.processEvents()
+                renderer.images.clear()
+                shared_cache.clear()
+                timed(stages["display_page"], display_page, renderer, doc[page_number])
+        finally:
+            renderer.shutdown()
+            doc.close()
+
+    reader = PDFReader(path)
+    try:
+        for page_number in pages:
+            reader.load_page(page_number)
+            shared_cache.clear()  # Time a cold render
+            timed(stages["get_page_with_highlights"], reader.get_page_with_highlights)
+
+        reader.load_page(0)
+        for _ in range(ticks):
+            start = time.perf_counter()
+            highlighted = reader.next_sentences(1)
+            if not highlighted:
+                break
+            reader.get_highlight_patch(highlighted)
+            stages["highlight_sentence"].append(time.perf_counter() - start)
+
+        # Every save after the annotations are written does the same work
+        timed(stages["add_annotations"], reader.add_annotations)
+        with tempfile.TemporaryDirectory() as out_dir:
+            for _ in range(saves):
+                timed(stages["save_pdf"], reader.save_pdf, os.path.join(out_dir, "out.pdf"))
+    finally:
+        reader.close()
+
+    return {name: percentiles(samples) for name, samples in stages.items() if samples}
+
+
+def compare(results, baseline, threshold):
+    """
+    Find stages whose median latency regressed against a baseline run
+
+    :return: List of (document, stage, baseline p50, new p50) tuples
+    """
+    regressions = []
+    for document, stages in results["documents"].items():
+        for stage, stats in stages.items():
+            old = baseline.get("documents", {}).get(document, {}).get(stage)
+            if old and old.get("count") and stats["p50"] > old["p50"] * (1 + threshold):
+                regressions.append((document, stage, old["p50"], stats["p50"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PDF reader hot paths.")
+    parser.add_argument("-o", "--output", default="benchmark_results.json",
+                        help="JSON file to write the results to")
+    parser.add_argument("--pdfs", nargs="*", default=sorted(glob.glob(os.path.join("pdf_files", "*.pdf"))),
+                        help="Real PDFs to benchmark (default: pdf_files/*.pdf)")
+    parser.add_argument("--synthetic", type=int, nargs="*", default=list(SYNTHETIC_PAGES),
+                        help="Page counts of the synthetic PDFs (default: 1 100 1000)")
+    parser.add_argument("--ticks", type=int, default=200, help="Highlight ticks timed per document")
+    parser.add_argument("--max-pages", type=int, default=50, help="Pages sampled per document")
+    parser.add_argument("--saves", type=int, default=5, help="Saves timed per document")
+    parser.add_argument("--compare", help="Earlier results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown of a stage median before it counts as a regression")
+    args = parser.parse_args(argv)
+
+    try:
+        from PyQt5.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication(["benchmark"])
+        qt_available = True
+    except ImportError:
+        qt_available = False
+
+    synthetic_dir = os.path.join(tempfile.gettempdir(), "eye_tracking_reader_bench")
+    os.makedirs(synthetic_dir, exist_ok=True)
+    documents = [(os.path.basename(path), path) for path in args.pdfs]
+    for pages in args.synthetic:
+        path = os.path.join(synthetic_dir, f"synthetic_{pages}.pdf")
+        synthetic_pdf(path, pages)
+        documents.append((os.path.basename(path), path))
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "platform": platform.platform(),
+        "documents": {},
+    }
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Read before the readers' shared extraction cache is first used
+        os.environ["READER_EXTRACTION_CACHE"] = os.path.join(cache_dir, "extraction.sqlite3")
+        for name, path in documents:
+            print(f"Benchmarking {name}")
+            results["documents"][name] = bench_document(path, args.ticks, args.max_pages, args.saves,
+                                                        qt_available)
+            for stage, stats in results["documents"][name].items():
+                print(f"  {stage:26} n={stats['count']:<5} p50={stats['p50']:9.3f} ms "
+                      f"p90={stats['p90']:9.3f} ms p99={stats['p99']:9.3f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for document, stage, old, new in regressions:
+            print(f"Regression: {document} {stage} p50 {old:.3f} ms -> {new:.3f} ms")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
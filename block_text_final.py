@@ -2,9 +2,33 @@ import sys
 import fitz  # PyMuPDF
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QLabel, 
                              QPushButton, QFileDialog, QWidget, QMessageBox, 
-                             QHBoxLayout, QSpinBox, QTextEdit, QDoubleSpinBox)
+                             QHBoxLayout, QSpinBox, QPlainTextEdit, QDoubleSpinBox,
+                             QSizePolicy, QCheckBox)
 from PyQt5.QtGui import QImage, QPixmap, QPainter, QColor
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import QEvent, Qt, QTimer
+from document_loader import FAILED, LINES, PAGE, PREVIEW, READY, DocumentLoader
+from document_source import open_document, source_of
+from gaze_cursor import open_gaze_feed
+from gaze_simulator import FRAME_PERIOD
+from page_stream import LineStream
+from pacing import DeadlineScheduler, qt_arm
+from qt_page_renderer import PageRenderer, fit_matrix
+from render_adapter import pixmap_to_qimage
+from session_recording import NULL_RECORDER, SessionReplay, open_recorder
+from tile_renderer import TileRenderer, draw_tiles_qt, quantize_zoom
+import tracing
+
+# Revealed lines kept in the text display; older ones scroll out
+SCROLLBACK_LINES = 2000
+
+# Wait this long after the last resize event before re-rendering the page
+RESIZE_DEBOUNCE_MS = 150
+
+# How often a PDF being opened is checked for a page to show
+LOAD_POLL_MS = 20
+
+# How often finished tiles of a zoomed page are collected
+TILE_POLL_MS = 30
 
 class BlockingPDFReader(QMainWindow):
     def __init__(self):
@@ -14,13 +38,29 @@ class BlockingPDFReader(QMainWindow):
         # PDF document attributes
         self.document = None
         self.current_page = None
-        self.lines = []
+        self.page_renderer = None  # Renders and prefetches pages off the GUI thread
+        self.tile_renderer = None  # Renders the visible tiles of zoomed pages
+        self.zoom_percent = 100  # Zoom the view was panned at
+        self.pan = (0, 0)  # Top left of the view in zoomed page pixels
+        self.tile_failed_pages = set()  # Pages whose tile failures were reported
+        self.drag_from = None  # Mouse position of a pan in progress
+        self.line_stream = None  # Lines of every page, extracted as they are revealed
+        self.loader = None  # DocumentLoader of a PDF being opened
         self.current_line_index = 0
-        self.revealed_text = ""
         
-        # Blocking text timer
-        self.block_text_timer = QTimer(self)
-        self.block_text_timer.timeout.connect(self.reveal_next_lines)
+        # Blocking text timer, paced from absolute deadlines so the work done
+        # in a tick does not stretch the delay
+        self.block_text_timer = DeadlineScheduler(3.9, self.reveal_next_lines, qt_arm)
+        
+        # Gaze feed, simulated or received on a background thread; the frame
+        # timer collects its progress
+        self.gaze = None
+        self.gaze_timer = DeadlineScheduler(FRAME_PERIOD, self.reveal_gazed_lines, qt_arm)
+        
+        # Session recording (when READER_RECORD is set) and replay
+        self.recorder = NULL_RECORDER
+        self.replay = None
+        self.replay_timer = DeadlineScheduler(FRAME_PERIOD, self.replay_next, qt_arm)
 
     def initUI(self):
         self.setWindowTitle('Blocking PDF Reader')
@@ -37,15 +77,28 @@ class BlockingPDFReader(QMainWindow):
         pdf_layout = QVBoxLayout()
         self.pdf_label = QLabel('Open a PDF to begin')
         self.pdf_label.setAlignment(Qt.AlignCenter)
+        # Let the layout size the label, not the page image shown in it
+        self.pdf_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
         pdf_layout.addWidget(self.pdf_label)
         
+        # Re-render the page once a resize has settled
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(RESIZE_DEBOUNCE_MS)
+        self.resize_timer.timeout.connect(self.on_resize_settled)
+        
+        # Collect what a PDF being opened in the background has loaded
+        self.load_timer = QTimer(self)
+        self.load_timer.setInterval(LOAD_POLL_MS)
+        self.load_timer.timeout.connect(self.poll_loading)
+        
         # Controls Layout
         controls_layout = QVBoxLayout()
         
         # Open PDF Button
-        open_btn = QPushButton('Open PDF')
-        open_btn.clicked.connect(self.open_pdf)
-        controls_layout.addWidget(open_btn)
+        self.open_btn = QPushButton('Open PDF')
+        self.open_btn.clicked.connect(self.open_pdf)
+        controls_layout.addWidget(self.open_btn)
         
         # Lines to Reveal Selector
         line_reveal_layout = QHBoxLayout()
@@ -68,6 +121,27 @@ class BlockingPDFReader(QMainWindow):
         
         controls_layout.addLayout(line_reveal_layout)
         
+        # Zoom; above 100% only the visible tiles of the page are rendered,
+        # and the page is panned by dragging or scrolling it
+        self.zoom_selector = QSpinBox()
+        self.zoom_selector.setRange(100, 800)
+        self.zoom_selector.setSingleStep(50)
+        self.zoom_selector.setValue(100)
+        self.zoom_selector.setPrefix('Zoom: ')
+        self.zoom_selector.setSuffix('%')
+        self.zoom_selector.valueChanged.connect(self.on_zoom_changed)
+        controls_layout.addWidget(self.zoom_selector)
+        self.pdf_label.installEventFilter(self)
+        
+        # Collect the tiles of a zoomed page as workers finish them
+        self.tile_timer = QTimer(self)
+        self.tile_timer.setInterval(TILE_POLL_MS)
+        self.tile_timer.timeout.connect(self.poll_tiles)
+        
+        # Reveal lines as the gaze reads them instead of on a timer
+        self.gaze_checkbox = QCheckBox('Follow Gaze')
+        controls_layout.addWidget(self.gaze_checkbox)
+        
         # Block Text Button
         block_text_btn = QPushButton('Block Text')
         block_text_btn.clicked.connect(self.start_block_text)
@@ -84,122 +158,393 @@ class BlockingPDFReader(QMainWindow):
         
         main_layout.addLayout(top_layout)
         
-        # Text Display Area (now a QTextEdit for better text management)
-        self.text_display = QTextEdit()
+        # Text Display Area (a QPlainTextEdit only lays out the visible lines,
+        # and the block limit bounds the scrollback)
+        self.text_display = QPlainTextEdit()
         self.text_display.setReadOnly(True)
+        self.text_display.setMaximumBlockCount(SCROLLBACK_LINES)
         main_layout.addWidget(self.text_display)
         
         main_widget.setLayout(main_layout)
         self.setCentralWidget(main_widget)
 
     def clear_text(self):
-        # Clear the revealed text and reset line index
-        self.revealed_text = ""
+        # Clear the revealed text and go back to the first line
+        self.recorder.reset()
         self.current_line_index = 0
         self.text_display.clear()
+        if self.document is not None:
+            self.current_page = self.document[0]
+            self.display_page()
+            self.extract_lines()
         
         # Stop the timer if it's running
-        if self.block_text_timer.isActive():
+        if self.block_text_timer.is_active():
             self.block_text_timer.stop()
+            if tracing.enabled():
+                print(f"Block text pacing: {self.block_text_timer.summary()}")
+        self.stop_gaze()
 
     def open_pdf(self):
+        # The button cancels a PDF still being opened
+        if self.loader is not None:
+            self.cancel_loading()
+            return
+        file_path, _ = QFileDialog.getOpenFileName(self, 'Open PDF', '', 'PDF Files (*.pdf)')
+        if file_path:
+            self.start_loading(file_path)
+
+    def close_document(self):
+        # Stop everything that uses the open document
+        self.stop_replay()
+        self.block_text_timer.stop()
+        self.stop_gaze()
+        self.recorder.close()
+        self.recorder = NULL_RECORDER
+        if self.page_renderer is not None:
+            self.page_renderer.shutdown()
+            self.page_renderer.page_ready.disconnect(self.on_page_ready)
+            self.page_renderer.render_failed.disconnect(self.on_render_failed)
+            self.page_renderer.deleteLater()
+            self.page_renderer = None
+        self.tile_timer.stop()
+        if self.tile_renderer is not None:
+            self.tile_renderer.close()
+            self.tile_renderer = None
+        self.tile_failed_pages.clear()
+        if self.line_stream is not None:
+            self.line_stream.close()
+            self.line_stream = None
+        self.current_page = None
+        if self.document is not None:
+            self.document.close()  # The renderers above are done with it
+            self.document = None
+
+    def start_loading(self, file_path):
+        # Open the document on a background thread; the first page is shown
+        # blurry, then sharp, as soon as each render is done, and the window
+        # stays responsive meanwhile
+        self.close_document()
+        self.pdf_label.clear()
+        self.pdf_label.setText('Opening PDF...')
+        self.open_btn.setText('Cancel Opening')
+        # Rendered at the size display_page asks for, so the page renderer
+        # finds the page in the render cache
+        ratio = self.pdf_label.devicePixelRatioF()
+        size = (round(self.pdf_label.width() * ratio), round(self.pdf_label.height() * ratio))
+        self.loader = DocumentLoader(file_path, lambda page: fit_matrix(page, size),
+                                     convert=pixmap_to_qimage).start()
+        self.load_timer.start()
+
+    def poll_loading(self):
+        for event, value in self.loader.take_events():
+            if event in (PREVIEW, PAGE):
+                self.show_page_image(value)
+            elif event == LINES:
+                print(f"Extracted {len(value)} lines from page 1")
+            elif event == READY:
+                self.stop_loading()
+                self.load_document(*value)
+                return
+            elif event == FAILED:
+                self.stop_loading()
+                self.pdf_label.setText('Open a PDF to begin')
+                QMessageBox.critical(self, "PDF Open Error", value)
+                return
+
+    def stop_loading(self):
+        self.load_timer.stop()
+        self.loader = None
+        self.open_btn.setText('Open PDF')
+
+    def cancel_loading(self):
+        self.loader.cancel()
+        self.stop_loading()
+        self.pdf_label.clear()
+        self.pdf_label.setText('Open a PDF to begin')
+
+    def load_document(self, file_path, first_page=None, record=True):
+        # file_path may also be a DocumentSource, or a fitz.Document opened
+        # from one, and first_page the PageLineIndex of its first page if
+        # already extracted; returns True if the document was opened
         try:
-            file_path, _ = QFileDialog.getOpenFileName(self, 'Open PDF', '', 'PDF Files (*.pdf)')
-            if file_path:
-                # Open the document
-                self.document = fitz.open(file_path)
-                
-                # Verify document is not empty
-                if len(self.document) == 0:
-                    raise ValueError("The PDF document is empty")
-                
-                self.current_page = self.document[0]
-                self.display_page()
-                self.extract_lines()
+            self.close_document()
+            
+            # Open the document
+            if isinstance(file_path, fitz.Document):
+                self.document = file_path
+            else:
+                self.document = open_document(file_path)
+            
+            # Verify document is not empty
+            if len(self.document) == 0:
+                raise ValueError("The PDF document is empty")
+            
+            self.page_renderer = PageRenderer(self.document, self)
+            self.page_renderer.page_ready.connect(self.on_page_ready)
+            self.page_renderer.render_failed.connect(self.on_render_failed)
+            self.tile_renderer = TileRenderer(self.document)
+            self.pan = (0, 0)
+            
+            self.current_page = self.document[0]
+            self.display_page()
+            self.extract_lines(first_page)
+            if record:
+                source = source_of(self.document)
+                self.recorder = open_recorder("block", source.name, len(self.document), source.digest())
+            return True
         except Exception as e:
             # Show error message to user
             QMessageBox.critical(self, "PDF Open Error", str(e))
+            return False
 
     def display_page(self):
-        try:
-            # Convert PDF page to QImage for display
-            pix = self.current_page.get_pixmap()
-            img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
-            
-            # Convert QImage to QPixmap
+        # Pages are rendered on worker threads straight at the label's size in
+        # device pixels, so nothing is rescaled; a prefetched page is shown
+        # right away, otherwise on_page_ready shows it when done
+        if self.zoomed():
+            self.display_tiles()
+            return
+        self.tile_timer.stop()
+        img = self.page_renderer.request(self.current_page, self.label_size())
+        if img is not None:
+            self.show_page_image(img)
+
+    def label_size(self):
+        # Size of the page display in device pixels
+        ratio = self.pdf_label.devicePixelRatioF()
+        return (round(self.pdf_label.width() * ratio), round(self.pdf_label.height() * ratio))
+
+    def zoomed(self):
+        return self.zoom_selector.value() > 100 and self.tile_renderer is not None
+
+    def display_tiles(self):
+        # Paint the tiles of the zoomed page that are in view; the ones still
+        # rendering are painted by poll_tiles as they arrive
+        size = self.label_size()
+        zoom = quantize_zoom(fit_matrix(self.current_page, size).a * self.zoom_selector.value() / 100)
+        page_size = self.current_page.rect * fitz.Matrix(zoom, zoom)
+        self.pan = (min(max(self.pan[0], 0), max(page_size.width - size[0], 0)),
+                    min(max(self.pan[1], 0), max(page_size.height - size[1], 0)))
+        viewport = fitz.Rect(self.pan[0], self.pan[1], self.pan[0] + size[0], self.pan[1] + size[1])
+        tiles = self.tile_renderer.request(self.current_page.number, zoom, viewport)
+        
+        img = QImage(max(size[0], 1), max(size[1], 1), QImage.Format_RGB888)
+        img.fill(QColor('white'))
+        painter = QPainter(img)
+        draw_tiles_qt(painter, tiles, origin=(-round(self.pan[0]), -round(self.pan[1])))
+        painter.end()
+        self.show_page_image(img)
+        if self.tile_renderer.busy():
+            self.tile_timer.start()
+
+    def poll_tiles(self):
+        tiles, failures = self.tile_renderer.take_ready()
+        page_number = self.current_page.number if self.current_page is not None else None
+        if not self.tile_renderer.busy():
+            self.tile_timer.stop()  # display_tiles starts it again when it queues tiles
+        messages = [failure[-1] for failure in failures if failure[0] == page_number]
+        if messages and page_number not in self.tile_failed_pages:
+            # One warning per page, even while it is open and more tiles fail
+            self.tile_failed_pages.add(page_number)
+            self.on_render_failed(page_number, messages[0])
+        if any(tile[0] == page_number for tile in tiles):
+            self.display_tiles()  # Finished tiles are in the render cache now
+
+    def on_zoom_changed(self, value):
+        # Keep the centre of the view where it was on the page
+        size = self.label_size()
+        scale = value / self.zoom_percent
+        self.pan = ((self.pan[0] + size[0] / 2) * scale - size[0] / 2,
+                    (self.pan[1] + size[1] / 2) * scale - size[1] / 2)
+        self.zoom_percent = value
+        if self.current_page is not None:
+            self.display_page()
+
+    def eventFilter(self, obj, event):
+        # Pan a zoomed page by dragging it or with the mouse wheel
+        if obj is not self.pdf_label or not self.zoomed() or self.current_page is None:
+            return super().eventFilter(obj, event)
+        ratio = self.pdf_label.devicePixelRatioF()
+        if event.type() == QEvent.Wheel:
+            delta = event.angleDelta()
+            self.pan = (self.pan[0] - delta.x() * ratio, self.pan[1] - delta.y() * ratio)
+        elif event.type() == QEvent.MouseButtonPress:
+            self.drag_from = event.pos()
+            return True
+        elif event.type() == QEvent.MouseMove and self.drag_from is not None:
+            moved = event.pos() - self.drag_from
+            self.drag_from = event.pos()
+            self.pan = (self.pan[0] - moved.x() * ratio, self.pan[1] - moved.y() * ratio)
+        elif event.type() == QEvent.MouseButtonRelease:
+            self.drag_from = None
+            return True
+        else:
+            return super().eventFilter(obj, event)
+        self.display_tiles()
+        return True
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # Renders for sizes seen recently stay in the render cache, so
+        # settling back on one of them does not rasterize again
+        self.resize_timer.start()
+
+    def on_resize_settled(self):
+        if self.current_page is not None:
+            self.display_page()
+
+    def on_page_ready(self, page_number, img):
+        # Ignore prefetched neighbours until the reader moves onto them, and
+        # whole-page renders while the page is zoomed
+        if (self.current_page is not None and page_number == self.current_page.number
+                and not self.zoomed()):
+            self.show_page_image(img)
+
+    def show_page_image(self, img):
+        with tracing.span("widget_update"):
             pixmap = QPixmap.fromImage(img)
-            scaled_pixmap = pixmap.scaled(self.pdf_label.size(), 
-                                          Qt.KeepAspectRatio, 
-                                          Qt.SmoothTransformation)
-            
-            self.pdf_label.setPixmap(scaled_pixmap)
-        except Exception as e:
-            # Error handling for page display
-            QMessageBox.warning(self, "Display Error", str(e))
+            pixmap.setDevicePixelRatio(self.pdf_label.devicePixelRatioF())
+            self.pdf_label.setPixmap(pixmap)
 
-    def extract_lines(self):
+    def on_render_failed(self, page_number, message):
+        # Error handling for page display
+        if self.current_page is not None and page_number == self.current_page.number:
+            QMessageBox.warning(self, "Display Error", message)
+
+    def extract_lines(self, first_page=None):
         try:
-            # Extract text and split into lines
-            text = self.current_page.get_text()
-            
-            # Split text into lines, removing empty lines
-            self.lines = [line.strip() for line in text.split('\n') if line.strip()]
+            # Later pages are extracted as the reveal cursor gets to them
+            if self.line_stream is not None:
+                self.line_stream.close()
+            self.line_stream = LineStream(self.document)
+            if first_page is not None:
+                self.line_stream.keep_page(first_page)
+            first_page = self.line_stream.page_lines(self.current_page.number)
             
             # Print lines to console for verification
-            print(f"Extracted {len(self.lines)} lines")
-            for i, line in enumerate(self.lines[:5], 1):
+            print(f"Extracted {len(first_page)} lines from page 1 of {len(self.document)}")
+            for i, line in enumerate(first_page.lines[:5], 1):
                 print(f"Line {i}: {line}")
         except Exception as e:
             print(f"Error extracting lines: {str(e)}")
-            self.lines = []
+            self.line_stream = None
 
     def start_block_text(self):
         # Check if lines have been extracted
-        if not self.lines:
+        if self.line_stream is None:
             QMessageBox.warning(self, "No Lines", "Please open a PDF first and ensure it contains text.")
             return
         
-        # Reset line index if we've reached the end
-        if self.current_line_index >= len(self.lines):
-            self.current_line_index = 0
+        # Start over if we've reached the end
+        self.stop_replay()
+        self.recorder.stop()
+        if self.line_stream.exhausted:
+            self.clear_text()
         
-        # Convert seconds to milliseconds for timer
-        delay_seconds = self.delay_input.value()
-        timer_interval = int(delay_seconds * 1000)
+        if self.gaze_checkbox.isChecked():
+            self.block_text_timer.stop()
+            self.stop_gaze()
+            self.gaze = open_gaze_feed(self.line_stream.page_lines, len(self.document), self.recorder)
+            try:
+                self.gaze.start(*self.line_stream.position)
+            except OSError as e:
+                self.gaze = None
+                QMessageBox.critical(self, "Gaze Input Error", str(e))
+                return
+            self.recorder.start(self.line_stream.position, gaze=True)
+            self.gaze_timer.start()
+            return
         
-        self.block_text_timer.start(timer_interval)
+        # First lines are revealed after one delay, like the rest
+        self.stop_gaze()
+        self.block_text_timer.period = self.delay_input.value()
+        self.recorder.start(self.line_stream.position, self.lines_selector.value(), self.block_text_timer.period)
+        self.block_text_timer.start(immediate=False)
+
+    def stop_gaze(self):
+        if self.gaze is not None:
+            self.recorder.stop()
+        self.gaze_timer.stop()
+        if self.gaze is not None:
+            self.gaze.stop()
+            self.gaze = None
 
     def reveal_next_lines(self):
         # Get number of lines to reveal from spinner
         lines_to_reveal = self.lines_selector.value()
+        entries = self.reveal_lines(lines_to_reveal)
+        self.recorder.advance(entries, lines_to_reveal)
         
-        # Calculate end index for revealing lines
-        end_index = min(self.current_line_index + lines_to_reveal, len(self.lines))
-        
-        if self.current_line_index < len(self.lines):
-            # Reveal lines
-            revealed_lines = '\n'.join(self.lines[self.current_line_index:end_index])
-            
-            # Append revealed lines to existing text
-            if self.revealed_text:
-                self.revealed_text += '\n' + revealed_lines
-            else:
-                self.revealed_text = revealed_lines
-            
-            # Update text display
-            self.text_display.setText(self.revealed_text)
-            
-            # Update current line index
-            self.current_line_index = end_index
-            
-            # Stop timer if all lines revealed
-            if self.current_line_index >= len(self.lines):
-                self.block_text_timer.stop()
-                QMessageBox.information(self, "Blocking Complete", "All lines have been revealed.")
-        else:
+        # Stop timer if all lines revealed
+        if len(entries) < lines_to_reveal:
             self.block_text_timer.stop()
+            self.recorder.stop()
+            if tracing.enabled():
+                print(f"Block text pacing: {self.block_text_timer.summary()}")
             QMessageBox.information(self, "Blocking Complete", "All lines have been revealed.")
 
+    def reveal_gazed_lines(self):
+        # Reveal the lines the gaze passed since the last frame
+        count = self.gaze.take_lines()
+        if count:
+            self.recorder.advance(self.reveal_lines(count))
+        
+        if self.gaze.finished:
+            self.stop_gaze()
+            QMessageBox.information(self, "Blocking Complete", "All lines have been revealed.")
+
+    def replay_session(self, session, speed=1.0):
+        # Reveal the recorded document as it was revealed in a session,
+        # played back by the frame however fast the recorded ticks came
+        if not self.load_document(session.document, record=False):
+            return
+        self.replay = SessionReplay(session, self.replay_lines, self.clear_text, speed)
+        self.replay.start()
+        self.replay_timer.start()
+
+    def stop_replay(self):
+        self.replay_timer.stop()
+        self.replay = None
+
+    def replay_next(self):
+        if self.replay.tick():
+            return True
+        self.stop_replay()
+        QMessageBox.information(self, "Replay Complete", "The recorded session has been replayed.")
+        return False
+
+    def replay_lines(self, count, unit):
+        # The blocking reader reveals by line only, so unit is always LINE.
+        # Returns False once the document runs out of lines
+        return len(self.reveal_lines(count)) == count
+
+    def reveal_lines(self, lines_to_reveal):
+        with tracing.span("tick"):
+            # Take the next lines, which may run onto the next page
+            with tracing.span("line_lookup"):
+                entries = self.line_stream.take(lines_to_reveal)
+            
+            if entries:
+                # Flip the displayed page once the cursor crosses onto a new one
+                page_number = entries[-1][0].page_number
+                if page_number != self.current_page.number:
+                    self.current_page = self.document[page_number]
+                    self.pan = (0, 0)  # A new page is read from its top
+                    with tracing.span("display_page"):
+                        self.display_page()
+                
+                # Reveal lines
+                revealed_lines = '\n'.join(line_index.lines[line_no] for line_index, line_no in entries)
+                
+                # Append only the new lines; the text already shown is not laid out again
+                with tracing.span("text_update"):
+                    self.text_display.appendPlainText(revealed_lines)
+                
+                # Update current line index
+                self.current_line_index += len(entries)
+        return entries
+
 def main():
     app = QApplication(sys.argv)
     pdf_reader = BlockingPDFReader()
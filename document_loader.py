@@ -0,0 +1,187 @@
+"""
+Asynchronous document opening with a progressive first paint.
+
+Opening a large PDF on the GUI thread (fitz.open repairing or reading the
+xref, rasterizing the first page, hashing the file for the extraction cache
+and extracting the first page's lines) hangs the window for as long as it
+takes. DocumentLoader does all of it on a background thread, in the order
+the reader can use it:
+
+1. open and validate the document (OPENED, with the page count)
+2. render the first page at a fraction of the final zoom and scale it up,
+   so a blurry page shows almost at once (PREVIEW). Scanned pages skip
+   this: MuPDF decodes their images in full at any zoom, so a preview
+   would take as long as the final render and decode the images twice.
+3. render it at the final zoom through the render cache (PAGE)
+4. hash the file and extract the first page's lines through the extraction
+   cache (LINES)
+5. hand the open document over to the GUI thread (READY)
+
+Later pages are extracted by the reader's LineStream as the cursor reaches
+them. Events are collected in a thread-safe queue that the GUI drains with
+take_events(), as with TileRenderer, so neither toolkit is touched from the
+loader thread. cancel() stops the load at the next step and closes the
+document.
+"""
+import queue
+import threading
+
+import fitz  # PyMuPDF
+
+from document_source import as_source
+from extraction_cache import shared_extraction_cache
+from line_index import PageLineIndex
+from render_adapter import pixmap_to_image
+from render_cache import document_fingerprint, shared_cache
+
+PREVIEW_SCALE = 0.25  # Zoom of the preview render relative to the final one
+
+# Events, posted as (event, value) tuples
+OPENED = "opened"  # Number of pages
+PREVIEW = "preview"  # Converted image of the first page, scaled up from a low zoom
+PAGE = "page"  # Converted image of the first page at the final zoom
+LINES = "lines"  # PageLineIndex of the first page
+READY = "ready"  # (fitz.Document, PageLineIndex of the first page)
+FAILED = "failed"  # Error message
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _image_bound(page, size):
+    # Whether the page's images hold more pixels than the render, as on a scan
+    pixels = sum(image[2] * image[3] for image in page.get_images())
+    return pixels >= size.width * size.height
+
+
+class DocumentLoader:
+    """
+    Opens a PDF and paints its first page on a background thread.
+    """
+
+    def __init__(self, pdf_path, matrix=None, annots=True, convert=pixmap_to_image,
+                 preview_scale=PREVIEW_SCALE, cache=None, render_cache=shared_cache):
+        """
+        Create a loader for a PDF file
+
+        :param pdf_path: Path to the PDF file, or a DocumentSource, mmap.mmap
+                         or bytes holding it
+        :param matrix: Function giving the fitz.Matrix to render a fitz.Page
+                       with, None for 72 dpi
+        :param annots: Whether annotations are drawn
+        :param convert: Function turning a rendered fitz.Pixmap into the GUI's
+                        image type; it runs on the loader thread
+        :param preview_scale: Zoom of the preview relative to the final
+                              render, 0 for no preview
+        :param cache: ExtractionCache to use, None for the shared one or False
+                      to always extract
+        :param render_cache: RenderCache the final render goes through
+        """
+        self.pdf_path = pdf_path
+        self.matrix = matrix or (lambda page: fitz.Matrix(1, 1))
+        self.annots = annots
+        self.convert = convert
+        self.preview_scale = preview_scale
+        self.cache = shared_extraction_cache() if cache is None else cache
+        self.render_cache = render_cache
+        self.events = queue.Queue()  # Events posted by the loader, waiting for the GUI
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()  # Orders cancel() against handing over the document
+        self.thread = None
+
+    def start(self):
+        """
+        Start loading on a background thread
+
+        :return: self
+        """
+        self.thread = threading.Thread(target=self._load, name="pdf-open", daemon=True)
+        self.thread.start()
+        return self
+
+    def _load(self):
+        try:
+            result = self.run()
+        except Exception as e:
+            self.events.put((FAILED, str(e)))
+            return
+        if result is None:
+            return
+        with self.lock:
+            if not self.cancelled.is_set():
+                self.events.put((READY, result))
+                return
+        result[0].close()
+
+    def run(self):
+        """
+        Open the document and load its first page on the calling thread,
+        posting the events as each step finishes
+
+        :return: Tuple of (fitz.Document, PageLineIndex of the first page), or
+                 None if the load was cancelled
+        """
+        source = as_source(self.pdf_path)
+        doc = source.open()
+        try:
+            if doc.needs_pass:
+                raise ValueError("The PDF document is password protected")
+            if len(doc) == 0:
+                raise ValueError("The PDF document is empty")
+            self._post(OPENED, len(doc))
+
+            page = doc[0]
+            matrix = self.matrix(page)
+            size = (page.rect * matrix).irect
+            if self.preview_scale and not _image_bound(page, size):
+                # Scaled up to the final size, so the GUI lays it out the same
+                small = page.get_pixmap(matrix=matrix * fitz.Matrix(self.preview_scale, self.preview_scale),
+                                        annots=self.annots)
+                self._post(PREVIEW, self.convert(fitz.Pixmap(small, size.width, size.height, None)))
+
+            pix = self.render_cache.render(page, matrix, annots=self.annots,
+                                           fingerprint=document_fingerprint(doc))
+            self._post(PAGE, self.convert(pix))
+
+            if self.cache:
+                page_lines = self.cache.page_lines(page, source.digest(self.cache))
+            else:
+                page_lines = PageLineIndex.extract(page)
+            self._post(LINES, page_lines)
+            return doc, page_lines
+        except _Cancelled:
+            doc.close()
+            return None
+        except Exception:
+            doc.close()
+            raise
+
+    def _post(self, event, value):
+        if self.cancelled.is_set():
+            raise _Cancelled()
+        self.events.put((event, value))
+
+    def take_events(self):
+        """
+        Collect the events posted since the last call (call from the GUI thread)
+
+        :return: List of (event, value) tuples
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def cancel(self):
+        """
+        Stop loading; the document is closed once the current step finishes
+        """
+        with self.lock:
+            self.cancelled.set()
+        # A document handed over before the cancel is not going to be used
+        for event, value in self.take_events():
+            if event == READY:
+                value[0].close()
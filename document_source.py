@@ -0,0 +1,160 @@
+"""
+One way to open a PDF from a path, a memory map or bytes.
+
+A DocumentSource says where a document's bytes come from and opens as many
+fitz.Document handles on them as needed. The GUI thread and every worker
+thread (line extraction, page and tile rendering) needs its own handle,
+because MuPDF documents are not thread-safe, and a document received as
+bytes has no file name to reopen.
+
+Files of at least READER_MMAP_MB megabytes (default 16) are memory-mapped
+read-only and every handle reads the shared mapping. Several reader
+processes on one host then share the file's page cache instead of each
+filling a private buffer with its own copy. Bytes and mmap objects passed
+in are read in place, without copying.
+
+Documents opened here carry their source as doc.source, so code given a
+document can find it again with source_of().
+"""
+import hashlib
+import io
+import mmap
+import os
+
+import fitz  # PyMuPDF
+
+from extraction_cache import file_sha256
+
+MMAP_THRESHOLD = int(float(os.environ.get("READER_MMAP_MB", 16)) * (1 << 20))
+
+
+class DocumentSource:
+    """
+    The bytes of a PDF: a file, a memory-mapped file or a buffer in memory.
+    """
+
+    def __init__(self, source, name=None, mmap_threshold=MMAP_THRESHOLD):
+        """
+        Describe where a PDF is read from
+
+        :param source: Path to the PDF file, or its contents as an mmap.mmap,
+                       bytes, bytearray, memoryview or io.BytesIO
+        :param name: Name to show and record for the document; defaults to
+                     the path, or to one made from the digest for contents
+                     in memory
+        :param mmap_threshold: Size in bytes from which files are
+                               memory-mapped, None to never map them
+        """
+        self.path = None  # Path of the file, if the PDF is one
+        self.buffer = None  # Contents the handles read, None to read the file by name
+        self.mapping = None  # mmap.mmap of the file, if it is memory-mapped here
+        self._digest = None
+        if isinstance(source, (str, os.PathLike)):
+            self.path = os.fspath(source)
+            size = os.path.getsize(self.path)
+            if mmap_threshold is not None and size and size >= mmap_threshold:
+                with open(self.path, "rb") as f:
+                    self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.buffer = memoryview(self.mapping)
+        elif isinstance(source, io.BytesIO):
+            self.buffer = source.getbuffer()
+        elif isinstance(source, (mmap.mmap, bytes, bytearray, memoryview)):
+            self.buffer = memoryview(source)
+        else:
+            raise TypeError(f"Cannot open a PDF from {type(source).__name__}")
+        self._name = name
+
+    @property
+    def name(self):
+        """
+        Name to show and record for the document
+
+        :return: The name given, the path, or "<digest prefix>.pdf" for
+                 contents in memory
+        """
+        if self._name is None:
+            self._name = self.path if self.path is not None else self.digest()[:16] + ".pdf"
+        return self._name
+
+    @property
+    def fingerprint(self):
+        """
+        Identify the contents for render cache keys, the same for every handle
+
+        :return: Hashable fingerprint
+        """
+        if self.path is not None:
+            stat = os.stat(self.path)
+            return (os.path.realpath(self.path), stat.st_size, stat.st_mtime_ns)
+        # By contents: an id() is reused once the source is freed, and the
+        # shared render cache would then serve another document's pages
+        return ("memory", self.digest())
+
+    def open(self):
+        """
+        Open a new handle on the document
+
+        :return: fitz.Document with this source as doc.source
+        """
+        if self.buffer is None:
+            doc = fitz.open(self.path)
+        else:
+            doc = fitz.open(stream=self.buffer, filetype="pdf")
+        doc.source = self
+        return doc
+
+    def digest(self, cache=None):
+        """
+        Get the SHA-256 of the contents, the extraction cache key
+
+        :param cache: ExtractionCache whose file hashes to reuse for files
+        :return: Hex SHA-256 digest
+        """
+        if self._digest is None:
+            if self.path is not None and cache:
+                self._digest = cache.document_key(self.path)
+            elif self.path is not None:
+                self._digest = file_sha256(self.path)
+            else:
+                self._digest = hashlib.sha256(self.buffer).hexdigest()
+        return self._digest
+
+
+def as_source(source):
+    """
+    Get the DocumentSource of anything a PDF can be opened from
+
+    :param source: DocumentSource, path, mmap.mmap or bytes-like contents
+    :return: DocumentSource
+    """
+    return source if isinstance(source, DocumentSource) else DocumentSource(source)
+
+
+def open_document(source):
+    """
+    Open a PDF from a path, a memory map or bytes
+
+    :param source: DocumentSource, path, mmap.mmap or bytes-like contents
+    :return: fitz.Document with its DocumentSource as doc.source
+    """
+    return as_source(source).open()
+
+
+def source_of(doc):
+    """
+    Get the source of an open document, to open more handles on it
+
+    :param doc: fitz.Document
+    :return: DocumentSource, or None for a document created in memory
+    """
+    source = getattr(doc, "source", None)
+    if source is None:
+        # Opened with fitz.open directly: from its file, or from memory
+        if doc.stream is not None:
+            source = DocumentSource(doc.stream)
+        elif doc.name and os.path.isfile(doc.name):
+            source = DocumentSource(doc.name, mmap_threshold=None)
+        else:
+            return None
+        doc.source = source
+    return source
@@ -0,0 +1,171 @@
+"""
+Persistent cache of per-page text extraction.
+
+Page line tables are stored in a local SQLite file keyed by the SHA-256 of the
+PDF bytes and the extractor version, so reopening a document reads its lines,
+word boxes and layout order instead of extracting them again. A changed file
+hashes differently and is extracted afresh. The file hash itself is only
+recomputed when the file's size or modification time changes.
+
+The database lives at READER_EXTRACTION_CACHE, or in ~/.cache/eye_tracking_reader
+by default.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+from line_index import EXTRACTOR_VERSION, PageLineIndex
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "eye_tracking_reader",
+                            "extraction.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    sha256 TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (sha256, version, page)
+);
+"""
+
+
+def file_sha256(path):
+    """
+    Hash the contents of a file
+
+    :param path: Path to the file
+    :return: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    SQLite store of PageLineIndex tables, loaded one page at a time.
+
+    Each thread gets its own connection, so background extraction threads can
+    use the same cache object as the GUI thread.
+    """
+
+    def __init__(self, path=None):
+        """
+        Open (or create) the cache database
+
+        :param path: Path of the SQLite file
+        """
+        self.path = path or os.environ.get("READER_EXTRACTION_CACHE") or DEFAULT_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.local = threading.local()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        """
+        Get the calling thread's connection
+
+        :return: sqlite3.Connection
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer
+        return conn
+
+    def document_key(self, pdf_path):
+        """
+        Get the content hash of a PDF, rehashing only if the file changed
+
+        :param pdf_path: Path to the PDF file
+        :return: Hex SHA-256 digest
+        """
+        path = os.path.realpath(pdf_path)
+        stat = os.stat(path)
+        conn = self.connection()
+        row = conn.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?",
+                           (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        digest = file_sha256(path)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                         (path, stat.st_size, stat.st_mtime_ns, digest))
+            if row is not None and row[2] != digest:
+                # Drop the old contents' pages unless another file still has them
+                conn.execute("DELETE FROM pages WHERE sha256 = ? AND NOT EXISTS "
+                             "(SELECT 1 FROM files WHERE sha256 = ?)", (row[2], row[2]))
+        return digest
+
+    def load(self, digest, page_number):
+        """
+        Read a cached page table
+
+        :param digest: Content hash from document_key
+        :param page_number: Zero-based page number
+        :return: PageLineIndex, or None if the page is not cached
+        """
+        row = self.connection().execute(
+            "SELECT data FROM pages WHERE sha256 = ? AND version = ? AND page = ?",
+            (digest, EXTRACTOR_VERSION, page_number)).fetchone()
+        if row is None:
+            return None
+        return PageLineIndex.from_data(page_number, json.loads(zlib.decompress(row[0])))
+
+    def store(self, digest, page_lines):
+        """
+        Write a page table to the cache
+
+        :param digest: Content hash from document_key
+        :param page_lines: PageLineIndex to store
+        """
+        data = zlib.compress(json.dumps(page_lines.to_data(), separators=(",", ":")).encode())
+        conn = self.connection()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                         (digest, EXTRACTOR_VERSION, page_lines.page_number, data))
+
+    def page_lines(self, page, digest):
+        """
+        Get the line table of a page from the cache, extracting it on a miss
+
+        :param page: fitz.Page
+        :param digest: Content hash of the page's document
+        :return: PageLineIndex
+        """
+        page_lines = self.load(digest, page.number)
+        if page_lines is None:
+            page_lines = PageLineIndex.extract(page)
+            self.store(digest, page_lines)
+        return page_lines
+
+
+_shared_cache = None
+
+
+def shared_extraction_cache():
+    """
+    Get the process-wide extraction cache, opening it on first use
+
+    :return: ExtractionCache, or None if the cache cannot be opened
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        try:
+            _shared_cache = ExtractionCache()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Extraction cache disabled: {str(e)}")
+            _shared_cache = False
+    return _shared_cache or None
@@ -0,0 +1,249 @@
+"""
+Streaming fixation detection.
+
+Raw gaze samples jitter and sweep across lines during saccades; the reading
+cursor should only move on fixations. Both detectors here take samples in
+batches of any size, as they arrive, and return fixation events:
+
+- FIXATION_START once a fixation has lasted the minimum duration, with the
+  centroid of its samples so far
+- FIXATION_END when it is over, with its full duration and centroid
+
+IVTDetector classifies samples by velocity (I-VT), measured over a short
+time span so tracker noise does not read as movement. IDTDetector
+classifies them by dispersion (I-DT): a sample belongs to a fixation when a
+window of the minimum duration around it stays within the dispersion
+threshold. Either way the work per batch is a handful of NumPy operations,
+and only the last few samples needed to continue the windows and the sums
+of the fixation still open are kept between batches.
+
+All positions are page points and times seconds. READER_FIXATION_METHOD
+picks the detector the readers use (ivt or idt).
+"""
+import os
+
+import numpy as np
+
+FIXATION_START = 1
+FIXATION_END = 2
+
+# kind is FIXATION_START or FIXATION_END; duration is the time covered so
+# far for a start event
+EVENT_DTYPE = np.dtype([("kind", "i1"), ("start", "<f8"), ("duration", "<f4"),
+                        ("x", "<f4"), ("y", "<f4")])
+
+MIN_DURATION = 0.06  # Shortest fixation in seconds
+VELOCITY_THRESHOLD = 400.0  # Fastest fixation movement in points per second (I-VT)
+VELOCITY_SPAN = 0.02  # Seconds over which velocity is measured (I-VT)
+DISPERSION_THRESHOLD = 12.0  # Largest x plus y spread of a fixation in points (I-DT)
+DEFAULT_METHOD = os.environ.get("READER_FIXATION_METHOD", "ivt")
+
+
+class FixationDetector:
+    """
+    Groups classified samples into fixations; subclasses do the classifying.
+    """
+
+    def __init__(self, min_duration=MIN_DURATION, rate=None):
+        """
+        Create a detector
+
+        :param min_duration: Shortest fixation in seconds
+        :param rate: Samples per second, None to estimate it from the first batch
+        """
+        self.min_duration = min_duration
+        self.rate = rate
+        self.history = None  # Samples kept to continue the windows into the next batch
+        self.decided = 0  # Of those, how many are classified already
+        self.open = None  # [start, last time, x sum, y sum, count, announced] of the fixation in progress
+
+    def _samples_for(self, seconds):
+        return max(int(round(seconds * self.rate)), 1)
+
+    def process(self, samples):
+        """
+        Detect fixations in the next samples
+
+        :param samples: SAMPLE_DTYPE array, in time order
+        :return: EVENT_DTYPE array of the events completed by these samples,
+                 in time order
+        """
+        if self.history is not None:
+            samples = np.concatenate([self.history, samples])
+        if not len(samples):
+            return np.empty(0, dtype=EVENT_DTYPE)
+        if self.rate is None:
+            if len(samples) < 2:
+                self.history = samples
+                return np.empty(0, dtype=EVENT_DTYPE)
+            self.rate = 1 / max(float(np.median(np.diff(samples["t"]))), 1e-6)
+
+        fixating, end, keep = self._classify(samples, self.decided)
+        events = self._group(samples[self.decided:end], fixating)
+        self.history = samples[keep:]
+        self.decided = end - keep
+        return events
+
+    def _classify(self, samples, first):
+        """
+        Classify samples
+
+        :param samples: Kept and new samples
+        :param first: Index of the first sample not classified yet
+        :return: Tuple of (boolean fixation mask of samples[first:end], end,
+                 index of the first sample to keep for the next batch)
+        """
+        raise NotImplementedError
+
+    def _group(self, samples, fixating):
+        if not len(samples):
+            return np.empty(0, dtype=EVENT_DTYPE)
+
+        # Runs of samples with the same classification
+        starts = np.flatnonzero(np.concatenate([[True], fixating[1:] != fixating[:-1]]))
+        ends = np.append(starts[1:], len(samples))
+        fixation = fixating[starts]
+        run_start = samples["t"][starts]
+        run_last = samples["t"][ends - 1]
+        sum_x = np.add.reduceat(samples["x"].astype(np.float64), starts)
+        sum_y = np.add.reduceat(samples["y"].astype(np.float64), starts)
+        count = (ends - starts).astype(np.float64)
+        announced = np.zeros(len(starts), dtype=bool)
+
+        # The fixation open at the end of the last batch goes on in the first
+        # run, or ended with the last batch
+        if self.open is not None:
+            start, last, x_sum, y_sum, n, was_announced = self.open
+            if fixation[0]:
+                run_start[0] = start
+                sum_x[0] += x_sum
+                sum_y[0] += y_sum
+                count[0] += n
+                announced[0] = was_announced
+            else:
+                fixation = np.concatenate([[True], fixation])
+                run_start = np.concatenate([[start], run_start])
+                run_last = np.concatenate([[last], run_last])
+                sum_x = np.concatenate([[x_sum], sum_x])
+                sum_y = np.concatenate([[y_sum], sum_y])
+                count = np.concatenate([[n], count])
+                announced = np.concatenate([[was_announced], announced])
+            self.open = None
+
+        long_enough = fixation & (run_last - run_start >= self.min_duration)
+        started = np.flatnonzero(long_enough & ~announced)
+        closed = fixation.copy()
+        if fixation[-1]:
+            # The last run may go on in the next batch
+            closed[-1] = False
+            self.open = [run_start[-1], run_last[-1], sum_x[-1], sum_y[-1], count[-1],
+                         announced[-1] or long_enough[-1]]
+        ended = np.flatnonzero(closed & long_enough)
+
+        order = np.concatenate([started, ended])
+        events = np.empty(len(order), dtype=EVENT_DTYPE)
+        events["kind"] = np.concatenate([np.full(len(started), FIXATION_START), np.full(len(ended), FIXATION_END)])
+        events["start"] = run_start[order]
+        events["duration"] = run_last[order] - run_start[order]
+        events["x"] = sum_x[order] / count[order]
+        events["y"] = sum_y[order] / count[order]
+        # Start events count from when the fixation reached the minimum duration
+        emitted = np.concatenate([run_start[started] + self.min_duration, run_last[ended]])
+        return events[np.argsort(emitted, kind="stable")]
+
+
+class IVTDetector(FixationDetector):
+    """
+    Velocity-threshold fixation detection.
+    """
+
+    def __init__(self, velocity_threshold=VELOCITY_THRESHOLD, span=VELOCITY_SPAN,
+                 min_duration=MIN_DURATION, rate=None):
+        """
+        Create a detector
+
+        :param velocity_threshold: Fastest fixation movement in points per second
+        :param span: Seconds over which velocity is measured
+        :param min_duration: Shortest fixation in seconds
+        :param rate: Samples per second, None to estimate it from the first batch
+        """
+        super().__init__(min_duration, rate)
+        self.velocity_threshold = velocity_threshold
+        self.span = span
+
+    def _classify(self, samples, first):
+        lag = self._samples_for(self.span)
+        current = np.arange(first, len(samples))
+        previous = np.maximum(current - lag, 0)
+        dt = samples["t"][current] - samples["t"][previous]
+        distance = np.hypot(samples["x"][current] - samples["x"][previous],
+                            samples["y"][current] - samples["y"][previous])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            velocity = np.where(dt > 0, distance / dt, 0.0)
+        return velocity < self.velocity_threshold, len(samples), max(len(samples) - lag, 0)
+
+
+class IDTDetector(FixationDetector):
+    """
+    Dispersion-threshold fixation detection over sliding windows.
+    """
+
+    def __init__(self, dispersion_threshold=DISPERSION_THRESHOLD, min_duration=MIN_DURATION, rate=None):
+        """
+        Create a detector
+
+        :param dispersion_threshold: Largest x plus y spread of a fixation in points
+        :param min_duration: Shortest fixation in seconds, also the window length
+        :param rate: Samples per second, None to estimate it from the first batch
+        """
+        super().__init__(min_duration, rate)
+        self.dispersion_threshold = dispersion_threshold
+
+    def _classify(self, samples, first):
+        width = max(self._samples_for(self.min_duration), 2)
+        count = len(samples)
+        if count < width:
+            return np.zeros(0, dtype=bool), first, 0
+
+        # Dispersion of every window of width samples, by start index
+        dispersion = _window_spread(samples["x"], width) + _window_spread(samples["y"], width)
+        tight = np.concatenate([[0], np.cumsum(dispersion <= self.dispersion_threshold)])
+
+        # A sample is in a fixation if any tight window covers it; that is
+        # known once every window covering it is complete
+        end = count - width + 1
+        if end <= first:
+            return np.zeros(0, dtype=bool), first, max(first - width + 1, 0)
+        index = np.arange(first, end)
+        fixating = tight[index + 1] - tight[np.maximum(index - width + 1, 0)] > 0
+        return fixating, end, max(end - width + 1, 0)
+
+
+def _window_spread(values, width):
+    # Max minus min of every window, from running extremes within blocks of
+    # width values (van Herk/Gil-Werman), so the cost does not grow with width
+    count = len(values)
+    blocks = np.concatenate([values, np.repeat(values[-1:], -count % width)]).reshape(-1, width)
+
+    def extreme(ufunc):
+        prefix = ufunc.accumulate(blocks, axis=1).ravel()
+        suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+        # A window starts in one block and ends in the same or the next one
+        return ufunc(suffix[:count - width + 1], prefix[width - 1:count])
+
+    return extreme(np.maximum) - extreme(np.minimum)
+
+
+def create_detector(method=None, **kwargs):
+    """
+    Create a fixation detector
+
+    :param method: "ivt" or "idt", None for READER_FIXATION_METHOD
+    :return: FixationDetector
+    """
+    method = method or DEFAULT_METHOD
+    if method == "ivt":
+        return IVTDetector(**kwargs)
+    if method == "idt":
+        return IDTDetector(**kwargs)
+    raise ValueError(f"Unknown fixation detection method: {method}")
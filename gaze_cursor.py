@@ -0,0 +1,160 @@
+"""
+Reading progress from gaze samples.
+
+GazeCursor runs batches of gaze samples through a streaming fixation
+detector and counts a line as read once a fixation lands on it, found with
+the spatial index of the page being read. Saccades sweeping over lines and
+tracker jitter therefore don't move the cursor. It only moves forward:
+looking back at earlier lines does not undo progress. The GUI collects the
+lines read once per frame with take_lines() and hands them to the line
+stream, which keeps the highlight or reveal in document order across pages.
+
+Samples can come from the gaze simulator or from a tracker through the
+gaze server; open_gaze_feed() picks the source.
+"""
+import os
+import threading
+
+from fixation_detector import create_detector
+from spatial_index import PageSpatialIndex
+
+# Address of the tracker input, e.g. udp://127.0.0.1:5555; empty for the simulator
+GAZE_INPUT = os.environ.get("READER_GAZE_INPUT", "")
+
+
+class GazeCursor:
+    """
+    Tracks the furthest line read on the current page from gaze samples.
+    """
+
+    def __init__(self, page_lines, page_count, method=None):
+        """
+        Create a stopped cursor
+
+        :param page_lines: Function returning the PageLineIndex of a page
+                           number, called on the GUI thread
+        :param page_count: Number of pages in the document
+        :param method: Fixation detection method ("ivt" or "idt"), None for
+                       READER_FIXATION_METHOD
+        """
+        self.page_lines = page_lines
+        self.page_count = page_count
+        self.method = method
+        self.lock = threading.Lock()
+        self.running = False
+        self.page_number = None  # Page being read
+        self.page = None  # PageLineIndex of that page
+        self.index = None  # PageSpatialIndex of that page
+        self.detector = None  # Fixation detector of the page being read
+        self.lines_read = 0  # Lines of the page passed by the gaze
+        self.lines_taken = 0  # Of those, lines handed to the GUI
+        self.page_done = False
+        self.finished = False  # Every page has been read
+        self.latest = None  # Most recent gaze sample
+        self.recorder = None  # SessionRecorder of the samples followed
+
+    def start(self, page_number=0, line_no=0):
+        """
+        Start following the gaze
+
+        :param page_number: Zero-based page to start on
+        :param line_no: Lines of that page already read
+        """
+        self.running = True
+        self.finished = False
+        self._read_page(page_number, line_no)
+
+    def stop(self):
+        self.running = False
+
+    def is_active(self):
+        return self.running
+
+    def _read_page(self, page_number, line_no=0):
+        page = self.page_lines(page_number)
+        index = PageSpatialIndex(page)
+        detector = create_detector(self.method)
+        with self.lock:
+            self.page_number = page_number
+            self.page = page
+            self.index = index
+            self.detector = detector
+            self.lines_read = self.lines_taken = line_no
+            self.page_done = not len(page)
+
+    def add_samples(self, samples, page_number=None):
+        """
+        Follow gaze samples on the page being read
+
+        :param samples: SAMPLE_DTYPE array in unrotated page points
+        :param page_number: Page the samples were taken on; they are dropped
+                            if the cursor moved on meanwhile. None for the
+                            current page.
+        """
+        if not len(samples):
+            return
+        with self.lock:
+            if page_number is not None and page_number != self.page_number:
+                return
+            self.latest = samples[-1]
+            if self.recorder is not None:
+                self.recorder.add_gaze(samples, self.page_number)
+            if self.page_done:
+                return
+            fixations = self.detector.process(samples)
+            if len(fixations):
+                lines = self.index.lines.query(fixations["x"], fixations["y"])
+                self.lines_read = max(self.lines_read, int(lines.max()) + 1)
+            self.page_done = self.lines_read >= len(self.page)
+
+    def finish_page(self, page_number=None):
+        """
+        Count the rest of the page as read
+
+        :param page_number: Page to finish; ignored if the cursor moved on.
+                            None for the current page.
+        """
+        with self.lock:
+            if page_number is None or page_number == self.page_number:
+                self.lines_read = len(self.page)
+                self.page_done = True
+
+    def take_lines(self):
+        """
+        Collect the reading progress since the last call (call from the GUI
+        thread once per frame), moving on to the next page when one is done
+
+        :return: Number of lines the gaze passed; these continue in document
+                 order across pages
+        """
+        with self.lock:
+            count = self.lines_read - self.lines_taken
+            self.lines_taken = self.lines_read
+            page_done = self.page_done
+        if page_done and self.running:
+            if self.page_number + 1 < self.page_count:
+                self._read_page(self.page_number + 1)
+            else:
+                self.finished = True
+                self.stop()
+        return count
+
+
+def open_gaze_feed(page_lines, page_count, recorder=None):
+    """
+    Create the gaze source for the readers: the tracker input named by
+    READER_GAZE_INPUT when set, otherwise the gaze simulator
+
+    :param page_lines: Function returning the PageLineIndex of a page number
+    :param page_count: Number of pages in the document
+    :param recorder: SessionRecorder to record the gaze samples with, if any
+    :return: Stopped GazeCursor
+    """
+    if GAZE_INPUT:
+        from gaze_server import TrackerFeed
+        feed = TrackerFeed(page_lines, page_count, GAZE_INPUT)
+    else:
+        from gaze_simulator import GazeFeed
+        feed = GazeFeed(page_lines, page_count)
+    feed.recorder = recorder
+    return feed
@@ -0,0 +1,110 @@
+"""
+Stand-in eye tracker for testing the gaze server.
+
+Simulates reading a PDF page by page with the gaze simulator and streams the
+samples in real time to a reader started with READER_GAZE_INPUT set to the
+same address:
+
+    READER_GAZE_INPUT=udp://127.0.0.1:5555 python highlight_final.py
+    python gaze_sender.py paper.pdf udp://127.0.0.1:5555 --rate 1000
+
+Open the same PDF in the reader and start following the gaze before
+starting the sender; both begin on the first page.
+"""
+import argparse
+import socket
+import sys
+import time
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from gaze_server import parse_address
+from gaze_simulator import GazeSimulator
+from page_stream import LineStream
+
+PAGE_TURN_SECONDS = 0.5  # Pause between pages, as when turning a page
+
+
+def connect(address):
+    """
+    Open a socket to a gaze server
+
+    :param address: Address of the server (see gaze_server.parse_address)
+    :return: Function sending bytes to the server
+    """
+    scheme, host, port = parse_address(address)
+    if scheme == "udp":
+        sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_DGRAM)
+        return lambda payload: sock.sendto(payload, (host, port))
+    if scheme == "tcp":
+        sock = socket.create_connection((host, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Don't hold samples back
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(host)
+    return sock.sendall
+
+
+def send_document(pdf_path, send, rate, per_packet, speed, seed):
+    """
+    Stream a simulated reading of a PDF
+
+    :param pdf_path: PDF to read
+    :param send: Function sending bytes to the server
+    :param rate: Samples per second
+    :param per_packet: Samples sent together in one packet
+    :param speed: Playback speed multiplier
+    :param seed: Random seed, None for a different reading every run
+    :return: Number of samples sent
+    """
+    doc = fitz.open(pdf_path)
+    stream = LineStream(doc)
+    rng = np.random.default_rng(seed)
+    clock_start = time.monotonic()
+    elapsed = 0.0  # Simulated seconds sent so far
+    sent = 0
+    try:
+        for page_number in range(len(doc)):
+            simulator = GazeSimulator(stream.page_lines(page_number), rate, rng=rng)
+            print(f"Page {page_number + 1}: {simulator.duration / speed:.1f}s")
+            while not simulator.finished:
+                samples, _ = simulator.next_batch(1.0)
+                # Timestamps advance in reading time, only the sending is sped up
+                send_times = clock_start + (elapsed + samples["t"]) / speed
+                samples["t"] += clock_start + elapsed
+                payload = memoryview(samples.tobytes())
+                for first in range(0, len(samples), per_packet):
+                    # Send each packet when its last sample would have been recorded
+                    last = min(first + per_packet, len(samples)) - 1
+                    delay = send_times[last] - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    send(payload[first * samples.itemsize:(last + 1) * samples.itemsize])
+                sent += len(samples)
+            elapsed += simulator.duration + PAGE_TURN_SECONDS
+    finally:
+        stream.close()
+        doc.close()
+    return sent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream simulated gaze samples to a reader.")
+    parser.add_argument("pdf", help="PDF to simulate reading")
+    parser.add_argument("address", help="udp://host:port, tcp://host:port or unix:///path")
+    parser.add_argument("--rate", type=int, default=1000, help="Samples per second (default: 1000)")
+    parser.add_argument("--per-packet", type=int, default=1, help="Samples per packet (default: 1)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed multiplier")
+    parser.add_argument("--seed", type=int, help="Random seed for a reproducible reading")
+    args = parser.parse_args(argv)
+
+    start = time.monotonic()
+    sent = send_document(args.pdf, connect(args.address), args.rate, args.per_packet, args.speed, args.seed)
+    seconds = time.monotonic() - start
+    print(f"Sent {sent} samples in {seconds:.1f}s ({sent / seconds:.0f} Hz)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
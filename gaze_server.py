@@ -0,0 +1,272 @@
+"""
+Local input server for eye trackers.
+
+Trackers (or recordings, or gaze_sender.py) send timestamped gaze samples
+to the reader over UDP, TCP or a Unix socket. A sample is 16 bytes, the
+little-endian SAMPLE_DTYPE record:
+
+    float64 t   timestamp in seconds (any monotonic clock)
+    float32 x   horizontal position in unrotated page points
+    float32 y   vertical position in unrotated page points
+
+A UDP datagram carries one or more whole samples, and a stream connection
+is just the records back to back. Mapping the tracker's screen coordinates
+onto the page is the sender's job.
+
+An asyncio loop on a background thread receives the samples and copies
+them into a GazeRingBuffer. The ring buffer is a preallocated array with a
+single writer (the server thread) and a single reader (the GUI thread),
+synchronized only by monotonically increasing counters. Stream
+connections and UDP datagrams are read straight into preallocated staging
+arrays (the UDP socket with recv_into on precomputed views, batching every
+datagram waiting), so no objects are created per sample or per datagram.
+TrackerFeed drains the ring buffer once per GUI frame into a GazeCursor.
+
+Addresses are written udp://host:port, tcp://host:port or unix:///path.
+"""
+import asyncio
+import os
+import socket
+import threading
+
+import numpy as np
+
+from gaze_cursor import GazeCursor
+from gaze_simulator import SAMPLE_DTYPE
+
+RING_CAPACITY = 1 << 16  # Samples buffered; a minute at 1 kHz
+STAGING_SAMPLES = 4096  # Samples read from a stream connection at once
+MAX_DATAGRAM = 1 << 16  # Bytes; larger than any UDP payload
+
+
+def parse_address(address):
+    """
+    Split a gaze input address
+
+    :param address: udp://host:port, tcp://host:port or unix:///path
+    :return: Tuple of (scheme, host, port), with the path as host and port
+             None for Unix sockets
+    """
+    scheme, _, rest = address.partition("://")
+    if scheme == "unix" and rest:
+        return scheme, rest, None
+    host, _, port = rest.rpartition(":")
+    if scheme not in ("udp", "tcp") or not host or not port.isdigit():
+        raise ValueError(f"Invalid gaze input address: {address}")
+    return scheme, host.strip("[]"), int(port)
+
+
+class GazeRingBuffer:
+    """
+    Fixed-size buffer of the most recent gaze samples.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.samples = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self.written = 0  # Samples written since creation, published after the data
+        self.read = 0  # Samples consumed by the reader
+        self.dropped = 0  # Samples overwritten before they were read
+
+    def write(self, samples):
+        """
+        Append samples, overwriting the oldest ones when full (writer thread only)
+
+        :param samples: SAMPLE_DTYPE array
+        """
+        count = len(samples)
+        if count > self.capacity:
+            samples = samples[count - self.capacity:]
+        # Only the newest samples are kept, at the position they end up in
+        position = (self.written + count - len(samples)) % self.capacity
+        first = min(len(samples), self.capacity - position)
+        self.samples[position:position + first] = samples[:first]
+        if first < len(samples):
+            self.samples[:len(samples) - first] = samples[first:]
+        self.written += count
+
+    def drain(self):
+        """
+        Take every sample written since the last call (reader thread only)
+
+        :return: SAMPLE_DTYPE array, oldest first
+        """
+        written = self.written
+        start = max(self.read, written - self.capacity)
+        self.dropped += start - self.read
+        position = start % self.capacity
+        count = written - start
+        if position + count <= self.capacity:
+            samples = self.samples[position:position + count].copy()
+        else:
+            samples = np.concatenate([self.samples[position:], self.samples[:position + count - self.capacity]])
+
+        # Samples the writer overwrote while they were copied are torn
+        torn = min(max(self.written - self.capacity - start, 0), count)
+        self.dropped += torn
+        self.read = written
+        return samples[torn:]
+
+
+class _DatagramReader:
+    # Reads datagrams with recv_into on a plain socket, as the asyncio
+    # datagram transports allocate a bytes object for each one
+    def __init__(self, sock, ring):
+        self.sock = sock
+        self.ring = ring
+        # Room for two datagrams, so one always fits after a partial batch
+        self.staging = np.zeros(2 * MAX_DATAGRAM // SAMPLE_DTYPE.itemsize, dtype=SAMPLE_DTYPE)
+        staging_bytes = memoryview(self.staging.view(np.uint8))
+        # A view starting at every sample the next datagram can land on
+        self.views = [staging_bytes[offset:] for offset in range(0, MAX_DATAGRAM, SAMPLE_DTYPE.itemsize)]
+
+    def read_ready(self):
+        filled = 0  # Whole samples in the staging array
+        while True:
+            try:
+                nbytes = self.sock.recv_into(self.views[filled])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break  # e.g. an ICMP error reported on the socket; the next read goes on
+            filled += nbytes // SAMPLE_DTYPE.itemsize
+            if filled >= len(self.views):
+                self.ring.write(self.staging[:filled])
+                filled = 0
+        if filled:
+            self.ring.write(self.staging[:filled])
+
+
+class _StreamProtocol(asyncio.BufferedProtocol):
+    def __init__(self, ring):
+        self.ring = ring
+        self.staging = np.zeros(STAGING_SAMPLES, dtype=SAMPLE_DTYPE)
+        self.staging_bytes = memoryview(self.staging.view(np.uint8))
+        self.filled = 0  # Bytes in the staging array, the last record maybe partial
+
+    def get_buffer(self, sizehint):
+        return self.staging_bytes[self.filled:]
+
+    def buffer_updated(self, nbytes):
+        self.filled += nbytes
+        complete = self.filled // SAMPLE_DTYPE.itemsize
+        self.ring.write(self.staging[:complete])
+        # Keep the start of a record split across reads
+        partial = self.filled - complete * SAMPLE_DTYPE.itemsize
+        self.staging_bytes[:partial] = self.staging_bytes[self.filled - partial:self.filled]
+        self.filled = partial
+
+
+class GazeServer:
+    """
+    Receives gaze samples into a ring buffer on a background thread.
+    """
+
+    def __init__(self, address, ring=None):
+        """
+        Create a stopped server
+
+        :param address: Address to listen on (see parse_address)
+        :param ring: GazeRingBuffer to fill, None for a new one
+        """
+        self.address = parse_address(address)
+        self.ring = ring or GazeRingBuffer()
+        self.loop = None
+        self.thread = None
+        self.closers = []
+
+    def start(self):
+        """
+        Start listening
+
+        :raises OSError: If the address cannot be bound
+        """
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._listen())
+        except Exception:
+            self.loop.close()
+            raise
+        self.thread = threading.Thread(target=self.loop.run_forever, name="gaze-server", daemon=True)
+        self.thread.start()
+
+    async def _listen(self):
+        scheme, host, port = self.address
+        if scheme == "udp":
+            family, kind, proto, _, address = (await self.loop.getaddrinfo(host, port, type=socket.SOCK_DGRAM))[0]
+            sock = socket.socket(family, kind, proto)
+            try:
+                sock.bind(address)
+            except OSError:
+                sock.close()
+                raise
+            sock.setblocking(False)
+            self.loop.add_reader(sock.fileno(), _DatagramReader(sock, self.ring).read_ready)
+
+            def close():
+                self.loop.remove_reader(sock.fileno())
+                sock.close()
+
+            self.closers.append(close)
+        elif scheme == "tcp":
+            server = await self.loop.create_server(lambda: _StreamProtocol(self.ring), host, port)
+            self.closers.append(server.close)
+        else:
+            if os.path.exists(host):
+                os.unlink(host)  # Left over by an earlier run
+            server = await self.loop.create_unix_server(lambda: _StreamProtocol(self.ring), host)
+            self.closers.append(server.close)
+
+    def stop(self):
+        """
+        Stop listening and end the background thread
+        """
+        if self.thread is None:
+            return
+
+        def shutdown():
+            for close in self.closers:
+                close()
+            self.loop.stop()
+
+        self.loop.call_soon_threadsafe(shutdown)
+        self.thread.join()
+        self.loop.close()
+        self.thread = None
+        self.closers = []
+
+
+class TrackerFeed(GazeCursor):
+    """
+    Follows the gaze samples a tracker sends to the gaze server.
+    """
+
+    def __init__(self, page_lines, page_count, address, method=None):
+        """
+        Create a stopped feed
+
+        :param page_lines: Function returning the PageLineIndex of a page
+                           number, called on the GUI thread
+        :param page_count: Number of pages in the document
+        :param address: Address to receive the samples on (see parse_address)
+        :param method: Fixation detection method, None for READER_FIXATION_METHOD
+        """
+        super().__init__(page_lines, page_count, method)
+        self.server = GazeServer(address)
+
+    def start(self, page_number=0, line_no=0):
+        """
+        Start listening and following the gaze
+
+        :raises OSError: If the address cannot be bound
+        """
+        self.server.start()
+        super().start(page_number, line_no)
+
+    def stop(self):
+        super().stop()
+        self.server.stop()
+
+    def take_lines(self):
+        self.add_samples(self.server.ring.drain())
+        return super().take_lines()
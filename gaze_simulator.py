@@ -0,0 +1,286 @@
+"""
+Simulated eye tracking over the words of a page.
+
+ReadingModel describes how a reader moves through text: lognormal fixation
+durations that grow with word length, skipped short words, refixated long
+words, regressions to earlier words, and saccades whose duration follows
+their amplitude. GazeSimulator turns a page's word boxes into a scanpath
+with that model and samples it at a tracker rate (60-1000 Hz) in vectorized
+NumPy batches. Gaze positions are in unrotated page coordinates, like the
+word boxes and line quads.
+
+GazeFeed runs a simulator on a background thread in real time, page after
+page, and follows its samples with a GazeCursor. Like a real tracker's
+output, the samples are placed on the page by position only. The GUI
+collects the reading progress once per frame with take_lines(), so sample
+handling never runs on the GUI thread whatever the sample rate.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from gaze_cursor import GazeCursor
+
+# One gaze sample: timestamp in seconds and position in page points
+SAMPLE_DTYPE = np.dtype([("t", "<f8"), ("x", "<f4"), ("y", "<f4")])
+
+DEFAULT_RATE = int(os.environ.get("READER_GAZE_RATE", 250))  # Samples per second
+FRAME_PERIOD = 1 / 30  # Seconds between the GUI's checks of the gaze progress
+
+
+class ReadingModel:
+    """
+    Parameters of the simulated reader.
+    """
+
+    def __init__(self, fixation_ms=225, fixation_sigma=0.35, ms_per_letter=8,
+                 skip_short=0.35, short_letters=3, refixate_long=0.3, long_letters=8,
+                 regression=0.1, max_regression_words=3, landing=0.4, landing_sd=0.15,
+                 saccade_ms=20, saccade_ms_per_point=0.12, noise_points=0.8):
+        """
+        Create a reading model; the defaults follow typical adult reading
+
+        :param fixation_ms: Median fixation duration on a five-letter word
+        :param fixation_sigma: Spread of the lognormal fixation durations
+        :param ms_per_letter: Extra fixation time per letter beyond five
+        :param skip_short: Probability of skipping a word of short_letters or less
+        :param short_letters: Longest word counted as short
+        :param refixate_long: Probability of a second fixation on a word of long_letters or more
+        :param long_letters: Shortest word counted as long
+        :param regression: Probability of a regression after a fixation
+        :param max_regression_words: Farthest a regression jumps back, in words
+        :param landing: Mean landing position as a fraction of the word width
+        :param landing_sd: Spread of the landing position
+        :param saccade_ms: Duration of a minimal saccade
+        :param saccade_ms_per_point: Added saccade duration per point of amplitude
+        :param noise_points: Standard deviation of the tracker noise in points
+        """
+        self.fixation_ms = fixation_ms
+        self.fixation_sigma = fixation_sigma
+        self.ms_per_letter = ms_per_letter
+        self.skip_short = skip_short
+        self.short_letters = short_letters
+        self.refixate_long = refixate_long
+        self.long_letters = long_letters
+        self.regression = regression
+        self.max_regression_words = max_regression_words
+        self.landing = landing
+        self.landing_sd = landing_sd
+        self.saccade_ms = saccade_ms
+        self.saccade_ms_per_point = saccade_ms_per_point
+        self.noise_points = noise_points
+
+
+class GazeSimulator:
+    """
+    Gaze samples of one simulated reading of a page.
+    """
+
+    def __init__(self, page_lines, rate=DEFAULT_RATE, model=None, rng=None, start_time=0.0, first_line=0):
+        """
+        Plan the scanpath over a page
+
+        :param page_lines: PageLineIndex of the page
+        :param rate: Samples per second
+        :param model: ReadingModel, None for the defaults
+        :param rng: numpy Generator, None for a fresh one
+        :param start_time: Timestamp of the first sample in seconds
+        :param first_line: Line to start reading at
+        """
+        self.page_lines = page_lines
+        self.first_line = first_line
+        self.rate = rate
+        self.model = model or ReadingModel()
+        self.rng = rng or np.random.default_rng()
+        self.start_time = start_time
+        self.next_sample = 0  # Index of the next sample to generate
+        self._plan()
+
+    def _plan(self):
+        model = self.model
+        rng = self.rng
+        word_lines = np.array(self.page_lines.word_lines(), dtype=np.int32)
+        keep = word_lines >= self.first_line
+        boxes = np.array([word[:4] for word in self.page_lines.words], dtype=np.float64).reshape(-1, 4)[keep]
+        letters = np.array([len(word[4]) for word in self.page_lines.words], dtype=np.int32)[keep]
+        word_lines = word_lines[keep]
+        count = len(word_lines)
+
+        # Short words are skipped, except where a line starts
+        line_start = np.ones(count, dtype=bool)
+        line_start[1:] = word_lines[1:] != word_lines[:-1]
+        fixated = line_start | ~((letters <= model.short_letters) & (rng.random(count) < model.skip_short))
+        words = np.flatnonzero(fixated)
+
+        # Each fixated word contributes a first fixation, maybe a refixation
+        # further into the word, and maybe a regression to an earlier word;
+        # sorting by (word, kind) puts them in reading order
+        refixated = words[(letters[words] >= model.long_letters)
+                          & (rng.random(len(words)) < model.refixate_long)]
+        regressing = words[(words > 0) & (rng.random(len(words)) < model.regression)]
+        back = rng.integers(1, model.max_regression_words + 1, len(regressing))
+        order = np.concatenate([words * 3, refixated * 3 + 1, regressing * 3 + 2])
+        target = np.concatenate([words, refixated, np.maximum(regressing - back, 0)])
+        landing = np.concatenate([
+            rng.normal(model.landing, model.landing_sd, len(words)),
+            rng.normal(model.landing + 0.35, model.landing_sd / 2, len(refixated)),
+            rng.normal(0.5, model.landing_sd * 1.5, len(regressing)),
+        ])
+        scale = np.concatenate([np.ones(len(words)), np.full(len(refixated), 0.8),
+                                np.full(len(regressing), 0.9)])
+        sort = np.argsort(order, kind="stable")
+        target, landing, scale = target[sort], np.clip(landing[sort], 0, 1), scale[sort]
+
+        box = boxes[target]
+        self.fix_x = box[:, 0] + landing * (box[:, 2] - box[:, 0])
+        self.fix_y = (box[:, 1] + box[:, 3]) / 2
+        self.fix_line = word_lines[target]
+
+        median = (model.fixation_ms + model.ms_per_letter * (letters[target] - 5)).clip(80) * scale
+        durations = median * np.exp(rng.normal(0, model.fixation_sigma, len(target))) / 1000
+        amplitude = np.hypot(np.diff(self.fix_x), np.diff(self.fix_y))
+        saccades = (model.saccade_ms + model.saccade_ms_per_point * amplitude) / 1000
+        self.fix_duration = durations
+        self.fix_start = np.concatenate([[0.0], np.cumsum(durations[:-1] + saccades)])
+        self.duration = self.fix_start[-1] + durations[-1] if len(target) else 0.0
+
+    def __len__(self):
+        """
+        Total number of samples of the reading
+        """
+        return int(np.ceil(self.duration * self.rate))
+
+    @property
+    def finished(self):
+        return self.next_sample >= len(self)
+
+    def next_batch(self, seconds):
+        """
+        Generate the next samples
+
+        :param seconds: Length of the batch in seconds
+        :return: Tuple of (SAMPLE_DTYPE array, line index of each sample or -1
+                 during saccades); empty once the page is read
+        """
+        first = self.next_sample
+        last = min(first + max(int(round(seconds * self.rate)), 1), len(self))
+        self.next_sample = last
+        elapsed = np.arange(first, last) / self.rate
+
+        # Find the fixation each sample falls in or the saccade that follows it
+        event = np.searchsorted(self.fix_start, elapsed, side="right") - 1
+        into = elapsed - self.fix_start[event]
+        fixating = into < self.fix_duration[event]
+        following = np.minimum(event + 1, len(self.fix_start) - 1)
+        gap = self.fix_start[following] - self.fix_start[event] - self.fix_duration[event]
+        progress = np.where(fixating, 0.0, (into - self.fix_duration[event]) / np.maximum(gap, 1e-9))
+        progress = progress * progress * (3 - 2 * progress)  # Eased saccade profile
+
+        samples = np.empty(len(elapsed), dtype=SAMPLE_DTYPE)
+        noise = self.rng.normal(0, self.model.noise_points, (2, len(elapsed)))
+        samples["t"] = self.start_time + elapsed
+        samples["x"] = self.fix_x[event] + (self.fix_x[following] - self.fix_x[event]) * progress + noise[0]
+        samples["y"] = self.fix_y[event] + (self.fix_y[following] - self.fix_y[event]) * progress + noise[1]
+        lines = np.where(fixating, self.fix_line[event], -1)
+        return samples, lines
+
+
+class GazeFeed(GazeCursor):
+    """
+    Runs simulated reading on a background thread, one page after the other.
+    """
+
+    def __init__(self, page_lines, page_count, rate=DEFAULT_RATE, model=None, speed=1.0,
+                 batch_seconds=0.05, method=None, seed=None):
+        """
+        Create a stopped feed
+
+        :param page_lines: Function returning the PageLineIndex of a page
+                           number, called on the GUI thread
+        :param page_count: Number of pages in the document
+        :param rate: Samples per second
+        :param model: ReadingModel, None for the defaults
+        :param speed: Playback speed multiplier (2 delivers the samples twice as fast)
+        :param batch_seconds: Simulated time generated per batch
+        :param method: Fixation detection method, None for READER_FIXATION_METHOD
+        :param seed: Random seed for a reproducible reading
+        """
+        super().__init__(page_lines, page_count, method)
+        self.rate = rate
+        self.model = model or ReadingModel()
+        self.speed = speed
+        self.batch_seconds = batch_seconds
+        self.rng = np.random.default_rng(seed)
+        self.wake = threading.Event()
+        self.thread = None
+        self.simulator = None  # GazeSimulator of the page being read, set by the GUI thread
+
+    def start(self, page_number=0, line_no=0):
+        """
+        Start reading
+
+        :param page_number: Zero-based page to start on
+        :param line_no: Lines of that page already read
+        """
+        self.stop()
+        super().start(page_number, line_no)
+        self.thread = threading.Thread(target=self._run, name="gaze-feed", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop reading and wait for the background thread
+        """
+        super().stop()
+        self.wake.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+
+    def _read_page(self, page_number, line_no=0):
+        simulator = GazeSimulator(self.page_lines(page_number), self.rate, self.model, self.rng,
+                                  first_line=line_no)
+        with self.lock:
+            self.simulator = simulator
+        super()._read_page(page_number, line_no)
+        self.wake.set()
+
+    def _run(self):
+        clock_start = time.monotonic()
+        simulated = 0.0  # Simulated seconds of the pages read before the current one
+        current = None
+        while self.running:
+            with self.lock:
+                simulator = self.simulator
+                page_number = self.page_number
+                waiting = self.page_done
+            if waiting:
+                # Wait for the GUI to hand over the next page, then carry on
+                # pacing from the moment it did
+                self.wake.wait()
+                self.wake.clear()
+                clock_start = time.monotonic() - (simulated + simulator.next_sample / self.rate) / self.speed
+                continue
+            if simulator is not current:
+                if current is not None:
+                    simulated += current.next_sample / self.rate
+                current = simulator
+
+            samples, _ = simulator.next_batch(self.batch_seconds)
+            # Timestamp the samples on the monotonic clock, like a tracker
+            # would; the timestamps advance in reading time, so a sped-up
+            # reading still has fixations of normal length
+            samples["t"] += clock_start + simulated
+
+            # Deliver the batch when its last sample would have been recorded
+            delay = clock_start + (simulated + simulator.next_sample / self.rate) / self.speed - time.monotonic()
+            if delay > 0 and self.wake.wait(delay):
+                self.wake.clear()
+            if not self.running:
+                break
+
+            self.add_samples(samples, page_number)
+            if simulator.finished:
+                self.finish_page(page_number)
@@ -1,84 +1,17 @@
-import fitz  # PyMuPDF
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
-import io  # For in-memory byte stream
+from PIL import ImageTk
+from document_loader import FAILED, PAGE, PREVIEW, READY, DocumentLoader
+from gaze_cursor import open_gaze_feed
+from gaze_simulator import FRAME_PERIOD
+from pacing import DeadlineScheduler, tk_arm
+from pdf_reader import PDFReader
+from sentence_index import DEFAULT_UNIT, LINE, UNITS
+from session_recording import NULL_RECORDER, SessionReplay, open_recorder
+import tracing
 
-class PDFReader:
-    def __init__(self, pdf_path):
-        """
-        Initialize PDF reader with the given PDF file
-        
-        :param pdf_path: Path to the PDF file
-        """
-        self.doc = fitz.open(pdf_path)
-        self.page_number = 0  # Start at the first page
-        self.page = self.doc.load_page(self.page_number)
-        self.lines = self.page.get_text("text").split('\n')
-        self.current_sentence = 0  # Start at the first sentence
-
-    def get_page_with_highlights(self):
-        """
-        Render the current page with existing highlights
-        
-        :return: PIL Image of the page
-        """
-        page = self.doc.load_page(self.page_number)
-        pix = page.get_pixmap()
-        img_data = pix.tobytes("ppm")  # Get image data as a byte string
-
-        # Use io.BytesIO to treat img_data as a file-like object
-        img_io = io.BytesIO(img_data)
-        img = Image.open(img_io)  # Open the image using PIL
-        return img
-
-    def highlight_sentence(self, sentence):
-        """
-        Highlight a specific sentence on the PDF page with bright yellow
-        
-        :param sentence: Sentence to highlight
-        """
-        # Search for the sentence on the page
-        text_instances = self.page.search_for(sentence)
-        
-        # If no text found, try partial matching
-        if not text_instances:
-            # Try finding partial matches
-            for line in self.lines:
-                if sentence.strip() in line.strip():
-                    text_instances = self.page.search_for(line)
-                    break
-        
-        # Add highlights for each text instance found
-        for inst in text_instances:
-            # Use bright yellow color for stroke/border
-            highlight = self.page.add_highlight_annot(inst)
-            highlight.set_colors(stroke=(1, 1, 0))  # Bright yellow border
-            highlight.update()
-
-    def next_sentences(self, num_lines):
-        """
-        Highlight the next specified number of lines
-        
-        :param num_lines: Number of lines to highlight
-        :return: True if lines were highlighted, False if no more lines
-        """
-        lines_highlighted = 0
-        while lines_highlighted < num_lines and self.current_sentence < len(self.lines):
-            sentence = self.lines[self.current_sentence]
-            self.highlight_sentence(sentence)
-            self.current_sentence += 1
-            lines_highlighted += 1
-        
-        return lines_highlighted > 0
-
-    def save_pdf(self, output_path):
-        """
-        Save the modified PDF
-        
-        :param output_path: Path to save the highlighted PDF
-        """
-        self.doc.save(output_path)
+SAVE_POLL_MS = 100  # How often the save progress is shown
+LOAD_POLL_MS = 20  # How often a PDF being opened is checked for a page to show
 
 class PDFHighlighterApp:
     def __init__(self, root):
@@ -91,6 +24,13 @@ class PDFHighlighterApp:
         self.root.title("PDF Sentence Highlighter")
         self.pdf_reader = None
         self.is_highlighting = False
+        self.scheduler = None  # Paces the highlight ticks
+        self.gaze = None  # Gaze feed, when highlighting follows it
+        self.recorder = NULL_RECORDER  # Records the session when READER_RECORD is set
+        self.replay = None  # Recorded session being played back
+        self.save_future = None  # Background save in progress
+        self.save_progress = 0.0  # Its completed fraction, set from the save thread
+        self.loader = None  # DocumentLoader of a PDF being opened
         
         # Configure root window to expand
         self.root.grid_rowconfigure(1, weight=1)
@@ -146,38 +86,165 @@ class PDFHighlighterApp:
         )
         self.save_btn.grid(row=0, column=6, padx=5)
 
+        # Follow Gaze Checkbox
+        self.gaze_var = tk.BooleanVar(value=False)
+        self.gaze_check = tk.Checkbutton(
+            top_frame, 
+            text="Follow Gaze", 
+            variable=self.gaze_var
+        )
+        self.gaze_check.grid(row=0, column=7, padx=5)
+
+        # Highlight Unit Selector (the gaze always advances by line)
+        tk.Label(top_frame, text="Highlight by:").grid(row=0, column=8, padx=2)
+        self.unit_var = tk.StringVar(value=DEFAULT_UNIT)
+        self.unit_menu = tk.OptionMenu(top_frame, self.unit_var, *UNITS)
+        self.unit_menu.grid(row=0, column=9, padx=5)
+
         # Canvas for PDF Preview
         self.canvas = tk.Canvas(self.root, width=600, height=800)
         self.canvas.grid(row=1, column=0, sticky='nsew', padx=10, pady=5)
 
     def select_pdf(self):
         """
-        Open file dialog to select a PDF
+        Open file dialog to select a PDF, or cancel the PDF being opened
         """
+        if self.loader is not None:
+            self.cancel_open()
+            return
+        
         pdf_path = filedialog.askopenfilename(
             title="Select PDF File", 
             filetypes=[("PDF files", "*.pdf")]
         )
         
         if pdf_path:
-            try:
-                self.pdf_reader = PDFReader(pdf_path)
-                self.update_canvas()
-                self.highlight_btn.config(state=tk.NORMAL)
-                self.save_btn.config(state=tk.NORMAL)
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not open PDF: {str(e)}")
+            self.open_document_async(pdf_path)
 
-    def update_canvas(self):
+    def close_document(self):
         """
-        Update the canvas with the current PDF page image
+        Close the open PDF and its session recording
+        """
+        self.recorder.close()
+        self.recorder = NULL_RECORDER
+        if self.pdf_reader:
+            self.pdf_reader.close()
+            self.pdf_reader = None
+        self.highlight_btn.config(state=tk.DISABLED)
+        self.save_btn.config(state=tk.DISABLED)
+
+    def open_document_async(self, pdf_path):
+        """
+        Open a PDF on a background thread, showing its first page as soon as
+        it is rendered, first blurry and then sharp
+        
+        :param pdf_path: Path to the PDF file, or a DocumentSource, mmap.mmap
+                         or bytes holding it
         """
-        img = self.pdf_reader.get_page_with_highlights()
-        img_tk = ImageTk.PhotoImage(img)
+        self.close_document()
         self.canvas.delete("all")
-        self.canvas.create_image(0, 0, image=img_tk, anchor=tk.NW)
+        self.select_pdf_btn.config(text="Cancel Opening")
+        # Rendered as get_page_with_highlights does, so the reader finds the
+        # page in the render cache
+        loader = self.loader = DocumentLoader(pdf_path, annots=False).start()
+        self.root.after(LOAD_POLL_MS, lambda: self.poll_open(loader))
+
+    def poll_open(self, loader):
+        """
+        Show what a background open has loaded so far, and the document once
+        it is ready
+        
+        :param loader: DocumentLoader of the PDF
+        """
+        if loader is not self.loader:
+            return  # Cancelled
+        for event, value in loader.take_events():
+            if event in (PREVIEW, PAGE):
+                self.show_image(value)
+            elif event == READY:
+                self.loader = None
+                self.select_pdf_btn.config(text="Select PDF")
+                self.open_document(*value)
+                return
+            elif event == FAILED:
+                self.loader = None
+                self.select_pdf_btn.config(text="Select PDF")
+                self.canvas.delete("all")
+                messagebox.showerror("Error", f"Could not open PDF: {value}")
+                return
+        self.root.after(LOAD_POLL_MS, lambda: self.poll_open(loader))
+
+    def cancel_open(self):
+        """
+        Stop opening the PDF being opened
+        """
+        self.loader.cancel()
+        self.loader = None
+        self.select_pdf_btn.config(text="Select PDF")
+        self.canvas.delete("all")
+
+    def open_document(self, pdf_path, first_page=None, record=True):
+        """
+        Open a PDF and show its first page
+        
+        :param pdf_path: Path to the PDF file, or a fitz.Document opened with
+                         document_source
+        :param first_page: PageLineIndex of the first page, if already extracted
+        :param record: Record the reading session when READER_RECORD is set
+        :return: True if the PDF was opened
+        """
+        try:
+            self.close_document()
+            self.pdf_reader = PDFReader(pdf_path, first_page=first_page)
+            if record:
+                source = self.pdf_reader.source
+                self.recorder = open_recorder("highlight", source.name, len(self.pdf_reader.doc), source.digest())
+                self.pdf_reader.recorder = self.recorder
+            self.update_canvas()
+            self.highlight_btn.config(state=tk.NORMAL)
+            self.save_btn.config(state=tk.NORMAL)
+            return True
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open PDF: {str(e)}")
+            return False
+
+    def update_canvas(self):
+        """
+        Redraw the canvas with the current PDF page image and all highlights
+        """
+        self.show_image(self.pdf_reader.get_page_with_highlights())
+        self.draw_highlights(range(len(self.pdf_reader.highlights)))
+
+    def show_image(self, img):
+        """
+        Show a page image on the canvas
+        
+        :param img: PIL Image of the page
+        """
+        with tracing.span("photoimage"):
+            img_tk = ImageTk.PhotoImage(img)
+        with tracing.span("canvas_update"):
+            self.canvas.delete("all")
+            self.canvas.create_image(0, 0, image=img_tk, anchor=tk.NW)
         self.canvas.image = img_tk  # Store reference to prevent garbage collection
 
+    def draw_highlights(self, indices):
+        """
+        Patch newly highlighted lines into the displayed page image without
+        re-rendering the page
+        
+        :param indices: Line indices to draw
+        """
+        patch = self.pdf_reader.get_highlight_patch(indices)
+        if patch is None:
+            return
+        x, y, img = patch
+        with tracing.span("photoimage"):
+            patch_tk = ImageTk.PhotoImage(img)
+        with tracing.span("canvas_update"):
+            # Copy only the changed region into the page image shown on the canvas
+            self.canvas.tk.call(str(self.canvas.image), "copy", str(patch_tk), "-to", x, y)
+
     def toggle_highlighting(self):
         """
         Toggle highlighting on and off
@@ -193,6 +260,8 @@ class PDFHighlighterApp:
                 self.lines_entry.config(state=tk.DISABLED)
                 self.delay_entry.config(state=tk.DISABLED)
                 self.select_pdf_btn.config(state=tk.DISABLED)
+                self.gaze_check.config(state=tk.DISABLED)
+                self.unit_menu.config(state=tk.DISABLED)
                 
                 # Change button text
                 self.highlight_btn.config(text="Stop Highlighting")
@@ -201,18 +270,36 @@ class PDFHighlighterApp:
                 self.is_highlighting = True
                 
                 # Start highlighting
-                self.highlight_with_delay(lines_per_iteration, delay)
+                if self.gaze_var.get():
+                    self.pdf_reader.set_unit(LINE)
+                    self.recorder.start(self.pdf_reader.stream.position, gaze=True)
+                    self.highlight_with_gaze()
+                else:
+                    self.pdf_reader.set_unit(self.unit_var.get())
+                    self.recorder.start(self.pdf_reader.stream.position, lines_per_iteration, delay,
+                                        unit=self.unit_var.get())
+                    self.highlight_with_delay(lines_per_iteration, delay)
 
             except ValueError:
                 messagebox.showerror("Error", "Invalid input. Please enter valid numbers.")
         else:
             # Stop highlighting
             self.is_highlighting = False
+            if self.scheduler:
+                self.scheduler.stop()
+                if tracing.enabled():
+                    print(f"Highlight pacing: {self.scheduler.summary()}")
+            if self.gaze:
+                self.gaze.stop()
+            self.recorder.stop()
+            self.replay = None
             
             # Re-enable inputs
             self.lines_entry.config(state=tk.NORMAL)
             self.delay_entry.config(state=tk.NORMAL)
             self.select_pdf_btn.config(state=tk.NORMAL)
+            self.gaze_check.config(state=tk.NORMAL)
+            self.unit_menu.config(state=tk.NORMAL)
             
             # Reset button text
             self.highlight_btn.config(text="Start Highlighting")
@@ -224,20 +311,130 @@ class PDFHighlighterApp:
         :param lines_per_iteration: Number of lines to highlight in each iteration
         :param delay: Delay between iterations in seconds
         """
+        # Ticks follow absolute deadlines, so the time spent highlighting and
+        # drawing does not add to the delay
+        self.scheduler = DeadlineScheduler(
+            delay, lambda: self.highlight_next(lines_per_iteration), tk_arm(self.root))
+        self.scheduler.start()
+
+    def highlight_with_gaze(self):
+        """
+        Highlight lines as the gaze reads past them
+        """
+        # Gaze samples are simulated or received on a background thread; the
+        # GUI only collects the lines read so far, once per frame
+        self.gaze = open_gaze_feed(self.pdf_reader.stream.page_lines, len(self.pdf_reader.doc),
+                                   self.recorder)
+        try:
+            self.gaze.start(*self.pdf_reader.stream.position)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not receive gaze input: {str(e)}")
+            self.toggle_highlighting()
+            return
+        self.scheduler = DeadlineScheduler(FRAME_PERIOD, self.highlight_gazed, tk_arm(self.root))
+        self.scheduler.start()
+
+    def highlight_gazed(self):
+        """
+        Highlight the lines the gaze passed since the last frame (one scheduler tick)
+        
+        :return: False once highlighting is finished or stopped
+        """
+        if not self.is_highlighting:
+            return False
+        
+        count = self.gaze.take_lines()
+        if count:
+            return self.highlight_next(count)
+        if self.gaze.finished:
+            self.finish_highlighting()
+            return False
+        return True
+
+    def highlight_next(self, lines_per_iteration):
+        """
+        Highlight the next lines (one scheduler tick)
+        
+        :param lines_per_iteration: Number of lines to highlight
+        :return: False once highlighting is finished or stopped
+        """
         # Check if highlighting should continue
         if not self.is_highlighting:
+            return False
+
+        page_number = self.pdf_reader.page_number
+        with tracing.span("tick"):
+            with tracing.span("line_lookup"):
+                highlighted = self.pdf_reader.next_sentences(lines_per_iteration)
+            if highlighted:
+                if self.pdf_reader.page_number != page_number:
+                    self.update_canvas()  # Show the page the cursor moved onto
+                else:
+                    self.draw_highlights(highlighted)
+        
+        if not highlighted:
+            self.finish_highlighting()
+            return False
+        return True
+
+    def replay_session(self, session, speed=1.0):
+        """
+        Highlight the recorded document as it was highlighted in a session
+        
+        :param session: Session from session_recording.load_session
+        :param speed: Playback speed multiplier
+        """
+        if not self.open_document(session.document, record=False):
             return
+        self.lines_entry.config(state=tk.DISABLED)
+        self.delay_entry.config(state=tk.DISABLED)
+        self.select_pdf_btn.config(state=tk.DISABLED)
+        self.gaze_check.config(state=tk.DISABLED)
+        self.unit_menu.config(state=tk.DISABLED)
+        self.highlight_btn.config(text="Stop Highlighting")
+        self.is_highlighting = True
+        self.pdf_reader.set_unit(LINE)  # Until the recording's first step says otherwise
+        self.unit_var.set(LINE)
+        
+        # Recorded ticks are replayed by the frame, however fast they came
+        self.replay = SessionReplay(session, self.replay_units, speed=speed)
+        self.replay.start()
+        self.scheduler = DeadlineScheduler(FRAME_PERIOD, self.replay_next, tk_arm(self.root))
+        self.scheduler.start()
 
-        if self.pdf_reader.next_sentences(lines_per_iteration):
-            self.update_canvas()
-            
-            # Schedule next highlighting iteration
-            self.root.after(int(delay * 1000), 
-                            lambda: self.highlight_with_delay(lines_per_iteration, delay))
-        else:
-            # Highlighting complete
-            self.toggle_highlighting()
-            messagebox.showinfo("Complete", "PDF highlighting finished!")
+    def replay_units(self, count, unit):
+        """
+        Highlight recorded units in the unit the participant was shown
+        
+        :param count: Number of units to highlight
+        :param unit: LINE, CLAUSE or SENTENCE
+        :return: False once highlighting is finished or stopped
+        """
+        if unit != self.pdf_reader.unit:
+            self.pdf_reader.set_unit(unit)
+            self.unit_var.set(unit)
+        return self.highlight_next(count)
+
+    def replay_next(self):
+        """
+        Highlight the lines of the recorded ticks due by now (one scheduler tick)
+        
+        :return: False once the replay is finished or stopped
+        """
+        if not self.is_highlighting:
+            return False
+        if self.replay.tick():
+            return True
+        if self.is_highlighting:
+            self.toggle_highlighting()  # The recording ended before the document
+        return False
+
+    def finish_highlighting(self):
+        """
+        Stop highlighting once every line is highlighted
+        """
+        self.toggle_highlighting()
+        messagebox.showinfo("Complete", "PDF highlighting finished!")
 
     def save_pdf(self):
         """
@@ -249,14 +446,50 @@ class PDFHighlighterApp:
                 filetypes=[("PDF files", "*.pdf")]
             )
             if output_path:
-                try:
-                    self.pdf_reader.save_pdf(output_path)
-                    messagebox.showinfo("Success", f"PDF saved to {output_path}")
-                except Exception as e:
-                    messagebox.showerror("Error", f"Could not save PDF: {str(e)}")
+                # The document must stay untouched while the save thread
+                # writes it, so highlighting stops and the controls that
+                # would use it are disabled until the save is done
+                if self.is_highlighting:
+                    self.toggle_highlighting()
+                self.select_pdf_btn.config(state=tk.DISABLED)
+                self.highlight_btn.config(state=tk.DISABLED)
+                self.save_btn.config(state=tk.DISABLED, text="Saving... 0%")
+                self.save_progress = 0.0
+                self.save_future = self.pdf_reader.save_pdf_async(output_path, progress=self.set_save_progress)
+                self.root.after(SAVE_POLL_MS, lambda: self.poll_save(output_path))
         else:
             messagebox.showwarning("Warning", "No PDF loaded.")
 
+    def set_save_progress(self, done, total):
+        """
+        Note the save progress (called on the save thread)
+        
+        :param done: Steps completed
+        :param total: Total steps
+        """
+        self.save_progress = done / total
+
+    def poll_save(self, output_path):
+        """
+        Show the progress of the background save, and its result once done
+        
+        :param output_path: Path the PDF is saved to
+        """
+        if not self.save_future.done():
+            self.save_btn.config(text=f"Saving... {self.save_progress:.0%}")
+            self.root.after(SAVE_POLL_MS, lambda: self.poll_save(output_path))
+            return
+        
+        future, self.save_future = self.save_future, None
+        self.select_pdf_btn.config(state=tk.NORMAL)
+        self.highlight_btn.config(state=tk.NORMAL)
+        self.save_btn.config(state=tk.NORMAL, text="Save Highlighted PDF")
+        try:
+            future.result()
+            messagebox.showinfo("Success", f"PDF saved to {output_path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not save PDF: {str(e)}")
+
 def main():
     root = tk.Tk()
     root.geometry("800x900")  # Set a default window size
@@ -0,0 +1,107 @@
+import fitz  # PyMuPDF
+
+# Bump whenever the extraction below changes, so cached tables are rebuilt
+EXTRACTOR_VERSION = 1
+
+
+class PageLineIndex:
+    """
+    Table of the text lines on a single PDF page.
+
+    Built once from one structured extraction, so line i maps directly to the
+    quads it occupies on the page without searching the page text again.
+    """
+
+    def __init__(self, page_number, lines, quads, layout, words):
+        """
+        Create a line table from already extracted data
+
+        :param page_number: Zero-based page number
+        :param lines: Text of each line, in layout order
+        :param quads: fitz.Quad list for each line
+        :param layout: (block number, line number in block) of each line
+        :param words: Word tuples (x0, y0, x1, y1, text, block, line, word) as
+                      returned by get_text("words")
+        """
+        self.page_number = page_number
+        self.lines = lines
+        self.quads = quads
+        self.layout = layout
+        self.words = words
+
+    @classmethod
+    def extract(cls, page):
+        """
+        Build the line table for a page
+
+        :param page: fitz.Page to index
+        :return: PageLineIndex
+        """
+        lines = []
+        quads = []
+        layout = []
+
+        # Text-only flags skip decoding the page images we don't need; the
+        # words use the same flags so their block/line numbers match
+        text_dict = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)
+        for block in text_dict["blocks"]:
+            for line_no, line in enumerate(block.get("lines", ())):
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                if not text:
+                    continue
+                lines.append(text)
+                quads.append([fitz.recover_line_quad(line)])
+                layout.append((block["number"], line_no))
+
+        words = page.get_text("words", flags=fitz.TEXTFLAGS_TEXT)
+        return cls(page.number, lines, quads, layout, words)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def line_quads(self, index):
+        """
+        Get the quads covering a line
+
+        :param index: Index of the line in the table
+        :return: List of fitz.Quad for the line
+        """
+        return self.quads[index]
+
+    def word_lines(self):
+        """
+        Map each word to the line it belongs to
+
+        :return: List with the line index of each word, or -1 if the word's
+                 line is not in the table
+        """
+        line_of = {key: index for index, key in enumerate(self.layout)}
+        return [line_of.get((word[5], word[6]), -1) for word in self.words]
+
+    def to_data(self):
+        """
+        Convert the table to plain lists and numbers for storage
+
+        :return: JSON-serializable dict
+        """
+        return {
+            "lines": self.lines,
+            "quads": [[[tuple(point) for point in quad] for quad in line_quads]
+                      for line_quads in self.quads],
+            "layout": self.layout,
+            "words": self.words,
+        }
+
+    @classmethod
+    def from_data(cls, page_number, data):
+        """
+        Rebuild a table stored with to_data
+
+        :param page_number: Zero-based page number
+        :param data: Dict returned by to_data
+        :return: PageLineIndex
+        """
+        quads = [[fitz.Quad(*quad) for quad in line_quads] for line_quads in data["quads"]]
+        layout = [tuple(key) for key in data["layout"]]
+        words = [tuple(word) for word in data["words"]]
+        return cls(page_number, data["lines"], quads, layout, words)
@@ -0,0 +1,160 @@
+"""
+Drift-free pacing for the reading loops.
+
+Re-arming a timer for `delay` after each tick finishes makes the real pace
+delay + work time. DeadlineScheduler instead keeps absolute deadlines on the
+monotonic clock (start, start + period, start + 2 * period, ...) and arms
+the GUI timer for whatever is left until the next one. When a tick overruns
+its period, the policy decides what happens to the deadlines it missed:
+
+- "skip": drop them and stay on the original grid
+- "catch_up": run them back to back until the schedule is caught up
+- "stretch": run the next tick right away and re-anchor the grid there
+
+The default policy can be set with READER_PACING_POLICY.
+"""
+import math
+import os
+import time
+from collections import deque
+
+SKIP = "skip"
+CATCH_UP = "catch_up"
+STRETCH = "stretch"
+POLICIES = (SKIP, CATCH_UP, STRETCH)
+DEFAULT_POLICY = os.environ.get("READER_PACING_POLICY", SKIP)
+
+
+def tk_arm(root):
+    """
+    Timer function for DeadlineScheduler backed by Tk's after()
+
+    :param root: Tk widget whose event loop runs the ticks
+    """
+    return lambda delay, callback: root.after(max(0, round(delay * 1000)), callback)
+
+
+def qt_arm(delay, callback):
+    """
+    Timer function for DeadlineScheduler backed by a precise QTimer
+    """
+    from PyQt5.QtCore import Qt, QTimer
+
+    QTimer.singleShot(max(0, round(delay * 1000)), Qt.PreciseTimer, callback)
+
+
+class DeadlineScheduler:
+    """
+    Calls a tick function on a fixed period measured from absolute deadlines.
+    """
+
+    def __init__(self, period, tick, arm, policy=None, clock=time.monotonic, history=1000):
+        """
+        Create a stopped scheduler
+
+        :param period: Seconds between ticks
+        :param tick: Function called on each tick; returning False stops the scheduler
+        :param arm: Function (delay seconds, callback) that runs callback once
+                    after the delay in the GUI event loop, e.g. tk_arm(root) or qt_arm
+        :param policy: SKIP, CATCH_UP or STRETCH for ticks that overrun the period
+        :param clock: Monotonic clock in seconds
+        :param history: Number of recent ticks kept for the statistics
+        """
+        policy = policy or DEFAULT_POLICY
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown pacing policy: {policy}")
+        self.period = period
+        self.tick = tick
+        self.arm = arm
+        self.policy = policy
+        self.clock = clock
+        self.running = False
+        self.generation = 0  # Invalidates callbacks armed before a stop/start
+        self.next_deadline = None
+        self.lateness = deque(maxlen=history)  # Seconds each tick fired after its deadline
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+
+    def start(self, immediate=True):
+        """
+        Start ticking, with fresh statistics
+
+        :param immediate: Run the first tick right away instead of after one period
+        """
+        self.stop()
+        self.lateness.clear()
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.running = True
+        self.next_deadline = self.clock() + (0 if immediate else self.period)
+        self._arm()
+
+    def stop(self):
+        """
+        Stop ticking; a tick already armed in the event loop is ignored
+        """
+        self.running = False
+        self.generation += 1
+
+    def is_active(self):
+        return self.running
+
+    def _arm(self):
+        generation = self.generation
+        delay = self.next_deadline - self.clock()
+        self.arm(delay, lambda: self._fire(generation))
+
+    def _fire(self, generation):
+        if not self.running or generation != self.generation:
+            return
+        self.lateness.append(self.clock() - self.next_deadline)
+        self.ticks += 1
+
+        if self.tick() is False:
+            self.stop()
+        if not self.running:
+            return
+
+        self.next_deadline += self.period
+        now = self.clock()
+        if now > self.next_deadline:
+            self.overruns += 1
+            if self.policy == SKIP:
+                missed = math.ceil((now - self.next_deadline) / self.period)
+                self.next_deadline += missed * self.period
+                self.skipped += missed
+            elif self.policy == STRETCH:
+                self.next_deadline = now
+            # CATCH_UP keeps the missed deadline, so the next tick runs at once
+        self._arm()
+
+    def stats(self):
+        """
+        Get the timing statistics of the recent ticks
+
+        :return: Dict with tick, overrun and skip counts, and mean, p99 and
+                 jitter (standard deviation) of the lateness in milliseconds
+        """
+        late = sorted(self.lateness)
+        stats = {"ticks": self.ticks, "overruns": self.overruns, "skipped": self.skipped,
+                 "policy": self.policy}
+        if late:
+            mean = sum(late) / len(late)
+            stats["late_mean_ms"] = mean * 1000
+            stats["late_p99_ms"] = late[min(int(0.99 * len(late)), len(late) - 1)] * 1000
+            stats["jitter_ms"] = math.sqrt(sum((x - mean) ** 2 for x in late) / len(late)) * 1000
+        return stats
+
+    def summary(self):
+        """
+        Describe the timing statistics in one line
+        """
+        stats = self.stats()
+        if "late_mean_ms" not in stats:
+            return f"{stats['ticks']} ticks"
+        return (f"{stats['ticks']} ticks at {self.period:.3f}s ({self.policy}): "
+                f"late mean {stats['late_mean_ms']:.1f} ms, p99 {stats['late_p99_ms']:.1f} ms, "
+                f"jitter {stats['jitter_ms']:.1f} ms, {stats['overruns']} overruns, "
+                f"{stats['skipped']} skipped")
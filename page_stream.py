@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from document_source import source_of
+from extraction_cache import shared_extraction_cache
+from line_index import PageLineIndex
+
+
+class LineStream:
+    """
+    Lazy stream of the text lines of a whole document.
+
+    Pages are extracted only as the reading cursor reaches them. When the
+    cursor gets close to the end of a page, the next page is extracted on a
+    background thread, and only a small window of extracted pages is kept.
+    Page tables of files are read from the extraction cache when available.
+    """
+
+    def __init__(self, doc, window=3, prefetch_lines=5, cache=None):
+        """
+        Create a line stream over a document
+
+        :param doc: Open fitz.Document
+        :param window: Number of extracted pages to keep in memory
+        :param prefetch_lines: Lines left on a page when the next page is prefetched
+        :param cache: ExtractionCache to use, None for the shared one or False
+                      to always extract
+        """
+        self.doc = doc
+        self.source = source_of(doc)  # Opens the background thread's handle
+        self.cache = shared_extraction_cache() if cache is None else cache
+        self.digest = None  # Content hash of the document, the extraction cache key
+        if self.cache and self.source is not None:
+            self.digest = self.source.digest(self.cache)
+        self.window = window
+        self.prefetch_lines = prefetch_lines
+        self.pages = OrderedDict()  # Page number -> PageLineIndex, oldest first
+        self.pending = {}  # Page number -> Future of a background extraction
+        self.exhausted = False
+        self.position = (0, 0)  # (page number, lines of it taken so far)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.worker_doc = None  # Document handle owned by the background thread
+        self.closed = False
+        self.lines = self._iter_lines()
+
+    def _iter_lines(self):
+        for page_number in range(len(self.doc)):
+            page_lines = self.page_lines(page_number)
+            for line_no in range(len(page_lines)):
+                if len(page_lines) - line_no <= self.prefetch_lines:
+                    self.prefetch(page_number + 1)
+                self.position = (page_number, line_no + 1)
+                yield page_lines, line_no
+        self.exhausted = True
+
+    def take(self, count):
+        """
+        Advance the cursor by a number of lines
+
+        :param count: Number of lines to take
+        :return: List of (PageLineIndex, line index) tuples, shorter than count
+                 once the end of the document is reached
+        """
+        return list(islice(self.lines, count))
+
+    def advance_to(self, page_number, line_count):
+        """
+        Advance the cursor until a number of lines of a page are taken
+
+        :param page_number: Zero-based page number
+        :param line_count: Lines of that page to have taken, at least 1
+        :return: List of (PageLineIndex, line index) tuples taken, empty if
+                 the cursor is already there
+        """
+        entries = []
+        while self.position < (page_number, line_count):
+            entry = next(self.lines, None)
+            if entry is None:
+                break
+            entries.append(entry)
+        return entries
+
+    def page_lines(self, page_number):
+        """
+        Get the line table of a page, extracting it if needed
+
+        :param page_number: Zero-based page number
+        :return: PageLineIndex of the page
+        """
+        if page_number in self.pages:
+            self.pages.move_to_end(page_number)
+            return self.pages[page_number]
+
+        future = self.pending.pop(page_number, None)
+        if future is not None:
+            page_lines = future.result()
+        else:
+            page_lines = self._page_lines_of(self.doc[page_number])
+        self.keep_page(page_lines)
+        return page_lines
+
+    def keep_page(self, page_lines):
+        """
+        Add a page table extracted elsewhere, such as by a DocumentLoader
+
+        :param page_lines: PageLineIndex of a page of this document
+        """
+        self.pages[page_lines.page_number] = page_lines
+        self.pages.move_to_end(page_lines.page_number)
+        while len(self.pages) > self.window:
+            self.pages.popitem(last=False)
+
+    def prefetch(self, page_number):
+        """
+        Start extracting a page in the background
+
+        :param page_number: Zero-based page number
+        """
+        if (page_number >= len(self.doc) or page_number in self.pages
+                or page_number in self.pending or self.source is None):
+            return
+        self.pending[page_number] = self.executor.submit(self._extract, page_number)
+
+    def _extract(self, page_number):
+        # MuPDF documents are not thread-safe, so the worker reads its own handle
+        if self.worker_doc is None:
+            self.worker_doc = self.source.open()
+        return self._page_lines_of(self.worker_doc[page_number])
+
+    def _page_lines_of(self, page):
+        if self.digest is None:
+            return PageLineIndex.extract(page)
+        return self.cache.page_lines(page, self.digest)
+
+    def _close_worker_doc(self):
+        if self.worker_doc is not None:
+            self.worker_doc.close()
+            self.worker_doc = None
+
+    def close(self):
+        """
+        Stop the background extraction thread, without waiting for it; its
+        document handle is closed once the running extraction is done
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        # The single worker runs its tasks in order, so this comes last
+        self.executor.submit(self._close_worker_doc)
+        self.executor.shutdown(wait=False)
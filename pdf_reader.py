@@ -0,0 +1,338 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageChops, ImageDraw
+from document_source import open_document, source_of
+from page_stream import LineStream
+from render_adapter import pixmap_to_image
+from render_cache import document_fingerprint, shared_cache
+from sentence_index import DEFAULT_UNIT, LINE, UNITS, PageSentenceIndex
+from session_recording import NULL_RECORDER
+import tracing
+
+HIGHLIGHT_COLOR = (1, 1, 0)  # Bright yellow
+HIGHLIGHT_RGB = tuple(int(c * 255) for c in HIGHLIGHT_COLOR)
+
+# Save options: garbage collection level (0-4) and whether to compress streams
+SAVE_GARBAGE = int(os.environ.get("READER_SAVE_GARBAGE", 1))
+SAVE_DEFLATE = os.environ.get("READER_SAVE_DEFLATE", "1") != "0"
+
+class PDFReader:
+    def __init__(self, pdf_path, unit=DEFAULT_UNIT, first_page=None):
+        """
+        Initialize PDF reader with the given PDF file
+        
+        :param pdf_path: Path to the PDF file, a DocumentSource, mmap.mmap or
+                         bytes holding it, or a fitz.Document opened from one
+                         of these (the reader then owns it)
+        :param unit: Unit to highlight at a time: LINE, CLAUSE or SENTENCE
+        :param first_page: PageLineIndex of the first page, if already extracted
+        """
+        self.doc = pdf_path if isinstance(pdf_path, fitz.Document) else open_document(pdf_path)
+        self.source = source_of(self.doc)  # Where the PDF was read from
+        self.fingerprint = document_fingerprint(self.doc)  # Render cache key
+        self.stream = LineStream(self.doc)  # Lines of every page, extracted lazily
+        if first_page is not None:
+            self.stream.keep_page(first_page)
+        self.matrix = fitz.Matrix(1, 1)  # Page-to-image transform of the render
+        self.pending_annotations = []  # (page number, block, quads) not yet written to the PDF
+        self.save_executor = None  # Thread for background saves, started on first use
+        self.recorder = NULL_RECORDER  # SessionRecorder of the lines highlighted
+        self.unit = LINE
+        self.load_page(0)  # Start at the first page
+        self.set_unit(unit)
+
+    def load_page(self, page_number, line_index=None):
+        """
+        Make a page the current one
+        
+        :param page_number: Zero-based page number
+        :param line_index: PageLineIndex of the page, if already extracted
+        """
+        self.page_number = page_number
+        self.page = self.doc.load_page(page_number)
+        self.line_index = line_index or self.stream.page_lines(page_number)
+        self.lines = self.line_index.lines
+        self.sentences = None  # PageSentenceIndex of the page, built for clause and sentence units
+        self.current_sentence = 0  # Next unit to highlight on this page
+        self.highlights = []  # fitz.Quad lists highlighted on this page, in order
+        self.page_image = None  # Cached render of the page without highlights
+        self.highlight_areas = {}  # Highlight number -> fitz.IRect list in the page render
+
+    def sentence_index(self):
+        """
+        Get the sentences and clauses of the current page, splitting them on
+        first use
+        
+        :return: PageSentenceIndex
+        """
+        if self.sentences is None:
+            self.sentences = PageSentenceIndex(self.line_index)
+        return self.sentences
+
+    def set_unit(self, unit):
+        """
+        Change the unit highlighted at a time, going on from the first unit
+        that starts after the lines highlighted so far
+        
+        :param unit: LINE, CLAUSE or SENTENCE
+        """
+        if unit not in UNITS:
+            raise ValueError(f"Unknown highlight unit: {unit}")
+        self.unit = unit
+        page_number, lines_taken = self.stream.position
+        if page_number != self.page_number:
+            lines_taken = 0
+        if unit == LINE:
+            self.current_sentence = lines_taken
+        else:
+            self.current_sentence = self.sentence_index().unit_at_line(unit, lines_taken)
+
+    def get_page_with_highlights(self):
+        """
+        Render the current page once; highlights are composited on top of it
+        by the viewer with get_highlight_patch
+        
+        :return: PIL Image of the page
+        """
+        if self.page_image is None:
+            with tracing.span("rasterize"):
+                pix = shared_cache.render(self.page, self.matrix, annots=False,
+                                          fingerprint=self.fingerprint)
+            with tracing.span("pil_convert"):
+                self.page_image = pixmap_to_image(pix)  # Read the samples directly
+        return self.page_image
+
+    def highlight_rects(self, number):
+        """
+        Get the area a highlight covers in the rendered page image
+        
+        :param number: Index of the highlight in self.highlights
+        :return: List of fitz.IRect in image pixels, one per quad
+        """
+        rects = self.highlight_areas.get(number)
+        if rects is None:
+            bounds = fitz.IRect(0, 0, *self.get_page_with_highlights().size)
+            # Follow the page rotation and zoom that the render used
+            transform = self.page.rotation_matrix * self.matrix
+            rects = [(quad.rect * transform).irect & bounds for quad in self.highlights[number]]
+            self.highlight_areas[number] = rects
+        return rects
+
+    def get_highlight_patch(self, indices):
+        """
+        Composite the region changed by new highlights over the cached page
+        render
+        
+        The patch covers the union of the new highlights' rectangles, so its
+        cost follows the size of those highlights rather than the page.
+        Earlier highlights overlapping that region are drawn into it as well.
+        
+        :param indices: Indices in self.highlights of the highlights added
+                        since the last patch
+        :return: Tuple of (x, y, PIL Image) to paste at image position x, y,
+                 or None if nothing changed
+        """
+        dirty = fitz.IRect()
+        for number in indices:
+            for rect in self.highlight_rects(number):
+                dirty |= rect
+        if dirty.is_empty:
+            return None
+
+        page_image = self.get_page_with_highlights()
+        with tracing.span("highlight_composite"):
+            patch = page_image.crop(tuple(dirty)).convert("RGB")
+            mask = Image.new("L", patch.size, 0)
+            draw = ImageDraw.Draw(mask)
+            for number in range(len(self.highlights)):
+                for rect in self.highlight_rects(number):
+                    rect = rect & dirty
+                    if not rect.is_empty:
+                        draw.rectangle((rect.x0 - dirty.x0, rect.y0 - dirty.y0,
+                                        rect.x1 - dirty.x0 - 1, rect.y1 - dirty.y0 - 1), fill=255)
+            # Multiply with yellow, which is how a PDF highlight annotation blends
+            highlighted = ImageChops.multiply(patch, Image.new("RGB", patch.size, HIGHLIGHT_RGB))
+            patch = Image.composite(highlighted, patch, mask)
+        return dirty.x0, dirty.y0, patch
+
+    def highlight_quads(self, quads, block):
+        """
+        Highlight an area of the current page with bright yellow
+        
+        :param quads: fitz.Quad list covering the text
+        :param block: Number of the text block (paragraph) the area starts in
+        :return: Index of the highlight in self.highlights
+        """
+        # The document is left untouched here; annotations are only written
+        # when the PDF is saved
+        self.highlights.append(quads)
+        self.pending_annotations.append((self.page_number, block, quads))
+        return len(self.highlights) - 1
+
+    def highlight_sentence(self, index):
+        """
+        Highlight a specific line on the PDF page with bright yellow
+        
+        :param index: Index of the line in the page's line table
+        :return: Index of the highlight in self.highlights
+        """
+        return self.highlight_quads(self.line_index.line_quads(index), self.line_index.layout[index][0])
+
+    def next_sentences(self, num_units):
+        """
+        Highlight the next specified number of units (lines, clauses or
+        sentences), moving on to the next page when the current one is
+        finished
+        
+        :param num_units: Number of units to highlight
+        :return: Indices in self.highlights of the highlights added on the
+                 current page, empty if no more units
+        """
+        if self.unit != LINE:
+            return self.next_units(num_units)
+        
+        highlighted = []
+        entries = self.stream.take(num_units)
+        self.recorder.advance(entries)
+        for line_index, line_no in entries:
+            if line_index.page_number != self.page_number:
+                # The cursor crossed onto the next page
+                self.load_page(line_index.page_number, line_index)
+                highlighted = []
+            highlighted.append(self.highlight_sentence(line_no))
+            self.current_sentence = line_no + 1
+        
+        return highlighted
+
+    def next_units(self, num_units):
+        # Clauses and sentences come from the page's sentence index; the line
+        # stream is kept at the last line highlighted, for recording and for
+        # switching back to lines or to the gaze. The lines of the whole step
+        # are recorded together, as one tick, and a step within a line is
+        # recorded without lines.
+        highlighted = []
+        entries = []
+        for done in range(num_units):
+            while self.current_sentence >= self.sentence_index().count(self.unit):
+                if self.page_number + 1 >= len(self.doc):
+                    self.recorder.advance(entries, position=self.stream.position if done else None)
+                    return highlighted
+                if len(self.line_index):
+                    entries += self.stream.advance_to(self.page_number, len(self.line_index))
+                self.load_page(self.page_number + 1, self.stream.page_lines(self.page_number + 1))
+                highlighted = []
+            
+            index = self.sentence_index()
+            first_line, last_line = index.unit_lines(self.unit, self.current_sentence)
+            highlighted.append(self.highlight_quads(index.unit_quads(self.unit, self.current_sentence),
+                                                    self.line_index.layout[first_line][0]))
+            entries += self.stream.advance_to(self.page_number, last_line + 1)
+            self.current_sentence += 1
+        self.recorder.advance(entries, position=self.stream.position if num_units else None)
+        return highlighted
+
+    def add_annotations(self, progress=None):
+        """
+        Write highlight annotations for lines highlighted since the last call
+        
+        Consecutive highlights in the same paragraph are merged into one
+        annotation with all their quads, so a long session adds one
+        annotation per paragraph read rather than one per line.
+        
+        :param progress: Function called with (annotations written, total)
+                         after each annotation
+        """
+        pending, self.pending_annotations = self.pending_annotations, []
+        paragraphs = [(page_number, [quad for _, _, quads in group for quad in quads])
+                      for (page_number, _), group in groupby(pending, key=lambda entry: entry[:2])]
+        page = None
+        for done, (page_number, quads) in enumerate(paragraphs, 1):
+            # The quads come from the line table, so repeated lines (headers,
+            # "Figure 1") are only highlighted where they were actually read
+            if page is None or page.number != page_number:
+                page = self.page if page_number == self.page_number else self.doc[page_number]
+
+            highlight = page.add_highlight_annot(quads)
+            highlight.set_colors(stroke=HIGHLIGHT_COLOR)  # Bright yellow border
+            highlight.update()
+            if progress:
+                progress(done, len(paragraphs))
+
+    def save_pdf(self, output_path, garbage=SAVE_GARBAGE, deflate=SAVE_DEFLATE, incremental=None,
+                 progress=None):
+        """
+        Save the modified PDF
+        
+        :param output_path: Path to save the highlighted PDF
+        :param garbage: Garbage collection level, 0 (none) to 4 (also merge
+                        duplicate objects)
+        :param deflate: Compress uncompressed streams
+        :param incremental: Append the changes to the opened file instead of
+                            rewriting it; None to do so when saving over a
+                            file opened by name (not memory-mapped).
+                            Garbage collection is skipped then.
+        :param progress: Function called with (steps done, total steps) as
+                         annotations are written and the file is saved
+        """
+        path = self.source.path if self.source is not None else None
+        same_file = (path is not None and os.path.exists(output_path)
+                     and os.path.samefile(output_path, path))
+        if incremental is None:
+            incremental = same_file and bool(self.doc.name)
+        if incremental and not (same_file and self.doc.name):
+            raise ValueError("Only the opened file can be saved incrementally")
+        if incremental and not self.doc.can_save_incrementally():
+            raise ValueError("This PDF cannot be saved incrementally")
+        
+        # Writing each annotation is one step, and the save itself one more
+        annotations = 0
+
+        def annotation_progress(done, total):
+            nonlocal annotations
+            annotations = total
+            progress(done, total + 1)
+
+        self.add_annotations(annotation_progress if progress else None)
+        if incremental:
+            self.doc.save(self.doc.name, incremental=True, deflate=deflate,
+                          encryption=fitz.PDF_ENCRYPT_KEEP)
+        elif same_file:
+            # The document still reads the old file through its mapping, so
+            # the new one is written beside it and moved over it
+            part_path = output_path + ".part"
+            self.doc.save(part_path, garbage=garbage, deflate=deflate)
+            os.replace(part_path, output_path)
+        else:
+            self.doc.save(output_path, garbage=garbage, deflate=deflate)
+        if progress:
+            progress(annotations + 1, annotations + 1)
+
+    def save_pdf_async(self, output_path, progress=None, **options):
+        """
+        Save the modified PDF on a background thread
+        
+        MuPDF documents are not thread-safe: the document must not be used
+        (highlighted, rendered or saved) until the save is done.
+        
+        :param output_path: Path to save the highlighted PDF
+        :param progress: Function called on the save thread with (steps done,
+                         total steps)
+        :param options: Other save_pdf options
+        :return: concurrent.futures.Future completed when the file is written
+        """
+        if self.save_executor is None:
+            self.save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-save")
+        return self.save_executor.submit(self.save_pdf, output_path, progress=progress, **options)
+
+    def close(self):
+        """
+        Stop background extraction, wait for a running save and close the
+        document
+        """
+        self.stream.close()
+        if self.save_executor is not None:
+            self.save_executor.shutdown(wait=True)
+        self.doc.close()
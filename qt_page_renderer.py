@@ -0,0 +1,182 @@
+import threading
+
+import fitz  # PyMuPDF
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from document_source import source_of
+from render_adapter import pixmap_to_qimage
+from render_cache import RenderCache, document_fingerprint, shared_cache
+import tracing
+
+
+def fit_matrix(page, size):
+    """
+    Matrix that renders a page to fit inside an area
+
+    :param page: fitz.Page to render
+    :param size: (width, height) of the area in pixels
+    :return: fitz.Matrix
+    """
+    page_rect = page.rect  # Already follows the page rotation
+    zoom = max(min(size[0] / page_rect.width, size[1] / page_rect.height), 0.01)
+    return fitz.Matrix(zoom, zoom)
+
+
+class _RenderTask(QRunnable):
+    def __init__(self, renderer, page_number, size):
+        super().__init__()
+        self.renderer = renderer
+        self.page_number = page_number
+        self.size = size
+
+    def run(self):
+        try:
+            page = self.renderer.thread_document()[self.page_number]
+            with tracing.span("rasterize"):
+                pix = self.renderer.cache.render(page, fit_matrix(page, self.size),
+                                                 fingerprint=self.renderer.fingerprint)
+            with tracing.span("qimage_wrap"):
+                img = pixmap_to_qimage(pix)
+            self.renderer._rendered.emit(self.page_number, self.size, img)
+        except Exception as e:
+            self.renderer._failed.emit(self.page_number, self.size, str(e))
+
+
+class PageRenderer(QObject):
+    """
+    Renders pages on a QThreadPool and prefetches the neighbouring pages.
+
+    Each worker thread opens its own fitz.Document because MuPDF documents
+    are not thread-safe. Finished QImages are delivered through page_ready
+    and kept for the current page and its neighbours, so a page flip can be
+    served straight from memory. Renders go through the shared render cache,
+    so revisiting a page further away does not rasterize it again.
+    """
+
+    page_ready = pyqtSignal(int, object)  # Page number, QImage
+    render_failed = pyqtSignal(int, str)  # Page number, error message
+
+    # Internal signals emitted from worker threads, delivered on the GUI thread
+    _rendered = pyqtSignal(int, object, object)
+    _failed = pyqtSignal(int, object, str)
+
+    def __init__(self, document, parent=None, max_threads=2, cache=shared_cache):
+        """
+        Create a renderer for an open PDF file
+
+        :param document: fitz.Document opened by the GUI thread from a file or
+                         a DocumentSource
+        :param parent: Parent QObject
+        :param max_threads: Number of render worker threads
+        :param cache: RenderCache the renders go through
+        """
+        super().__init__(parent)
+        self.source = source_of(document)
+        self.fingerprint = document_fingerprint(document)
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.thread_local = threading.local()
+        self.thread_documents = []  # Handles opened by the worker threads, closed on shutdown
+        self.documents_lock = threading.Lock()
+        self.images = {}  # Page number -> (size, QImage)
+        self.in_flight = set()  # (page number, size) being rendered
+        self.current_page = 0
+        self.closed = False  # Set by shutdown; renders delivered after it are dropped
+        self._rendered.connect(self._on_rendered)
+        self._failed.connect(self._on_failed)
+
+    def thread_document(self):
+        """
+        Get the document handle owned by the calling worker thread
+
+        :return: fitz.Document
+        """
+        doc = getattr(self.thread_local, "doc", None)
+        if doc is None:
+            doc = self.thread_local.doc = self.source.open()
+            with self.documents_lock:
+                self.thread_documents.append(doc)
+        return doc
+
+    def request(self, page, size):
+        """
+        Ask for a page rendered to fit a widget size, and prefetch its neighbours
+
+        :param page: fitz.Page from the GUI thread's document
+        :param size: (width, height) of the display area in pixels
+        :return: The QImage if it is already rendered, otherwise None and
+                 page_ready is emitted once it is
+        """
+        page_number = page.number
+        page_count = len(page.parent)
+        self.current_page = page_number
+        self._discard_distant_pages()
+
+        image = self.ready_image(page_number, size)
+        if image is None:
+            # A cache lookup is cheap enough for the GUI thread; rendering is not
+            key = RenderCache.make_key(self.fingerprint, page_number, fit_matrix(page, size))
+            pix = self.cache.get(key)
+            if pix is not None:
+                image = pixmap_to_qimage(pix)
+                self.images[page_number] = (size, image)
+            else:
+                self._submit(page_number, size)
+        for neighbour in (page_number + 1, page_number - 1):
+            if 0 <= neighbour < page_count and self.ready_image(neighbour, size) is None:
+                self._submit(neighbour, size)
+        return image
+
+    def ready_image(self, page_number, size):
+        """
+        Get an already rendered page
+
+        :return: QImage, or None if the page is not rendered at this size
+        """
+        entry = self.images.get(page_number)
+        if entry is not None and entry[0] == size:
+            return entry[1]
+        return None
+
+    def _submit(self, page_number, size):
+        if (page_number, size) in self.in_flight:
+            return
+        self.in_flight.add((page_number, size))
+        self.pool.start(_RenderTask(self, page_number, size))
+
+    def _discard_distant_pages(self):
+        # Only the current page and its neighbours are kept
+        for page_number in list(self.images):
+            if abs(page_number - self.current_page) > 1:
+                del self.images[page_number]
+
+    def _on_rendered(self, page_number, size, image):
+        self.in_flight.discard((page_number, size))
+        if self.closed or abs(page_number - self.current_page) > 1:
+            return
+        self.images[page_number] = (size, image)
+        self.page_ready.emit(page_number, image)
+
+    def _on_failed(self, page_number, size, message):
+        self.in_flight.discard((page_number, size))
+        if self.closed:
+            return
+        self.render_failed.emit(page_number, message)
+
+    def shutdown(self):
+        """
+        Wait for the running renders to finish, close the worker threads'
+        document handles and drop the rendered pages; renders finished but
+        not yet delivered are dropped too
+        """
+        self.closed = True
+        self.pool.clear()
+        self.pool.waitForDone()
+        with self.documents_lock:
+            for doc in self.thread_documents:
+                doc.close()
+            self.thread_documents = []
+            self.thread_local = threading.local()  # Renders after this open new handles
+        self.images.clear()
+        self.in_flight.clear()
@@ -0,0 +1,55 @@
+"""
+Hand rendered fitz.Pixmap samples to the GUI toolkits without encoding them.
+
+Both helpers read the pixmap memory through its buffer (samples_mv /
+samples_ptr) instead of pix.samples or pix.tobytes(), which each make a full
+copy of the frame. The returned image keeps a reference to the pixmap so the
+shared memory stays alive for as long as the image does.
+"""
+from PIL import Image
+
+# PIL mode for each (number of components, has alpha) pixmap layout
+PIL_MODES = {
+    (1, False): "L",
+    (3, False): "RGB",
+    (4, True): "RGBA",
+    (4, False): "CMYK",
+}
+
+
+def pixmap_to_image(pix):
+    """
+    Wrap a pixmap as a PIL Image
+
+    Gray and RGBA pixmaps are mapped without copying. PIL stores RGB with four
+    bytes per pixel, so RGB pixmaps are unpacked once straight from the pixmap
+    buffer; no intermediate PPM/BytesIO step is involved either way.
+
+    :param pix: fitz.Pixmap to wrap
+    :return: PIL Image over the pixmap samples
+    """
+    mode = PIL_MODES[(pix.n, bool(pix.alpha))]
+    img = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv,
+                           "raw", mode, pix.stride, 1)
+    img.pixmap = pix  # The image may share the pixmap memory
+    return img
+
+
+def pixmap_to_qimage(pix):
+    """
+    Wrap a pixmap as a QImage without copying
+
+    :param pix: fitz.Pixmap in RGB or RGBA
+    :return: QImage over the pixmap samples
+    """
+    from PyQt5.QtGui import QImage
+
+    if pix.n - pix.alpha == 1:
+        fmt = QImage.Format_Grayscale8
+    elif pix.alpha:
+        fmt = QImage.Format_RGBA8888
+    else:
+        fmt = QImage.Format_RGB888
+    img = QImage(pix.samples_ptr, pix.width, pix.height, pix.stride, fmt)
+    img.pixmap = pix  # QImage does not own the buffer, so keep the pixmap alive
+    return img
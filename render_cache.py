@@ -0,0 +1,157 @@
+"""
+Shared render cache for both readers.
+
+Rendered fitz.Pixmaps are kept in a least-recently-used cache bounded by the
+total bytes of pixel data rather than the number of entries. The ceiling is
+READER_RENDER_CACHE_MB megabytes (default 256) for the shared instance.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from document_source import source_of
+
+DEFAULT_BUDGET_MB = 256
+
+
+def document_fingerprint(doc):
+    """
+    Identify a document for cache keys, independent of the handle it was opened with
+
+    :param doc: fitz.Document
+    :return: Hashable fingerprint, or None for a document created in memory,
+             which has nothing stable to identify it by and is not cached
+    """
+    source = source_of(doc)  # Files, and streams by the hash of their contents
+    return source.fingerprint if source is not None else None
+
+
+class RenderCache:
+    """
+    LRU cache of rendered pages, evicting by total pixel bytes.
+
+    Keys are (document fingerprint, page number, matrix, clip, whether
+    annotations are drawn). The readers never change the annotations of an
+    open document (highlights are drawn over the render and only written
+    when saving), so no revision is needed. The cache is thread-safe, so
+    render workers can share it.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Create an empty cache
+
+        :param max_bytes: Ceiling on the total bytes of cached pixel data
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # Key -> (fitz.Pixmap, size in bytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(fingerprint, page_number, matrix, clip=None, annots=True):
+        """
+        Build the cache key of a render
+
+        :param fingerprint: Result of document_fingerprint
+        :param page_number: Zero-based page number
+        :param matrix: fitz.Matrix used for the render
+        :param clip: fitz.Rect clip of the render, or None for the whole page
+        :param annots: Whether annotations are drawn
+        :return: Hashable key, or None if the fingerprint is None
+        """
+        if fingerprint is None:
+            return None
+        return (fingerprint, page_number, tuple(matrix),
+                tuple(clip) if clip is not None else None, bool(annots))
+
+    def get(self, key):
+        """
+        Look up a render
+
+        :param key: Key from make_key
+        :return: fitz.Pixmap, or None if not cached
+        """
+        if key is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, pix):
+        """
+        Store a render, evicting the least recently used ones to stay in budget
+
+        :param key: Key from make_key
+        :param pix: fitz.Pixmap to store
+        """
+        size = pix.stride * pix.height
+        if key is None or size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (pix, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def render(self, page, matrix, clip=None, annots=True, fingerprint=None):
+        """
+        Render a page through the cache
+
+        :param page: fitz.Page to render
+        :param matrix: fitz.Matrix of the render
+        :param clip: Optional fitz.Rect to render only part of the page
+        :param annots: Whether annotations are drawn
+        :param fingerprint: Precomputed document_fingerprint of the page's document
+        :return: fitz.Pixmap
+        """
+        if fingerprint is None:
+            fingerprint = document_fingerprint(page.parent)
+        key = self.make_key(fingerprint, page.number, matrix, clip, annots)
+        pix = self.get(key)
+        if pix is None:
+            pix = page.get_pixmap(matrix=matrix, clip=clip, annots=annots)
+            self.put(key, pix)
+        return pix
+
+    def clear(self):
+        """
+        Drop every cached render
+        """
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """
+        Get the cache counters
+
+        :return: Dict of hits, misses, evictions, entries and bytes
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Cache shared by the Tk and Qt readers
+shared_cache = RenderCache(
+    int(float(os.environ.get("READER_RENDER_CACHE_MB", DEFAULT_BUDGET_MB)) * 1024 * 1024))
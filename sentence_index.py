@@ -0,0 +1,215 @@
+"""
+Sentences and clauses of a page, mapped to word boxes.
+
+The line table holds visual lines, so highlighting by line splits sentences
+that wrap and never sees a word hyphenated across lines as one word.
+PageSentenceIndex joins the words of a PageLineIndex (the get_text("words")
+boxes, in the table's layout order) into the running text of the page,
+rejoining words hyphenated at a line end, and splits it into sentences and
+clauses that run on across line and column breaks. Every word box
+keeps its character range in that text, so text offsets map back to boxes.
+
+Sentences, clauses and lines are all stored as ranges of word boxes in
+NumPy arrays, so getting any unit and the lines it spans is O(1) per step;
+the quads of a unit are built from its word boxes on first use.
+"""
+import os
+import re
+
+import fitz  # PyMuPDF
+import numpy as np
+
+LINE = "line"
+CLAUSE = "clause"
+SENTENCE = "sentence"
+UNITS = (LINE, CLAUSE, SENTENCE)
+DEFAULT_UNIT = os.environ.get("READER_UNIT", LINE)
+
+# Abbreviations whose full stop does not end a sentence (compared lowercased)
+ABBREVIATIONS = {"e.g.", "i.e.", "al.", "cf.", "vs.", "fig.", "figs.", "eq.", "eqs.", "sec.", "ch.",
+                 "no.", "nos.", "pp.", "p.", "vol.", "dr.", "mr.", "mrs.", "ms.", "prof.", "approx.",
+                 "ca.", "resp.", "st."}
+HYPHENS = ("-", "­", "‐")  # Hyphen-minus, soft hyphen, hyphen
+
+_SENTENCE_END = re.compile(r"[.!?]+[\"'”’)\]]*$")
+_CLAUSE_END = re.compile(r"[,;:–—][\"'”’)\]]*$")
+_SENTENCE_START = re.compile(r"^[\"'“‘(\[]*[A-Z0-9À-Þ]")
+_INITIAL = re.compile(r"^[A-Z]\.$")
+
+
+class PageSentenceIndex:
+    """
+    Word-level text of one page, split into lines, clauses and sentences.
+    """
+
+    def __init__(self, page_lines):
+        """
+        Join and split the words of a page
+
+        :param page_lines: PageLineIndex of the page
+        """
+        self.page_number = page_lines.page_number
+        word_lines = np.array(page_lines.word_lines(), dtype=np.int64)
+        # Words of lines in the table, in line order (words are already in
+        # order within a line)
+        order = np.flatnonzero(word_lines >= 0)
+        order = order[np.argsort(word_lines[order], kind="stable")]
+        words = [page_lines.words[i] for i in order]
+        self.lines = word_lines[order]  # Line index of each word box
+        blocks = np.array([block for block, _ in page_lines.layout], dtype=np.int64)[self.lines]
+        self.boxes = np.array([word[:4] for word in words], dtype=np.float64).reshape(-1, 4)
+
+        # Running text; each box gets the character range of its text in it
+        count = len(words)
+        starts = np.zeros(count, dtype=np.int64)
+        ends = np.zeros(count, dtype=np.int64)
+        tokens = []  # (text, first box, end box) of each word after rejoining
+        parts = []
+        length = 0
+        i = 0
+        while i < count:
+            first = i
+            text = words[i][4]
+            # A hyphen ending a line joins the word with the start of the next
+            # line, if that goes on in lower case
+            while (i + 1 < count and self.lines[i + 1] != self.lines[i] and len(text) > 1
+                   and text.endswith(HYPHENS) and words[i + 1][4][:1].islower()):
+                starts[i], ends[i] = length + len(text) - len(words[i][4]), length + len(text) - 1
+                text = text[:-1] + words[i + 1][4]
+                i += 1
+            starts[i], ends[i] = length + len(text) - len(words[i][4]), length + len(text)
+            tokens.append((text, first, i + 1))
+            parts.append(text)
+            length += len(text) + 1
+            i += 1
+        self.text = " ".join(parts)
+        self.word_starts = starts
+        self.word_ends = ends
+
+        # Unit boundaries, as box indices where each unit starts
+        sentence_breaks = []
+        clause_breaks = []
+        for index, (text, first, end) in enumerate(tokens[:-1]):
+            following = tokens[index + 1][0]
+            # Headings and captions are blocks of their own; a sentence going
+            # on in the next column continues in lower case
+            new_block = blocks[end - 1] != blocks[end]
+            if (self._ends_sentence(text, following)
+                    or new_block and _SENTENCE_START.search(following) and not _CLAUSE_END.search(text)):
+                sentence_breaks.append(end)
+            elif _CLAUSE_END.search(text):
+                clause_breaks.append(end)
+        line_breaks = np.flatnonzero(np.diff(self.lines) != 0) + 1
+        self.bounds = {
+            SENTENCE: self._bounds(sentence_breaks),
+            CLAUSE: self._bounds(sorted(sentence_breaks + clause_breaks)),
+            LINE: self._bounds(line_breaks),
+        }
+        self.quads = {}  # (unit, index) -> fitz.Quad list, built on first use
+
+    @staticmethod
+    def _ends_sentence(text, following):
+        if not _SENTENCE_END.search(text) or not _SENTENCE_START.search(following):
+            return False
+        word = text.rstrip("\"'”’)]")
+        return word.lower() not in ABBREVIATIONS and not _INITIAL.match(word)
+
+    def _bounds(self, breaks):
+        if not len(self.boxes):
+            return np.zeros(1, dtype=np.int64)
+        return np.concatenate([[0], np.asarray(breaks, dtype=np.int64), [len(self.boxes)]])
+
+    def count(self, unit):
+        """
+        Get the number of units on the page
+
+        :param unit: LINE, CLAUSE or SENTENCE
+        """
+        return len(self.bounds[unit]) - 1
+
+    def unit_words(self, unit, index):
+        """
+        Get the word boxes of a unit
+
+        :param unit: LINE, CLAUSE or SENTENCE
+        :param index: Index of the unit on the page
+        :return: Tuple of (first box, end box) indices
+        """
+        bounds = self.bounds[unit]
+        return int(bounds[index]), int(bounds[index + 1])
+
+    def unit_lines(self, unit, index):
+        """
+        Get the lines a unit spans
+
+        :param unit: LINE, CLAUSE or SENTENCE
+        :param index: Index of the unit on the page
+        :return: Tuple of (first line, last line) indices in the line table
+        """
+        first, end = self.unit_words(unit, index)
+        return int(self.lines[first]), int(self.lines[end - 1])
+
+    def unit_text(self, unit, index):
+        """
+        Get the text of a unit, with hyphenated words rejoined
+
+        :param unit: LINE, CLAUSE or SENTENCE
+        :param index: Index of the unit on the page
+        """
+        first, end = self.unit_words(unit, index)
+        return self.text[self.word_starts[first]:self.word_ends[end - 1]]
+
+    def unit_quads(self, unit, index):
+        """
+        Get the area a unit covers, one quad per line it runs over
+
+        :param unit: LINE, CLAUSE or SENTENCE
+        :param index: Index of the unit on the page
+        :return: List of fitz.Quad in unrotated page coordinates
+        """
+        quads = self.quads.get((unit, index))
+        if quads is None:
+            first, end = self.unit_words(unit, index)
+            quads = self.words_quads(first, end)
+            self.quads[(unit, index)] = quads
+        return quads
+
+    def words_quads(self, first, end):
+        """
+        Get the area of a run of word boxes, one quad per line
+
+        :param first: Index of the first box
+        :param end: Index after the last box
+        :return: List of fitz.Quad in unrotated page coordinates
+        """
+        boxes = self.boxes[first:end]
+        if not len(boxes):
+            return []
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(self.lines[first:end]) != 0) + 1])
+        x0 = np.minimum.reduceat(boxes[:, 0], starts)
+        y0 = np.minimum.reduceat(boxes[:, 1], starts)
+        x1 = np.maximum.reduceat(boxes[:, 2], starts)
+        y1 = np.maximum.reduceat(boxes[:, 3], starts)
+        return [fitz.Rect(*rect).quad for rect in zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist())]
+
+    def words_at(self, start, end):
+        """
+        Find the word boxes holding a range of the page text
+
+        :param start: Offset of the first character in self.text
+        :param end: Offset after the last character
+        :return: Tuple of (first box, end box) indices
+        """
+        return (int(np.searchsorted(self.word_ends, start, side="right")),
+                int(np.searchsorted(self.word_starts, end, side="left")))
+
+    def unit_at_line(self, unit, line):
+        """
+        Find the first unit starting on or after a line
+
+        :param unit: LINE, CLAUSE or SENTENCE
+        :param line: Index of the line in the line table
+        :return: Index of the unit, count(unit) if none is left
+        """
+        bounds = self.bounds[unit][:-1]
+        return int(np.searchsorted(self.lines[bounds], line, side="left")) if len(self.boxes) else 0
@@ -0,0 +1,348 @@
+"""
+Reading metrics over many recorded sessions.
+
+Each session file (see session_recording.py) is joined against the line and
+word tables of its document, read from the extraction cache by the content
+hash recorded with the session, and summarized per pacing condition
+(gaze, or the unit, units per iteration and delay):
+
+- reading_seconds: time the pacing was running
+- lines_read, coverage: distinct lines highlighted or revealed, and their
+  share of the document's lines
+- words_read, wpm: words on those lines, and words per minute of reading
+- dwell_mean, dwell_median: seconds each line read was the newest one shown,
+  shared equally by lines shown together (in one tick, even when they are
+  recorded as several events)
+- fixations, gaze_lines, gaze_coverage, gaze_dwell_mean, regressions: from
+  the gaze samples, when recorded; fixations are detected as in the readers
+  and placed on lines with the page's spatial index, and a regression is a
+  fixation on a line above the furthest one fixated on the page
+
+All metrics are computed with NumPy group-bys (bincount over condition and
+line keys) rather than per-event loops, and sessions are analyzed in
+parallel, one per worker process. One row per participant, document,
+session and condition is written to a CSV file, and --lines writes the
+per-line dwell times as well:
+
+    python session_analytics.py recordings/ -o summary.csv --lines lines.csv -j 8
+
+Gaze samples belong to the condition of the pacing event recorded before
+they arrived, so the tracker's clock does not need to match the reader's.
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from batch_highlight import positive_int
+from extraction_cache import shared_extraction_cache
+from fixation_detector import FIXATION_END, create_detector
+from line_index import PageLineIndex
+from sentence_index import UNITS
+from session_recording import ADVANCE, START, load_session
+from spatial_index import PageSpatialIndex
+
+SUMMARY_FIELDS = ["participant", "document", "app", "session", "gaze", "unit", "lines_per_iteration", "delay",
+                  "reading_seconds", "lines_read", "document_lines", "coverage", "words_read", "wpm",
+                  "dwell_mean", "dwell_median", "fixations", "gaze_lines", "gaze_coverage",
+                  "gaze_dwell_mean", "regressions"]
+LINE_FIELDS = ["participant", "document", "session", "gaze", "unit", "lines_per_iteration", "delay",
+               "page", "line", "words", "dwell", "fixations", "gaze_dwell"]
+
+# Pacing settings that make up a condition
+CONDITION_DTYPE = np.dtype([("gaze", "i1"), ("unit", "i1"), ("lines", "<i2"), ("delay", "<f4")])
+
+
+class DocumentLines:
+    """
+    Line and word tables of a whole document, with lines numbered across pages.
+    """
+
+    def __init__(self, pages):
+        """
+        Number the lines of a document
+
+        :param pages: PageLineIndex of every page, in order
+        """
+        self.pages = pages
+        self.offsets = np.concatenate([[0], np.cumsum([len(page) for page in pages])]).astype(np.int64)
+        # Words on each line, counted from the word tables
+        words = []
+        for page in pages:
+            word_lines = np.array(page.word_lines(), dtype=np.int64)
+            words.append(np.bincount(word_lines[word_lines >= 0], minlength=len(page)))
+        self.words = np.concatenate(words) if words else np.zeros(0, dtype=np.int64)
+        self.spatial = {}  # Page number -> PageSpatialIndex, built when gaze lands on it
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def spatial_index(self, page_number):
+        index = self.spatial.get(page_number)
+        if index is None:
+            index = self.spatial[page_number] = PageSpatialIndex(self.pages[page_number])
+        return index
+
+
+@lru_cache(maxsize=8)
+def document_lines(digest, document, page_count):
+    """
+    Load the line tables of a recorded document (cached per process, since
+    sessions of the same document usually come together)
+
+    :param digest: Content hash recorded with the session
+    :param document: Path of the PDF, opened only for pages missing from the
+                     extraction cache
+    :param page_count: Number of pages in the document
+    :return: DocumentLines
+    """
+    cache = shared_extraction_cache()
+    pages = [cache.load(digest, page_number) if cache else None for page_number in range(page_count)]
+    if None in pages:
+        if not os.path.isfile(document):
+            raise FileNotFoundError(f"Document not cached and not found: {document}")
+        if cache and cache.document_key(document) != digest:
+            raise ValueError(f"Document changed since the session was recorded: {document}")
+        with fitz.open(document) as doc:
+            for page_number, page_lines in enumerate(pages):
+                if page_lines is None:
+                    page = doc[page_number]
+                    pages[page_number] = (cache.page_lines(page, digest) if cache
+                                          else PageLineIndex.extract(page))
+    return DocumentLines(pages)
+
+
+def _group_sum(groups, values, count):
+    return np.bincount(groups, weights=values, minlength=count)
+
+
+def _gaze_fixations(session, lines, event_condition, method):
+    # Fixations of each stretch of gaze on one page in one condition, as
+    # arrays of (condition, line numbered across pages, duration, regression)
+    gaze = session.gaze
+    empty = [np.zeros(0, dtype=np.int64)] * 2 + [np.zeros(0)] + [np.zeros(0, dtype=bool)]
+    if not len(gaze):
+        return empty
+
+    # Condition of the event in force when each sample arrived
+    event = gaze["event"]
+    group = np.where(event >= 0, event_condition[np.maximum(event, 0)], -1)
+
+    breaks = np.flatnonzero((np.diff(gaze["page"]) != 0) | (np.diff(group) != 0)) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.append(breaks, len(gaze))
+    found = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if group[start] < 0:
+            continue  # Taken while the pacing was stopped
+        fixations = create_detector(method).process(gaze[start:end])
+        fixations = fixations[fixations["kind"] == FIXATION_END]
+        if not len(fixations):
+            continue
+        page_number = int(gaze["page"][start])
+        hit = lines.spatial_index(page_number).lines.query(fixations["x"], fixations["y"])
+        fixations, hit = fixations[hit >= 0], hit[hit >= 0].astype(np.int64)
+        if not len(hit):
+            continue
+        furthest = np.maximum.accumulate(hit)
+        regression = np.concatenate([[False], hit[1:] < furthest[:-1]])
+        found.append((np.full(len(hit), group[start]), lines.offsets[page_number] + hit,
+                      fixations["duration"].astype(np.float64), regression))
+    if not found:
+        return empty
+    return [np.concatenate(column) for column in zip(*found)]
+
+
+def analyze_session(path, per_line=False, method=None):
+    """
+    Compute the reading metrics of a session (runs in a worker process)
+
+    :param path: Session file
+    :param per_line: Also return the per-line dwell times
+    :param method: Fixation detection method, None for READER_FIXATION_METHOD
+    :return: Tuple of (summary rows, per-line rows), rows as dicts keyed by
+             SUMMARY_FIELDS and LINE_FIELDS
+    """
+    session = load_session(path)
+    meta = session.meta
+    events = session.events
+    if not len(events):
+        return [], []
+    lines = document_lines(meta["digest"], meta["document"], meta["page_count"])
+    total = len(lines)
+
+    # Conditions by the pacing settings stamped on each event
+    keys = np.empty(len(events), dtype=CONDITION_DTYPE)
+    for name in CONDITION_DTYPE.names:
+        # Sessions recorded before units were recorded advanced by line
+        keys[name] = events[name] if name in events.dtype.names else 0
+    conditions, condition = np.unique(keys, return_inverse=True)
+    condition = condition.reshape(-1)
+    n = len(conditions)
+
+    # Each event lasts until the next one; pacing runs from a start through
+    # its advances
+    t = events["t"]
+    kind = events["kind"]
+    interval = np.diff(t, append=t[-1])
+    active = (kind == START) | (kind == ADVANCE)
+    reading = _group_sum(condition, np.where(active, interval, 0.0), n)
+
+    # Lines of each advance, numbered across pages. A tick that runs over a
+    # page break records one advance per page at the same time, so the
+    # interval of a run of advances at one time is shared by all their lines.
+    # A clause or sentence step that finished no line keeps the lines of the
+    # step before it on screen, so its interval goes to those.
+    advance = np.flatnonzero(kind == ADVANCE)
+    count = events["count"][advance].astype(np.int64)
+    new_tick = np.ones(len(advance), dtype=bool)
+    new_tick[1:] = (np.diff(advance) != 1) | ((np.diff(t[advance]) != 0) & (count[1:] > 0))
+    tick = np.cumsum(new_tick) - 1
+    share = (np.bincount(tick, weights=interval[advance])
+             / np.maximum(np.bincount(tick, weights=count), 1))[tick]
+    first = lines.offsets[events["page"][advance]] + events["line"][advance]
+    within = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    line_ids = np.minimum(np.repeat(first, count) + within, max(total - 1, 0))
+    line_keys = np.repeat(condition[advance], count) * total + line_ids
+    dwell = _group_sum(line_keys, np.repeat(share, count),
+                       n * total).reshape(n, total)
+    shown = np.bincount(line_keys, minlength=n * total).reshape(n, total) > 0
+
+    # Fixations, by the condition of the pacing running when they were made
+    fixation_condition, fixation_line, duration, regression = _gaze_fixations(
+        session, lines, np.where(active, condition, -1), method)
+    fixation_keys = fixation_condition * total + fixation_line
+    gaze_dwell = _group_sum(fixation_keys, duration, n * total).reshape(n, total)
+    fixations = np.bincount(fixation_keys, minlength=n * total).reshape(n, total)
+    regressions = _group_sum(fixation_condition, regression.astype(np.float64), n)
+
+    lines_read = shown.sum(axis=1)
+    words_read = shown.astype(np.int64) @ lines.words
+    gaze_lines = (fixations > 0).sum(axis=1)
+    base = {"participant": meta.get("participant", ""), "document": os.path.basename(meta["document"]),
+            "session": os.path.basename(path)}
+    summary = []
+    line_rows = []
+    for c in np.flatnonzero(reading > 0).tolist():
+        setting = {"gaze": int(conditions["gaze"][c]), "unit": UNITS[conditions["unit"][c]],
+                   "lines_per_iteration": int(conditions["lines"][c]),
+                   "delay": round(float(conditions["delay"][c]), 3)}
+        minutes = reading[c] / 60
+        row = dict(base, app=meta["app"], **setting)
+        row.update({
+            "reading_seconds": round(float(reading[c]), 3),
+            "lines_read": int(lines_read[c]),
+            "document_lines": total,
+            "coverage": round(float(lines_read[c] / total), 4) if total else "",
+            "words_read": int(words_read[c]),
+            "wpm": round(float(words_read[c] / minutes), 1),
+            "dwell_mean": round(float(dwell[c].sum() / lines_read[c]), 3) if lines_read[c] else "",
+            "dwell_median": round(float(np.median(dwell[c][shown[c]])), 3) if lines_read[c] else "",
+        })
+        if fixations[c].any():
+            row.update({
+                "fixations": int(fixations[c].sum()),
+                "gaze_lines": int(gaze_lines[c]),
+                "gaze_coverage": round(float(gaze_lines[c] / total), 4),
+                "gaze_dwell_mean": round(float(gaze_dwell[c].sum() / gaze_lines[c]), 3),
+                "regressions": int(regressions[c]),
+            })
+        summary.append(row)
+
+        if per_line:
+            line_ids = np.flatnonzero(shown[c] | (fixations[c] > 0))
+            pages = np.searchsorted(lines.offsets, line_ids, side="right") - 1
+            for line_id, page in zip(line_ids.tolist(), pages.tolist()):
+                line_rows.append(dict(base, **setting, page=page, line=line_id - int(lines.offsets[page]),
+                                      words=int(lines.words[line_id]), dwell=round(float(dwell[c, line_id]), 3),
+                                      fixations=int(fixations[c, line_id]),
+                                      gaze_dwell=round(float(gaze_dwell[c, line_id]), 3)))
+    return summary, line_rows
+
+
+def find_sessions(inputs):
+    """
+    Expand files, directories and glob patterns into session files
+
+    :param inputs: Paths or glob patterns from the command line
+    :return: Sorted list of unique .npz paths
+    """
+    found = set()
+    for pattern in inputs:
+        for path in glob.glob(pattern, recursive=True) or [pattern]:
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    found.update(os.path.join(dirpath, name) for name in filenames
+                                 if name.lower().endswith(".npz"))
+            elif os.path.isfile(path) and path.lower().endswith(".npz"):
+                found.add(path)
+    return sorted(os.path.abspath(path) for path in found)
+
+
+def write_table(path, fields, rows):
+    """
+    Write rows to a CSV file
+
+    :param path: CSV file to write
+    :param fields: Column names
+    :param rows: Dicts keyed by column name; missing values are left empty
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize recorded reading sessions.")
+    parser.add_argument("inputs", nargs="+", help="Session files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="CSV file for the summary table")
+    parser.add_argument("--lines", help="CSV file for the per-line dwell times")
+    parser.add_argument("--method", choices=("ivt", "idt"), help="Fixation detection method")
+    parser.add_argument("-j", "--jobs", type=positive_int, default=os.cpu_count(),
+                        help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    paths = find_sessions(args.inputs)
+    if not paths:
+        print("No session files found.")
+        return 1
+
+    summary = []
+    line_rows = []
+    failures = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(analyze_session, path, bool(args.lines), args.method): path for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                rows, lines = future.result()
+                summary.extend(rows)
+                line_rows.extend(lines)
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(paths)}] {path} failed: {str(e)}")
+
+    order = ("participant", "document", "session", "gaze", "unit", "lines_per_iteration", "delay")
+    summary.sort(key=lambda row: tuple(row[key] for key in order))
+    write_table(args.output, SUMMARY_FIELDS, summary)
+    if args.lines:
+        line_rows.sort(key=lambda row: tuple(row[key] for key in order + ("page", "line")))
+        write_table(args.lines, LINE_FIELDS, line_rows)
+
+    print(f"Summarized {len(paths) - failures} of {len(paths)} sessions ({len(summary)} conditions) "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
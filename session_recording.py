@@ -0,0 +1,434 @@
+"""
+Recording and replay of reading sessions.
+
+With READER_RECORD set to a directory, both readers record every session
+(from opening a document until another one is opened or the reader exits)
+to one file there:
+
+- meta: JSON with the reader, document path and content hash, page count,
+  participant (READER_PARTICIPANT), wall-clock start and monotonic clock
+  start of the session
+- events: EVENT_DTYPE array of pacing events (start, stop, lines advanced,
+  reset), timed in seconds since the session started
+- gaze: GAZE_DTYPE array of every gaze sample followed, as received
+
+The file is a NumPy .npz archive, so np.load() reads it anywhere. Members
+are stored uncompressed unless READER_RECORD_COMPRESS is set, and
+load_session() memory-maps uncompressed members instead of reading them,
+so even hours of 1 kHz gaze cost no memory until the pages are touched.
+
+SessionReplay plays the events back at 1-100x speed: each frame it finds
+the events that are due with a binary search on the mapped time column and
+sums their line counts with NumPy, so no Python object is made per event.
+Clauses and sentences are replayed as such: a step of the recording (its
+ADVANCE events share a timestamp) advances by the units per iteration it
+was recorded with, so the reader shows the highlights the participant saw.
+Replay a session in the reader that recorded it with:
+
+    python session_recording.py <session.npz> --speed 10
+"""
+import argparse
+import atexit
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+from extraction_cache import file_sha256
+from sentence_index import LINE, UNITS
+
+START = 1  # Pacing started
+ADVANCE = 2  # Lines highlighted or revealed
+STOP = 3  # Pacing stopped
+RESET = 4  # Reading went back to the first line
+
+# page, line and count are the first page and line of the event and the
+# lines advanced on that page (0 for a clause or sentence step that
+# finished no line); lines (units per iteration), delay and unit
+# (index in sentence_index.UNITS) are the pacing settings (lines and delay
+# are 0 when the gaze paces the reading)
+EVENT_DTYPE = np.dtype([("t", "<f8"), ("kind", "i1"), ("page", "<i4"), ("line", "<i4"),
+                        ("count", "<i4"), ("lines", "<i2"), ("delay", "<f4"), ("gaze", "i1"),
+                        ("unit", "i1")])
+
+# A gaze sample as received (the tracker's clock), the page it was taken on
+# and the index of the last pacing event recorded before it arrived
+GAZE_DTYPE = np.dtype([("t", "<f8"), ("x", "<f4"), ("y", "<f4"), ("page", "<i4"), ("event", "<i4")])
+
+RECORD_DIR = os.environ.get("READER_RECORD", "")
+COMPRESS = bool(os.environ.get("READER_RECORD_COMPRESS"))
+PARTICIPANT = os.environ.get("READER_PARTICIPANT", "")
+
+MIN_SPEED = 1.0
+MAX_SPEED = 100.0
+
+
+class SessionRecorder:
+    """
+    Collects the pacing events and gaze samples of one session and writes
+    them to a file when closed.
+    """
+
+    def __init__(self, path, app, document, page_count, digest=None, participant=PARTICIPANT,
+                 compress=COMPRESS, clock=time.monotonic):
+        """
+        Start a session
+
+        :param path: File to write, usually ending in .npz
+        :param app: Name of the recording reader ("highlight" or "block")
+        :param document: Path of the PDF being read, or its name if it was
+                         read from memory
+        :param page_count: Number of pages in the document
+        :param digest: Content hash of the PDF (extraction cache key), None
+                       to hash the file here
+        :param participant: Participant identifier
+        :param compress: Deflate the members; they can then not be memory-mapped
+        :param clock: Monotonic clock in seconds
+        """
+        self.path = path
+        self.compress = compress
+        self.clock = clock
+        self.clock_start = clock()
+        self.meta = {
+            "app": app,
+            "document": os.path.abspath(document) if os.path.isfile(document) else document,
+            "digest": digest or file_sha256(document),
+            "page_count": page_count,
+            "participant": participant,
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "clock_start": self.clock_start,
+        }
+        self.lock = threading.Lock()  # Gaze samples arrive on feed threads
+        self.events = []  # Event tuples, in EVENT_DTYPE field order
+        self.gaze = []  # GAZE_DTYPE arrays
+        self.running = False
+        self.settings = (0, 0.0, 0, 0)  # lines, delay, gaze, unit of the current pacing
+        self.closed = False
+        atexit.register(self.close)
+
+    def _event(self, kind, page=0, line=0, count=0):
+        with self.lock:
+            self.events.append((self.clock() - self.clock_start, kind, page, line, count) + self.settings)
+
+    def start(self, position, lines=0, delay=0.0, gaze=False, unit=LINE):
+        """
+        Record the start of pacing
+
+        :param position: (page number, lines of it read) where reading starts
+        :param lines: Units per iteration, 0 when following the gaze
+        :param delay: Seconds between iterations, 0 when following the gaze
+        :param gaze: Whether the gaze paces the reading
+        :param unit: Unit advanced per iteration: LINE, CLAUSE or SENTENCE
+        """
+        self.settings = (lines, delay, int(gaze), UNITS.index(unit))
+        self.running = True
+        self._event(START, *position)
+
+    def advance(self, entries, lines=None, position=None):
+        """
+        Record lines highlighted or revealed
+
+        :param entries: (PageLineIndex, line index) tuples taken from the
+                        line stream in one iteration, in order
+        :param lines: Units per iteration requested for this step, None to
+                      keep the current setting
+        :param position: (page number, lines of it read) of a step that
+                         finished no line, so replay still sees the step;
+                         None to record nothing for such a step
+        """
+        if lines is not None:
+            self.settings = (lines,) + self.settings[1:]
+        if not entries and position is not None:
+            self._event(ADVANCE, *position)
+        first = 0
+        for i in range(1, len(entries) + 1):
+            # One event per page the lines fall on
+            if i == len(entries) or entries[i][0] is not entries[first][0]:
+                self._event(ADVANCE, entries[first][0].page_number, entries[first][1], i - first)
+                first = i
+
+    def stop(self):
+        """
+        Record the end of pacing, if it was running
+        """
+        if self.running:
+            self.running = False
+            self._event(STOP)
+
+    def reset(self):
+        """
+        Record a return to the first line
+        """
+        self.stop()
+        self._event(RESET)
+
+    def add_gaze(self, samples, page_number):
+        """
+        Record gaze samples (callable from any thread)
+
+        :param samples: SAMPLE_DTYPE array
+        :param page_number: Page the samples were taken on
+        """
+        recorded = np.empty(len(samples), dtype=GAZE_DTYPE)
+        for name in ("t", "x", "y"):
+            recorded[name] = samples[name]
+        recorded["page"] = page_number
+        with self.lock:
+            recorded["event"] = len(self.events) - 1
+            self.gaze.append(recorded)
+
+    def close(self):
+        """
+        Write the session file; later calls do nothing
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.stop()
+        atexit.unregister(self.close)
+        with self.lock:
+            events = np.array(self.events, dtype=EVENT_DTYPE)
+            gaze = np.concatenate(self.gaze) if self.gaze else np.empty(0, dtype=GAZE_DTYPE)
+        save = np.savez_compressed if self.compress else np.savez
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Written next to the target and renamed, so a session file is never partial
+        temp_path = self.path + ".part"
+        with open(temp_path, "wb") as f:
+            save(f, meta=np.array(json.dumps(self.meta)), events=events, gaze=gaze)
+        os.replace(temp_path, self.path)
+        print(f"Session recorded to {self.path} ({len(events)} events, {len(gaze)} gaze samples)")
+
+
+class _NullRecorder:
+    """
+    Stands in for a SessionRecorder when recording is off.
+    """
+
+    def start(self, position, lines=0, delay=0.0, gaze=False, unit=LINE):
+        pass
+
+    def advance(self, entries, lines=None, position=None):
+        pass
+
+    def stop(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def add_gaze(self, samples, page_number):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_RECORDER = _NullRecorder()
+
+
+def open_recorder(app, document, page_count, digest=None):
+    """
+    Start recording a session into READER_RECORD
+
+    :param app: Name of the recording reader ("highlight" or "block")
+    :param document: Path of the PDF being read, or its name if it was read
+                     from memory
+    :param page_count: Number of pages in the document
+    :param digest: Content hash of the PDF, None to hash the file
+    :return: SessionRecorder, or NULL_RECORDER if recording is off
+    """
+    if not RECORD_DIR:
+        return NULL_RECORDER
+    stem = os.path.splitext(os.path.basename(document))[0]
+    name = "-".join(part for part in (PARTICIPANT, app, stem, datetime.now().strftime("%Y%m%d-%H%M%S"))
+                    if part)
+    return SessionRecorder(os.path.join(RECORD_DIR, name + ".npz"), app, document, page_count, digest)
+
+
+class Session:
+    """
+    A recorded session, with its arrays memory-mapped where possible.
+    """
+
+    def __init__(self, meta, events, gaze):
+        self.meta = meta
+        self.events = events  # EVENT_DTYPE array
+        self.gaze = gaze  # GAZE_DTYPE array
+
+    @property
+    def app(self):
+        return self.meta["app"]
+
+    @property
+    def document(self):
+        return self.meta["document"]
+
+
+_HEADER_READERS = {(1, 0): np.lib.format.read_array_header_1_0,
+                   (2, 0): np.lib.format.read_array_header_2_0}
+
+
+def _load_member(path, archive, name, mmap=True):
+    info = archive.getinfo(name + ".npy")
+    if mmap and info.compress_type == zipfile.ZIP_STORED:
+        with open(path, "rb") as f:
+            # The member's data follows its local file header
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            read_header = _HEADER_READERS.get(np.lib.format.read_magic(f))
+            if read_header is not None:
+                shape, fortran_order, dtype = read_header(f)
+                if not np.prod(shape):
+                    return np.empty(shape, dtype=dtype)
+                return np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                 order="F" if fortran_order else "C")
+    with archive.open(info) as f:
+        return np.lib.format.read_array(f)
+
+
+def load_session(path, mmap=True):
+    """
+    Open a session file
+
+    :param path: File written by a SessionRecorder
+    :param mmap: Memory-map uncompressed arrays instead of reading them
+    :return: Session
+    """
+    with zipfile.ZipFile(path) as archive:
+        meta = json.loads(str(_load_member(path, archive, "meta", mmap=False)))
+        return Session(meta, _load_member(path, archive, "events", mmap),
+                       _load_member(path, archive, "gaze", mmap))
+
+
+class SessionReplay:
+    """
+    Plays the pacing events of a session back in time, faster if asked.
+    """
+
+    def __init__(self, session, advance, reset=None, speed=1.0, clock=time.monotonic):
+        """
+        Create a stopped replay
+
+        :param session: Session to replay
+        :param advance: Function called with a number of units to highlight
+                        or reveal and the unit (LINE, CLAUSE or SENTENCE);
+                        returning False ends the replay
+        :param reset: Function called to go back to the first line, None to
+                      ignore resets
+        :param speed: Playback speed multiplier
+        :param clock: Monotonic clock in seconds
+        """
+        self.events = session.events
+        self.advance = advance
+        self.reset = reset
+        self.speed = speed
+        self.clock = clock
+        self.done = 0  # Events already played
+        self.origin = None  # Clock time the replay started
+        self.unit = UNITS.index(LINE)  # Unit of the last step played
+        self.last_step = np.nan  # Time of the last step played
+
+    def start(self):
+        self.done = 0
+        self.origin = self.clock()
+        self.unit = UNITS.index(LINE)
+        self.last_step = np.nan
+
+    @property
+    def finished(self):
+        return self.done >= len(self.events)
+
+    def tick(self):
+        """
+        Play the events due by now (call once per frame)
+
+        :return: False once every event is played or advance returned False
+        """
+        if self.finished:
+            return False
+        # Session time starts at the first event, so the time before it isn't waited out
+        now = self.events["t"][0] + (self.clock() - self.origin) * self.speed
+        due = int(np.searchsorted(self.events["t"], now, side="right"))
+        if due > self.done:
+            events = self.events[self.done:due]
+            kinds = events["kind"]
+            advancing = np.flatnonzero(kinds == ADVANCE)
+            # The gaze always advances by line; files from before units were recorded are by line
+            units = np.zeros(len(events), dtype=np.int64)
+            if "unit" in events.dtype.names:
+                units = np.where(events["gaze"] != 0, 0, events["unit"]).astype(np.int64)
+
+            # Lines are replayed by count, other units by step: the first
+            # ADVANCE event of a step carries its units per iteration
+            times = events["t"][advancing]
+            new_step = times != np.concatenate([[self.last_step], times[:-1]])
+            amounts = np.zeros(len(events), dtype=np.int64)
+            amounts[advancing] = np.where(units[advancing] == UNITS.index(LINE), events["count"][advancing],
+                                          np.where(new_step, events["lines"][advancing], 0))
+            if len(advancing):
+                self.last_step = times[-1]
+
+            # Play the runs between resets and changes of unit
+            previous = np.concatenate([[self.unit], units[advancing][:-1]])
+            changes = advancing[units[advancing] != previous]
+            cuts = sorted(np.flatnonzero(kinds == RESET).tolist() + changes.tolist()) + [len(events)]
+            first = 0
+            for cut in cuts:
+                count = int(amounts[first:cut].sum())
+                if count and self.advance(count, UNITS[self.unit]) is False:
+                    self.done = len(self.events)
+                    return False
+                if cut < len(events) and kinds[cut] == RESET:
+                    if self.reset is not None:
+                        self.reset()
+                    first = cut + 1
+                elif cut < len(events):
+                    self.unit = int(units[cut])
+                    first = cut
+            self.done = due
+        return not self.finished
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded reading session.")
+    parser.add_argument("session", help="Session file written with READER_RECORD set")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help=f"Playback speed multiplier, {MIN_SPEED:g}-{MAX_SPEED:g} (default: 1)")
+    args = parser.parse_args(argv)
+    if not MIN_SPEED <= args.speed <= MAX_SPEED:
+        parser.error(f"--speed must be between {MIN_SPEED:g} and {MAX_SPEED:g}")
+
+    session = load_session(args.session)
+    if not os.path.isfile(session.document):
+        parser.error(f"Recorded document not found: {session.document}")
+    if session.app == "highlight":
+        import tkinter as tk
+        from highlight_final import PDFHighlighterApp
+
+        root = tk.Tk()
+        root.geometry("800x900")
+        app = PDFHighlighterApp(root)
+        app.replay_session(session, args.speed)
+        root.mainloop()
+        return 0
+
+    from PyQt5.QtWidgets import QApplication
+    from block_text_final import BlockingPDFReader
+
+    qt_app = QApplication(sys.argv[:1])
+    reader = BlockingPDFReader()
+    reader.show()
+    reader.replay_session(session, args.speed)
+    return qt_app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Hit testing of gaze positions against the text layout of a page.
+
+A tracker delivers hundreds of samples a second, too many to test one by
+one against every line and word. BoxIndex buckets boxes in a uniform grid
+once per page. Each grid cell lists the boxes that overlap it in a padded
+table (every row has the same width), so a whole NumPy array of points is
+answered with a few array operations and no Python loop per point.
+PageSpatialIndex keeps one BoxIndex for the lines and one for the words of
+a PageLineIndex. All coordinates are unrotated page points, as used by the
+line quads and word boxes.
+"""
+import numpy as np
+
+LINE_TOLERANCE = 3.0  # Points a gaze sample may miss a line by and still hit it
+WORD_TOLERANCE = 2.0  # Same for words
+
+
+class BoxIndex:
+    """
+    Grid of axis-aligned boxes answering batched point queries.
+    """
+
+    def __init__(self, boxes, tolerance=0.0, cell_size=None):
+        """
+        Bucket boxes into grid cells
+
+        :param boxes: Array-like of (x0, y0, x1, y1) rows
+        :param tolerance: Largest distance from a box at which a point still hits it
+        :param cell_size: Grid cell size in points, None for twice the median box height
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.tolerance = tolerance
+        count = len(self.boxes)
+        if count == 0:
+            self.table = np.full((1, 1), -1, dtype=np.int32)
+            self.origin = (0.0, 0.0)
+            self.cell_size = 1.0
+            self.shape = (1, 1)
+            return
+
+        if cell_size is None:
+            heights = self.boxes[:, 3] - self.boxes[:, 1]
+            cell_size = max(2 * float(np.median(heights)), 1.0)
+        self.cell_size = cell_size
+
+        # Cells are found for the boxes grown by the tolerance, so every box
+        # a point could hit is listed in the point's cell
+        grown = self.boxes + np.array([-tolerance, -tolerance, tolerance, tolerance])
+        self.origin = (grown[:, 0].min(), grown[:, 1].min())
+        first = np.floor((grown[:, :2] - self.origin) / cell_size).astype(np.int64)
+        last = np.floor((grown[:, 2:] - self.origin) / cell_size).astype(np.int64)
+        columns, rows = last.max(axis=0) + 1
+        self.shape = (int(rows), int(columns))
+
+        # Expand each box into the cells it covers
+        spans = last - first + 1
+        covered = spans[:, 0] * spans[:, 1]
+        box_ids = np.repeat(np.arange(count, dtype=np.int32), covered)
+        offset = np.arange(len(box_ids)) - np.repeat(np.cumsum(covered) - covered, covered)
+        width = np.repeat(spans[:, 0], covered)
+        cell_x = np.repeat(first[:, 0], covered) + offset % width
+        cell_y = np.repeat(first[:, 1], covered) + offset // width
+        cells = cell_y * columns + cell_x
+
+        # Sort by cell (box order kept within a cell) and lay the lists out
+        # as rows of a padded table
+        order = np.argsort(cells, kind="stable")
+        cells, box_ids = cells[order], box_ids[order]
+        per_cell = np.bincount(cells, minlength=rows * columns)
+        starts = np.cumsum(per_cell) - per_cell
+        self.table = np.full((rows * columns, max(int(per_cell.max()), 1)), -1, dtype=np.int32)
+        self.table[cells, np.arange(len(cells)) - starts[cells]] = box_ids
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def query(self, x, y):
+        """
+        Find the box under each point
+
+        :param x: Array of x coordinates
+        :param y: Array of y coordinates
+        :return: int32 array with the index of the nearest box within the
+                 tolerance of each point, or -1
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        rows, columns = self.shape
+        cell_x = np.clip(np.floor((x - self.origin[0]) / self.cell_size), 0, columns - 1).astype(np.int64)
+        cell_y = np.clip(np.floor((y - self.origin[1]) / self.cell_size), 0, rows - 1).astype(np.int64)
+        candidates = self.table[cell_y * columns + cell_x]  # (points, table width)
+        if not len(self.boxes):
+            return candidates[:, 0]
+
+        box = self.boxes[candidates]
+        dx = np.maximum(np.maximum(box[..., 0] - x[:, None], x[:, None] - box[..., 2]), 0)
+        dy = np.maximum(np.maximum(box[..., 1] - y[:, None], y[:, None] - box[..., 3]), 0)
+        distance = np.where(candidates >= 0, dx * dx + dy * dy, np.inf)
+        nearest = distance.argmin(axis=1)
+        points = np.arange(len(x))
+        hit = distance[points, nearest] <= self.tolerance ** 2
+        return np.where(hit, candidates[points, nearest], -1).astype(np.int32)
+
+
+class PageSpatialIndex:
+    """
+    Line and word hit testing for one page.
+    """
+
+    def __init__(self, page_lines, line_tolerance=LINE_TOLERANCE, word_tolerance=WORD_TOLERANCE):
+        """
+        Index the lines and words of a page
+
+        :param page_lines: PageLineIndex of the page
+        :param line_tolerance: Distance in points a point may miss a line by
+        :param word_tolerance: Distance in points a point may miss a word by
+        """
+        self.page_number = page_lines.page_number
+        line_boxes = []
+        for index in range(len(page_lines)):
+            quads = page_lines.line_quads(index)
+            rects = np.array([tuple(quad.rect) for quad in quads]).reshape(-1, 4)
+            line_boxes.append((rects[:, 0].min(), rects[:, 1].min(), rects[:, 2].max(), rects[:, 3].max()))
+        self.lines = BoxIndex(line_boxes, line_tolerance)
+        self.words = BoxIndex([word[:4] for word in page_lines.words], word_tolerance)
+
+    def lookup(self, x, y):
+        """
+        Find the line and word under each point
+
+        :param x: Array of x coordinates in page points
+        :param y: Array of y coordinates in page points
+        :return: Tuple of int32 arrays (line index, word index), -1 where
+                 nothing is hit
+        """
+        return self.lines.query(x, y), self.words.query(x, y)
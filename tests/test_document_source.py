@@ -0,0 +1,36 @@
+import gc
+
+import fitz  # PyMuPDF
+
+from document_source import DocumentSource
+from render_cache import RenderCache, document_fingerprint
+
+
+def pdf_bytes(text):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 100), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_memory_sources_are_keyed_by_contents():
+    blobs = [pdf_bytes("First document"), pdf_bytes("Second document")]
+    cache = RenderCache(1 << 26)
+    fingerprints = set()
+    for i in range(20):
+        # Each source is freed before the next one, so ids get reused
+        doc = DocumentSource(blobs[i % 2]).open()
+        fingerprints.add(document_fingerprint(doc))
+        pix = cache.render(doc[0], fitz.Matrix(1, 1))
+        assert pix.samples == doc[0].get_pixmap().samples
+        doc.close()
+        del doc
+        gc.collect()
+    assert len(fingerprints) == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_same_bytes_share_a_fingerprint():
+    data = pdf_bytes("Same")
+    assert DocumentSource(data).fingerprint == DocumentSource(bytearray(data)).fingerprint
@@ -0,0 +1,103 @@
+import os
+
+import fitz  # PyMuPDF
+import pytest
+
+import extraction_cache
+from extraction_cache import ExtractionCache
+from line_index import PageLineIndex
+
+
+def write_pdf(path, text):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 100), text)
+    doc.save(path)
+    doc.close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExtractionCache(str(tmp_path / "cache.sqlite3"))
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    # Paths hashed by the cache
+    hashed = []
+    sha256 = extraction_cache.file_sha256
+
+    def counting(path):
+        hashed.append(path)
+        return sha256(path)
+
+    monkeypatch.setattr(extraction_cache, "file_sha256", counting)
+    return hashed
+
+
+def test_unchanged_file_is_hashed_once(cache, hashes, tmp_path):
+    path = str(tmp_path / "a.pdf")
+    write_pdf(path, "First version")
+    assert cache.document_key(path) == cache.document_key(path)
+    assert len(hashes) == 1
+
+
+def test_new_mtime_rehashes(cache, hashes, tmp_path):
+    path = str(tmp_path / "a.pdf")
+    write_pdf(path, "First version")
+    digest = cache.document_key(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.document_key(path) == digest  # Same contents, same key
+    assert len(hashes) == 2
+
+
+def test_changed_contents_invalidate_the_pages(cache, hashes, tmp_path):
+    path = str(tmp_path / "a.pdf")
+    write_pdf(path, "First version")
+    old = cache.document_key(path)
+    with fitz.open(path) as doc:
+        cache.page_lines(doc[0], old)
+    assert cache.load(old, 0) is not None
+
+    write_pdf(path, "Second version, a little longer")  # New size and mtime
+    new = cache.document_key(path)
+    assert new != old
+    assert len(hashes) == 2
+    assert cache.load(old, 0) is None
+    assert cache.load(new, 0) is None
+
+
+def test_pages_shared_by_another_file_are_kept(cache, tmp_path):
+    first, second = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    write_pdf(first, "Same text")
+    with open(first, "rb") as f:
+        contents = f.read()
+    with open(second, "wb") as f:
+        f.write(contents)
+    digest = cache.document_key(first)
+    assert cache.document_key(second) == digest
+    with fitz.open(first) as doc:
+        cache.page_lines(doc[0], digest)
+
+    write_pdf(first, "Different text now")
+    cache.document_key(first)
+    assert cache.load(digest, 0) is not None
+
+
+def test_page_lines_extract_only_on_a_miss(cache, monkeypatch, tmp_path):
+    path = str(tmp_path / "a.pdf")
+    write_pdf(path, "Cached line")
+    digest = cache.document_key(path)
+    extracted = []
+    extract = PageLineIndex.extract
+
+    def counting(page):
+        extracted.append(page.number)
+        return extract(page)
+
+    monkeypatch.setattr(PageLineIndex, "extract", staticmethod(counting))
+    with fitz.open(path) as doc:
+        first = cache.page_lines(doc[0], digest)
+        again = cache.page_lines(doc[0], digest)
+    assert extracted == [0]
+    assert again.to_data() == first.to_data()
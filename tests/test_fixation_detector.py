@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from fixation_detector import FIXATION_END, FIXATION_START, IDTDetector, IVTDetector
+from gaze_simulator import SAMPLE_DTYPE
+
+RATE = 1000
+
+
+def reading_gaze(seed=0):
+    # Fixations of 80-300 ms along a line, joined by 30 ms saccades, with tracker noise
+    rng = np.random.default_rng(seed)
+    xs, ys = [], []
+    x, y = 72.0, 100.0
+    for _ in range(40):
+        fixation = int(rng.integers(80, 300))
+        xs.append(np.full(fixation, x))
+        ys.append(np.full(fixation, y))
+        target = x + rng.uniform(20, 60) if x < 450 else 72.0
+        ys_target = y if x < 450 else y + 14
+        xs.append(np.linspace(x, target, 30, endpoint=False))
+        ys.append(np.linspace(y, ys_target, 30, endpoint=False))
+        x, y = target, ys_target
+    samples = np.zeros(sum(len(part) for part in xs), dtype=SAMPLE_DTYPE)
+    samples["t"] = np.arange(len(samples)) / RATE
+    samples["x"] = np.concatenate(xs) + rng.normal(0, 0.5, len(samples))
+    samples["y"] = np.concatenate(ys) + rng.normal(0, 0.5, len(samples))
+    return samples
+
+
+def detect(detector, samples, chunk):
+    events = [detector.process(samples[i:i + chunk]) for i in range(0, len(samples), chunk)]
+    return np.concatenate(events)
+
+
+@pytest.mark.parametrize("make_detector", [lambda: IVTDetector(rate=RATE), lambda: IDTDetector(rate=RATE)],
+                         ids=["ivt", "idt"])
+@pytest.mark.parametrize("chunk", [1, 7, 33, 250, 4096])
+def test_events_do_not_depend_on_batch_size(make_detector, chunk):
+    samples = reading_gaze()
+    whole = make_detector().process(samples)
+    streamed = detect(make_detector(), samples, chunk)
+
+    assert len(whole) > 20
+    np.testing.assert_array_equal(streamed["kind"], whole["kind"])
+    np.testing.assert_allclose(streamed["start"], whole["start"])
+    # A start event reports the fixation as far as the batch it came in
+    # reached, so only finished fixations are the same down to the centroid
+    ended = whole["kind"] == FIXATION_END
+    for field in ("duration", "x", "y"):
+        np.testing.assert_allclose(streamed[field][ended], whole[field][ended], rtol=1e-5, atol=1e-3)
+    started = streamed[~ended]
+    assert (started["duration"] >= 0.06 - 1e-6).all()
+
+
+@pytest.mark.parametrize("detector", [IVTDetector(rate=RATE), IDTDetector(rate=RATE)], ids=["ivt", "idt"])
+def test_fixations_start_before_they_end(detector):
+    events = detect(detector, reading_gaze(1), 100)
+    kinds = events["kind"].tolist()
+    # Every fixation is announced once, then ended once (the last may still be open)
+    assert kinds[:2] == [FIXATION_START, FIXATION_END]
+    assert all(a != b for a, b in zip(kinds, kinds[1:]))
+    ends = events[events["kind"] == FIXATION_END]
+    assert (ends["duration"] >= 0.06 - 1e-6).all()
+
+
+def test_rate_is_estimated_from_single_samples():
+    samples = reading_gaze(2)
+    known = IVTDetector(rate=RATE).process(samples)
+    estimated = detect(IVTDetector(), samples, 1)
+    np.testing.assert_array_equal(estimated["kind"], known["kind"])
+    np.testing.assert_allclose(estimated["start"], known["start"])
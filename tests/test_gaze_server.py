@@ -0,0 +1,86 @@
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from gaze_server import GazeRingBuffer, GazeServer, parse_address
+from gaze_simulator import SAMPLE_DTYPE
+
+
+def samples(first, count):
+    batch = np.zeros(count, dtype=SAMPLE_DTYPE)
+    batch["t"] = np.arange(first, first + count)
+    batch["x"] = batch["t"] * 2
+    return batch
+
+
+def test_drain_returns_samples_in_order_across_the_wrap():
+    ring = GazeRingBuffer(8)
+    ring.write(samples(0, 5))
+    assert ring.drain()["t"].tolist() == [0, 1, 2, 3, 4]
+    ring.write(samples(5, 6))  # Positions 5, 6, 7, 0, 1, 2
+    drained = ring.drain()
+    assert drained["t"].tolist() == [5, 6, 7, 8, 9, 10]
+    assert drained["x"].tolist() == [10, 12, 14, 16, 18, 20]
+    assert ring.dropped == 0
+    assert len(ring.drain()) == 0
+
+
+def test_unread_samples_are_overwritten_and_counted():
+    ring = GazeRingBuffer(8)
+    ring.write(samples(0, 6))
+    ring.write(samples(6, 5))
+    assert ring.drain()["t"].tolist() == list(range(3, 11))
+    assert ring.dropped == 3
+
+
+@pytest.mark.parametrize("already", [0, 3, 8, 13])
+def test_write_larger_than_capacity_keeps_the_newest_in_order(already):
+    ring = GazeRingBuffer(8)
+    ring.write(samples(0, already))
+    ring.drain()
+    dropped = ring.dropped
+    ring.write(samples(already, 21))
+    assert ring.drain()["t"].tolist() == list(range(already + 13, already + 21))
+    assert ring.dropped - dropped == 13
+    ring.write(samples(already + 21, 2))
+    assert ring.drain()["t"].tolist() == [already + 21, already + 22]
+
+
+def test_parse_address():
+    assert parse_address("udp://127.0.0.1:4242") == ("udp", "127.0.0.1", 4242)
+    assert parse_address("tcp://[::1]:4242") == ("tcp", "::1", 4242)
+    assert parse_address("unix:///tmp/gaze.sock") == ("unix", "/tmp/gaze.sock", None)
+    for address in ("udp://host", "http://host:80", "tcp://:80", "unix://"):
+        with pytest.raises(ValueError):
+            parse_address(address)
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_udp_datagrams_arrive_in_order():
+    port = free_udp_port()
+    server = GazeServer(f"udp://127.0.0.1:{port}")
+    server.start()
+    try:
+        sent = samples(0, 300)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for i in range(100):  # One sample per datagram, as gaze_sender sends by default
+                sock.sendto(sent[i:i + 1].tobytes(), ("127.0.0.1", port))
+            sock.sendto(sent[100:300].tobytes(), ("127.0.0.1", port))
+            sock.sendto(b"\0" * 20, ("127.0.0.1", port))  # A partial record is dropped
+        received = []
+        deadline = time.monotonic() + 5
+        while sum(len(batch) for batch in received) < 301 and time.monotonic() < deadline:
+            received.append(server.ring.drain())
+            time.sleep(0.01)
+    finally:
+        server.stop()
+    received = np.concatenate(received)
+    assert received["t"].tolist() == list(range(300)) + [0]
+    assert received["x"][:300].tolist() == sent["x"].tolist()
@@ -0,0 +1,87 @@
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+from gaze_simulator import GazeSimulator
+from line_index import PageLineIndex
+
+TEXT = ("Reading comprehension improves when attention is guided through dense text, "
+        "one line at a time, while the rest of the page stays out of the way. ") * 4
+
+
+@pytest.fixture(scope="module")
+def page_lines():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(72, 72, 400, 400), TEXT, fontsize=11)
+    yield PageLineIndex.extract(page)
+    doc.close()
+
+
+def read_all(simulator, seconds=0.25):
+    batches = []
+    while not simulator.finished:
+        batches.append(simulator.next_batch(seconds))
+    return np.concatenate([b[0] for b in batches]), np.concatenate([b[1] for b in batches])
+
+
+def runs(mask):
+    # (start, end) index pairs of the runs of True
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+@pytest.mark.parametrize("rate", [60, 250, 1000])
+def test_samples_follow_the_rate(page_lines, rate):
+    simulator = GazeSimulator(page_lines, rate, rng=np.random.default_rng(0), start_time=5.0)
+    first, _ = simulator.next_batch(0.1)
+    assert len(first) == round(0.1 * rate)
+    samples, _ = read_all(simulator)
+    samples = np.concatenate([first, samples])
+
+    assert len(samples) == len(simulator) == int(np.ceil(simulator.duration * rate))
+    assert samples["t"][0] == 5.0
+    np.testing.assert_allclose(np.diff(samples["t"]), 1 / rate)
+    assert len(simulator.next_batch(0.1)[0]) == 0
+
+
+def test_timestamps_increase_across_batches(page_lines):
+    simulator = GazeSimulator(page_lines, 500, rng=np.random.default_rng(1))
+    samples, _ = read_all(simulator, seconds=0.013)
+    assert (np.diff(samples["t"]) > 0).all()
+
+
+def test_fixations_alternate_with_saccades(page_lines):
+    rate = 1000
+    simulator = GazeSimulator(page_lines, rate, rng=np.random.default_rng(2))
+    samples, lines = read_all(simulator)
+    fixations = runs(lines >= 0)
+
+    # Every planned fixation shows as one run of samples on its line,
+    # separated by saccade samples (line -1) of at least the minimal saccade
+    assert len(fixations) == len(simulator.fix_start)
+    for (start, end), planned, line, x in zip(fixations, simulator.fix_duration, simulator.fix_line,
+                                              simulator.fix_x):
+        assert (lines[start:end] == line).all()
+        assert abs((end - start) / rate - planned) <= 1.5 / rate
+        assert abs(np.median(samples["x"][start:end]) - x) < 1.0
+    gaps = [next_start - end for (_, end), (next_start, _) in zip(fixations, fixations[1:])]
+    assert min(gaps) >= simulator.model.saccade_ms * rate / 1000 - 1
+
+    # Reading moves down the page, regressions aside
+    assert simulator.fix_line[0] == 0
+    assert simulator.fix_line[-1] == len(page_lines) - 1
+    assert (np.diff(simulator.fix_line) >= 0).mean() > 0.9
+
+
+def test_fixation_durations_are_plausible(page_lines):
+    simulator = GazeSimulator(page_lines, 1000, rng=np.random.default_rng(3))
+    assert 0.15 < np.median(simulator.fix_duration) < 0.35
+    assert (simulator.fix_duration > 0).all()
+
+
+def test_first_line_and_seed(page_lines):
+    simulator = GazeSimulator(page_lines, 250, rng=np.random.default_rng(4), first_line=2)
+    assert simulator.fix_line.min() == 2
+    again = GazeSimulator(page_lines, 250, rng=np.random.default_rng(4), first_line=2)
+    np.testing.assert_array_equal(read_all(simulator)[0], read_all(again)[0])
@@ -0,0 +1,113 @@
+import pytest
+
+from pacing import CATCH_UP, SKIP, STRETCH, DeadlineScheduler
+
+
+class FakeLoop:
+    """
+    Event loop with a manual clock, standing in for Tk's after() or a QTimer.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.armed = []  # (due time, callback)
+
+    def clock(self):
+        return self.now
+
+    def arm(self, delay, callback):
+        self.armed.append((self.now + max(delay, 0), callback))
+
+    def run(self, until):
+        while self.armed:
+            self.armed.sort(key=lambda entry: entry[0])
+            due, callback = self.armed.pop(0)
+            if due > until:
+                return
+            self.now = max(self.now, due)
+            callback()
+
+
+def paced(policy, work):
+    """
+    Run a 100 ms scheduler whose ticks take the given seconds of work
+
+    :return: List of the clock times the ticks fired at, and the scheduler
+    """
+    loop = FakeLoop()
+    fired = []
+
+    def tick():
+        fired.append(round(loop.now, 6))
+        loop.now += work[len(fired) - 1] if len(fired) <= len(work) else 0.01
+
+    scheduler = DeadlineScheduler(0.1, tick, loop.arm, policy=policy, clock=loop.clock)
+    scheduler.start()
+    loop.run(0.6)
+    return fired, scheduler
+
+
+def test_ticks_stay_on_the_grid_despite_work():
+    fired, scheduler = paced(SKIP, [0.03] * 10)
+    assert fired == [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+    assert scheduler.overruns == 0
+
+
+def test_skip_drops_missed_deadlines():
+    fired, scheduler = paced(SKIP, [0.35])
+    assert fired == [0.0, 0.4, 0.5, 0.6]
+    assert scheduler.overruns == 1
+    assert scheduler.skipped == 3
+
+
+def test_catch_up_runs_missed_deadlines_back_to_back():
+    fired, scheduler = paced(CATCH_UP, [0.35])
+    assert fired == [0.0, 0.35, 0.36, 0.37, 0.4, 0.5, 0.6]
+    assert scheduler.skipped == 0
+    assert scheduler.ticks == 7
+
+
+def test_stretch_reanchors_the_grid():
+    fired, scheduler = paced(STRETCH, [0.35])
+    assert fired == [0.0, 0.35, 0.45, 0.55]
+    assert scheduler.overruns == 1
+    assert scheduler.skipped == 0
+
+
+def test_stop_ignores_the_armed_tick():
+    loop = FakeLoop()
+    fired = []
+    scheduler = DeadlineScheduler(0.1, lambda: fired.append(loop.now), loop.arm, clock=loop.clock)
+    scheduler.start(immediate=False)
+    scheduler.stop()
+    loop.run(1.0)
+    assert fired == []
+    assert not scheduler.is_active()
+
+
+def test_tick_returning_false_stops():
+    loop = FakeLoop()
+    scheduler = DeadlineScheduler(0.1, lambda: False, loop.arm, clock=loop.clock)
+    scheduler.start()
+    loop.run(1.0)
+    assert scheduler.ticks == 1
+    assert not scheduler.is_active()
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        DeadlineScheduler(0.1, lambda: None, FakeLoop().arm, policy="sometimes")
+
+
+def test_start_resets_the_statistics():
+    loop = FakeLoop()
+    scheduler = DeadlineScheduler(0.1, lambda: None, loop.arm, clock=loop.clock)
+    scheduler.start()
+    loop.run(0.55)
+    assert scheduler.stats()["ticks"] == 6
+    scheduler.stop()
+    scheduler.start()
+    loop.run(0.85)
+    stats = scheduler.stats()
+    assert stats["ticks"] == 4
+    assert len(scheduler.lateness) == 4
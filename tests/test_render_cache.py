@@ -0,0 +1,51 @@
+import fitz  # PyMuPDF
+
+from render_cache import RenderCache, document_fingerprint
+
+
+def new_document(text):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 100), text)
+    return doc
+
+
+def test_documents_created_in_memory_are_not_cached():
+    cache = RenderCache(1 << 26)
+    for text in ("First", "Second", "Third"):
+        doc = new_document(text)
+        assert document_fingerprint(doc) is None
+        pix = cache.render(doc[0], fitz.Matrix(1, 1))
+        assert pix.samples == doc[0].get_pixmap().samples
+        doc.close()
+    assert cache.stats()["entries"] == 0
+
+
+def test_streams_are_keyed_by_contents():
+    data = [new_document(text).tobytes() for text in ("First", "Second")]
+    fingerprints = set()
+    for i in range(6):
+        doc = fitz.open(stream=data[i % 2], filetype="pdf")
+        fingerprints.add(document_fingerprint(doc))
+        doc.close()
+    assert len(fingerprints) == 2
+
+
+def test_files_are_keyed_by_path_and_modification(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    new_document("File").save(path)
+    with fitz.open(path) as doc:
+        before = document_fingerprint(doc)
+    new_document("Changed file").save(path)
+    with fitz.open(path) as doc:
+        assert document_fingerprint(doc) != before
+
+
+def test_eviction_keeps_the_budget():
+    doc = new_document("Budget")
+    size = doc[0].get_pixmap().stride * doc[0].get_pixmap().height
+    cache = RenderCache(size * 2)
+    for zoom in (1, 1.0001, 1.0002):
+        cache.put(RenderCache.make_key("doc", 0, fitz.Matrix(zoom, zoom)), doc[0].get_pixmap())
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert cache.get(RenderCache.make_key("doc", 0, fitz.Matrix(1, 1))) is None
@@ -0,0 +1,70 @@
+import fitz  # PyMuPDF
+import pytest
+
+from line_index import PageLineIndex
+from sentence_index import CLAUSE, LINE, SENTENCE, PageSentenceIndex
+
+LINES = [
+    "Reading is slow, e.g. on screens. Smith et al. agree.",
+    "Dense text needs compre-",
+    "hension and care; it helps. The end!",
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    doc = fitz.open()
+    page = doc.new_page()
+    for i, text in enumerate(LINES):
+        page.insert_text((72, 100 + 14 * i), text, fontsize=11)
+    yield PageSentenceIndex(PageLineIndex.extract(page))
+    doc.close()
+
+
+def texts(index, unit):
+    return [index.unit_text(unit, i) for i in range(index.count(unit))]
+
+
+def test_sentences_skip_abbreviations(index):
+    assert texts(index, SENTENCE) == [
+        "Reading is slow, e.g. on screens.",
+        "Smith et al. agree.",
+        "Dense text needs comprehension and care; it helps.",
+        "The end!",
+    ]
+
+
+def test_clauses_split_sentences_at_punctuation(index):
+    assert texts(index, CLAUSE) == [
+        "Reading is slow,",
+        "e.g. on screens.",
+        "Smith et al. agree.",
+        "Dense text needs comprehension and care;",
+        "it helps.",
+        "The end!",
+    ]
+
+
+def test_lines_follow_the_line_table(index):
+    assert index.count(LINE) == 3
+    assert [index.unit_lines(LINE, i) for i in range(3)] == [(0, 0), (1, 1), (2, 2)]
+
+
+def test_hyphenated_sentence_spans_two_lines(index):
+    assert index.unit_lines(SENTENCE, 2) == (1, 2)
+    assert len(index.unit_quads(SENTENCE, 2)) == 2  # One quad per line
+    start = index.text.index("comprehension")
+    first, end = index.words_at(start, start + len("comprehension"))
+    assert index.lines[first:end].tolist() == [1, 2]  # Both halves of the word
+
+
+def test_unit_at_line(index):
+    assert [index.unit_at_line(SENTENCE, line) for line in range(4)] == [0, 2, 3, 4]
+    assert index.unit_at_line(CLAUSE, 2) == 4
+
+
+def test_empty_page():
+    doc = fitz.open()
+    index = PageSentenceIndex(PageLineIndex.extract(doc.new_page()))
+    assert [index.count(unit) for unit in (LINE, CLAUSE, SENTENCE)] == [0, 0, 0]
+    assert index.unit_at_line(SENTENCE, 0) == 0
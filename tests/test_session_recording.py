@@ -0,0 +1,85 @@
+import fitz  # PyMuPDF
+import pytest
+
+from pdf_reader import PDFReader
+from sentence_index import CLAUSE, LINE, SENTENCE
+from session_recording import SessionRecorder, SessionReplay, load_session
+
+TEXT = ("Reading is slow, e.g. on screens. Smith et al. agree, mostly. Dense text needs care; "
+        "it helps to pace it. The end is near! ") * 6
+
+
+@pytest.fixture(scope="module")
+def pdf_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pdf") / "doc.pdf")
+    doc = fitz.open()
+    for _ in range(2):
+        doc.new_page().insert_textbox(fitz.Rect(72, 72, 400, 500), TEXT, fontsize=11)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def record(pdf_path, path, runs):
+    # Highlight the runs of (unit, units per step, steps), one step per second
+    clock = FakeClock()
+    reader = PDFReader(pdf_path, unit=LINE)
+    recorder = SessionRecorder(path, "highlight", pdf_path, len(reader.doc), digest="test", clock=clock)
+    reader.recorder = recorder
+    try:
+        for unit, per_step, steps in runs:
+            reader.set_unit(unit)
+            recorder.start(reader.stream.position, per_step, 1.0, unit=unit)
+            for _ in range(steps):
+                clock.now += 1
+                reader.next_sentences(per_step)
+            recorder.stop()
+        return [quads for _, _, quads in reader.pending_annotations]
+    finally:
+        recorder.close()
+        reader.close()
+
+
+def replay(pdf_path, path):
+    reader = PDFReader(pdf_path, unit=LINE)
+    played = []
+
+    def advance(count, unit):
+        played.append((unit, count))
+        if unit != reader.unit:
+            reader.set_unit(unit)
+        return bool(reader.next_sentences(count))
+
+    clock = FakeClock()
+    replayer = SessionReplay(load_session(path), advance, clock=clock)
+    replayer.start()
+    try:
+        while replayer.tick():
+            clock.now += 0.5
+        return [quads for _, _, quads in reader.pending_annotations], played
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize("runs", [
+    [(SENTENCE, 2, 5)],
+    [(CLAUSE, 1, 6)],
+    [(LINE, 3, 4), (SENTENCE, 1, 3), (CLAUSE, 2, 2), (LINE, 1, 2)],
+], ids=["sentence", "clause", "mixed"])
+def test_replay_shows_the_recorded_units(pdf_path, tmp_path, runs):
+    path = str(tmp_path / "session.npz")
+    recorded = record(pdf_path, path, runs)
+    replayed, played = replay(pdf_path, path)
+
+    assert {unit for unit, _ in played} == {unit for unit, _, _ in runs}
+    assert len(replayed) == len(recorded)
+    for a, b in zip(replayed, recorded):
+        assert [tuple(q.rect) for q in a] == [tuple(q.rect) for q in b]
@@ -0,0 +1,43 @@
+import time
+
+import fitz  # PyMuPDF
+
+from render_cache import RenderCache
+from tile_renderer import TileRenderer
+
+
+class BrokenCache(RenderCache):
+    def render(self, page, matrix, clip=None, annots=True, fingerprint=None):
+        raise RuntimeError("cannot render")
+
+
+def wait_idle(renderer):
+    deadline = time.monotonic() + 10
+    failures = []
+    while renderer.busy() and time.monotonic() < deadline:
+        failures += renderer.take_ready()[1]
+        time.sleep(0.01)
+    return failures + renderer.take_ready()[1]
+
+
+def test_failed_tiles_are_reported_once(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 100), "Tiles")
+    doc.save(path)
+    doc.close()
+
+    with fitz.open(path) as doc:
+        renderer = TileRenderer(doc, cache=BrokenCache(1 << 20), prefetch_ring=0)
+        try:
+            viewport = fitz.Rect(0, 0, 300, 300)
+            assert renderer.request(0, 2, viewport) == []
+            first = wait_idle(renderer)
+            assert first and all(failure[-1] == "cannot render" for failure in first)
+
+            # Panning over the failed tiles queues nothing, so polling stops
+            renderer.request(0, 2, viewport)
+            assert not renderer.busy()
+            assert wait_idle(renderer) == []
+        finally:
+            renderer.close()
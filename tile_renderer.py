@@ -0,0 +1,258 @@
+"""
+Tiled rendering for deep zoom.
+
+At high zoom a whole page can take hundreds of MB to rasterize, most of it
+off screen. TileRenderer splits the zoomed page into TILE_SIZE x TILE_SIZE
+tiles, renders only the ones intersecting the viewport (clipped
+get_pixmap calls), prefetches a ring of neighbouring tiles on background
+threads, and keeps tiles in the byte-budgeted render cache.
+
+Finished tiles, and the errors of tiles that failed to render, are
+collected in a thread-safe queue that the GUI drains once per frame with
+take_ready(), so neither toolkit is touched from a worker thread. A tile
+that failed is not rendered again, so each failure is reported once.
+draw_tiles_tk and draw_tiles_qt paint tiles onto a Tk canvas or with a
+QPainter; the Qt reader shows its zoomed pages this way.
+"""
+import math
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+
+from document_source import source_of
+from render_adapter import pixmap_to_image, pixmap_to_qimage
+from render_cache import RenderCache, document_fingerprint, shared_cache
+
+TILE_SIZE = 256
+ZOOM_STEPS_PER_OCTAVE = 4
+
+
+def quantize_zoom(zoom):
+    """
+    Snap a zoom factor to the nearest tile zoom level, so nearby zooms share tiles
+
+    :param zoom: Requested zoom factor
+    :return: Zoom factor of the level
+    """
+    return 2 ** (round(math.log2(zoom) * ZOOM_STEPS_PER_OCTAVE) / ZOOM_STEPS_PER_OCTAVE)
+
+
+class TileRenderer:
+    """
+    Renders and caches the tiles of zoomed pages.
+    """
+
+    def __init__(self, document, cache=shared_cache, workers=2, tile_size=TILE_SIZE, prefetch_ring=1):
+        """
+        Create a tile renderer for an open PDF file
+
+        :param document: fitz.Document opened from a file or a DocumentSource
+        :param cache: RenderCache holding the tiles
+        :param workers: Number of background render threads
+        :param tile_size: Tile width and height in pixels
+        :param prefetch_ring: Tiles around the viewport to render ahead
+        """
+        self.source = source_of(document)
+        self.fingerprint = document_fingerprint(document)
+        self.page_rects = {}  # Page number -> page rectangle
+        self.document = document
+        self.cache = cache
+        self.tile_size = tile_size
+        self.prefetch_ring = prefetch_ring
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.thread_local = threading.local()
+        self.thread_documents = []  # Handles opened by the worker threads, closed by close()
+        self.closed = False
+        self.pending = set()  # (page number, zoom, tx, ty) queued or rendering
+        self.failed = set()  # Jobs that failed to render, not retried
+        self.lock = threading.Lock()
+        self.ready = queue.Queue()  # (job, pixmap, error) finished by workers, waiting for the GUI
+
+    def _page_rect(self, page_number):
+        rect = self.page_rects.get(page_number)
+        if rect is None:
+            rect = self.page_rects[page_number] = self.document[page_number].rect
+        return rect
+
+    def _tile_key(self, page_number, zoom, tx, ty):
+        # page.rect and the clip already follow the page rotation, so the
+        # tile grid maps to the page with the zoom alone
+        matrix = fitz.Matrix(zoom, zoom)
+        size = self.tile_size
+        tile = fitz.Rect(tx * size, ty * size, (tx + 1) * size, (ty + 1) * size)
+        clip = (tile * ~matrix) & self._page_rect(page_number)
+        return matrix, clip
+
+    def tile_grid(self, page_number, zoom):
+        """
+        Get the number of tile columns and rows of a zoomed page
+
+        :return: Tuple of (columns, rows)
+        """
+        zoomed = self._page_rect(page_number) * fitz.Matrix(zoom, zoom)
+        return (math.ceil(zoomed.width / self.tile_size), math.ceil(zoomed.height / self.tile_size))
+
+    def visible_tiles(self, page_number, zoom, viewport, margin=0):
+        """
+        List the tiles intersecting a viewport
+
+        :param page_number: Zero-based page number
+        :param zoom: Zoom factor (see quantize_zoom)
+        :param viewport: fitz.Rect of the visible area in zoomed page pixels
+        :param margin: Extra rings of tiles around the viewport
+        :return: List of (tx, ty) tile coordinates, nearest the viewport centre first
+        """
+        columns, rows = self.tile_grid(page_number, zoom)
+        size = self.tile_size
+        x0 = max(int(viewport.x0 // size) - margin, 0)
+        y0 = max(int(viewport.y0 // size) - margin, 0)
+        x1 = min(int(math.ceil(viewport.x1 / size)) + margin, columns)
+        y1 = min(int(math.ceil(viewport.y1 / size)) + margin, rows)
+        centre = ((viewport.x0 + viewport.x1) / 2 / size, (viewport.y0 + viewport.y1) / 2 / size)
+        tiles = [(tx, ty) for ty in range(y0, y1) for tx in range(x0, x1)]
+        tiles.sort(key=lambda t: (t[0] + 0.5 - centre[0]) ** 2 + (t[1] + 0.5 - centre[1]) ** 2)
+        return tiles
+
+    def cached_tile(self, page_number, zoom, tx, ty):
+        """
+        Look up a rendered tile
+
+        :return: fitz.Pixmap (positioned by pix.x, pix.y in zoomed pixels), or None
+        """
+        matrix, clip = self._tile_key(page_number, zoom, tx, ty)
+        return self.cache.get(RenderCache.make_key(self.fingerprint, page_number, matrix, clip))
+
+    def request(self, page_number, zoom, viewport):
+        """
+        Get the visible tiles that are ready, and queue the rest plus a
+        prefetch ring for the background workers
+
+        :param page_number: Zero-based page number
+        :param zoom: Zoom factor
+        :param viewport: fitz.Rect of the visible area in zoomed page pixels
+        :return: List of (tx, ty, fitz.Pixmap) ready now; the others arrive
+                 through take_ready()
+        """
+        ready = []
+        visible = self.visible_tiles(page_number, zoom, viewport)
+        for tx, ty in visible:
+            pix = self.cached_tile(page_number, zoom, tx, ty)
+            if pix is not None:
+                ready.append((tx, ty, pix))
+            else:
+                self._submit(page_number, zoom, tx, ty)
+
+        visible = set(visible)
+        for tx, ty in self.visible_tiles(page_number, zoom, viewport, self.prefetch_ring):
+            if (tx, ty) not in visible and self.cached_tile(page_number, zoom, tx, ty) is None:
+                self._submit(page_number, zoom, tx, ty)
+        return ready
+
+    def take_ready(self):
+        """
+        Collect the tiles finished since the last call (call from the GUI thread)
+
+        :return: Tuple of (tiles, failures): lists of (page number, zoom, tx,
+                 ty, fitz.Pixmap) rendered and of (page number, zoom, tx, ty,
+                 error message) that failed to render
+        """
+        tiles = []
+        failures = []
+        while True:
+            try:
+                job, pix, error = self.ready.get_nowait()
+            except queue.Empty:
+                return tiles, failures
+            if error is None:
+                tiles.append(job + (pix,))
+            else:
+                failures.append(job + (error,))
+
+    def busy(self):
+        """
+        Check for tiles queued, rendering or not yet collected by take_ready()
+
+        :return: True if polling take_ready() may still deliver tiles
+        """
+        with self.lock:
+            return bool(self.pending) or not self.ready.empty()
+
+    def _submit(self, page_number, zoom, tx, ty):
+        job = (page_number, zoom, tx, ty)
+        with self.lock:
+            if job in self.pending or job in self.failed:
+                return
+            self.pending.add(job)
+        matrix, clip = self._tile_key(page_number, zoom, tx, ty)
+        self.executor.submit(self._render, job, matrix, clip)
+
+    def _render(self, job, matrix, clip):
+        if self.closed:
+            return  # Queued before close(), not worth rendering
+        try:
+            # MuPDF documents are not thread-safe, so each worker reads its own handle
+            doc = getattr(self.thread_local, "doc", None)
+            if doc is None:
+                doc = self.thread_local.doc = self.source.open()
+                with self.lock:
+                    self.thread_documents.append(doc)
+            page = doc[job[0]]
+            pix = self.cache.render(page, matrix, clip=clip, fingerprint=self.fingerprint)
+            self.ready.put((job, pix, None))
+        except Exception as e:
+            # Nobody waits on the executor's futures, so errors go to the GUI too
+            with self.lock:
+                self.failed.add(job)
+            self.ready.put((job, None, str(e)))
+        finally:
+            with self.lock:
+                self.pending.discard(job)
+
+    def close(self):
+        """
+        Stop the background workers, dropping tiles not started yet, and
+        close their document handles once the tiles rendering are done
+        """
+        self.closed = True
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            for doc in self.thread_documents:
+                doc.close()
+            self.thread_documents = []
+
+
+def draw_tiles_tk(canvas, tiles, origin=(0, 0), photos=None):
+    """
+    Draw tiles on a Tk canvas
+
+    :param canvas: tkinter Canvas
+    :param tiles: Iterable of tuples ending in a fitz.Pixmap tile
+    :param origin: Canvas position of the zoomed page's top left corner
+    :param photos: Dict keeping the PhotoImages alive, keyed by tile position
+    :return: The photos dict
+    """
+    import tkinter as tk
+    from PIL import ImageTk
+
+    photos = {} if photos is None else photos
+    for tile in tiles:
+        pix = tile[-1]
+        photo = ImageTk.PhotoImage(pixmap_to_image(pix))
+        canvas.create_image(origin[0] + pix.x, origin[1] + pix.y, image=photo, anchor=tk.NW)
+        photos[(pix.x, pix.y)] = photo
+    return photos
+
+
+def draw_tiles_qt(painter, tiles, origin=(0, 0)):
+    """
+    Paint tiles with a QPainter, e.g. onto the QPixmap shown in a QLabel
+
+    :param painter: Active QPainter
+    :param tiles: Iterable of tuples ending in a fitz.Pixmap tile
+    :param origin: Position of the zoomed page's top left corner
+    """
+    for tile in tiles:
+        pix = tile[-1]
+        painter.drawImage(origin[0] + pix.x, origin[1] + pix.y, pixmap_to_qimage(pix))
@@ -0,0 +1,185 @@
+"""
+Per-stage timing for the pacing loops.
+
+Wrap each stage of a tick in a named span:
+
+    with tracing.span("rasterize"):
+        pix = page.get_pixmap()
+
+Tracing is off unless READER_TRACE is set (or enable() is called), and a
+disabled span is a shared no-op object, so the instrumentation can stay in
+the hot paths. When on, every stage keeps a rolling latency histogram, and
+if READER_TRACE names a .json file, the spans are written there on exit in
+Chrome trace format (open it in chrome://tracing or Perfetto).
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+HISTORY = 1000  # Durations kept per stage for the rolling histogram
+MAX_EVENTS = 200000  # Spans kept for the trace export
+
+
+class RollingHistogram:
+    """
+    Latencies of the most recent spans of one stage.
+    """
+
+    def __init__(self, size=HISTORY):
+        self.durations = deque(maxlen=size)  # Seconds
+
+    def add(self, duration):
+        self.durations.append(duration)
+
+    def percentiles(self):
+        """
+        Summarize the recent latencies
+
+        :return: Dict of count, p50, p90, p99 and max in milliseconds
+        """
+        ordered = sorted(self.durations)
+        if not ordered:
+            return {"count": 0}
+
+        def pick(fraction):
+            return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000
+
+        return {"count": len(ordered), "p50": pick(0.5), "p90": pick(0.9),
+                "p99": pick(0.99), "max": ordered[-1] * 1000}
+
+    def buckets(self):
+        """
+        Count the recent latencies in power-of-two microsecond buckets
+
+        :return: Dict of bucket upper bound in microseconds -> count
+        """
+        counts = {}
+        for duration in self.durations:
+            bound = 1 << max(int(duration * 1e6), 1).bit_length()
+            counts[bound] = counts.get(bound, 0) + 1
+        return dict(sorted(counts.items()))
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.start, time.perf_counter())
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_enabled = False
+_trace_path = None
+_histograms = {}
+_events = deque(maxlen=MAX_EVENTS)  # (name, start, end, thread id)
+_lock = threading.Lock()
+
+
+def _record(name, start, end):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(name, RollingHistogram())
+    histogram.add(end - start)
+    _events.append((name, start, end, threading.get_ident()))
+
+
+def span(name):
+    """
+    Time a stage
+
+    :param name: Stage name
+    :return: Context manager timing its block
+    """
+    if _enabled:
+        return _Span(name)
+    return _NULL_SPAN
+
+
+def enabled():
+    return _enabled
+
+
+def enable(trace_path=None):
+    """
+    Turn tracing on
+
+    :param trace_path: Optional JSON file to write the Chrome trace to on exit
+    """
+    global _enabled, _trace_path
+    _enabled = True
+    if trace_path and _trace_path is None:
+        atexit.register(lambda: export_chrome_trace(_trace_path))
+    _trace_path = trace_path or _trace_path
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def stage_stats():
+    """
+    Get the rolling latency summary of every stage
+
+    :return: Dict of stage name -> percentiles
+    """
+    return {name: histogram.percentiles() for name, histogram in sorted(_histograms.items())}
+
+
+def report():
+    """
+    Print the rolling latency summary of every stage
+    """
+    for name, stats in stage_stats().items():
+        if stats["count"]:
+            print(f"{name:24} n={stats['count']:<5} p50={stats['p50']:8.3f} ms "
+                  f"p90={stats['p90']:8.3f} ms p99={stats['p99']:8.3f} ms "
+                  f"max={stats['max']:8.3f} ms")
+
+
+def export_chrome_trace(path):
+    """
+    Write the recorded spans as a Chrome trace
+
+    :param path: Output JSON file
+    """
+    pid = os.getpid()
+    trace_events = [
+        {"name": name, "ph": "X", "ts": start * 1e6, "dur": (end - start) * 1e6,
+         "pid": pid, "tid": tid}
+        for name, start, end, tid in list(_events)
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+def _configure_from_environment():
+    setting = os.environ.get("READER_TRACE", "")
+    if setting and setting != "0":
+        enable(setting if setting.endswith(".json") else None)
+        atexit.register(report)
+
+
+_configure_from_environment()